@@ -1,115 +1,224 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
-import requests
-from bs4 import BeautifulSoup
 import re
-from typing import List, Dict, Any
+import hashlib
+import json
+from typing import List, Dict, Any, Callable, Optional
+import logging
 import math
+import bisect
+import batcher
+import cache
+import factors
+import fundamentals
+import metrics
+import provider
+import resilience
+import risk
+import sampling
+import total_return
+from downsample import downsample_rows
+from panel import PricePanel, align_frame, first_valid, last_valid, nan_corr, to_records
 
+log = logging.getLogger(__name__)
+
+@metrics.timed("clean_nans")
 def clean_nans(obj):
     """Recursively replace NaNs with None (which becomes null in JSON)."""
+    return _clean_nans(obj)
+
+def _clean_nans(obj):
     if isinstance(obj, float):
         return None if math.isnan(obj) else obj
     if isinstance(obj, dict):
-        return {k: clean_nans(v) for k, v in obj.items()}
+        return {k: _clean_nans(v) for k, v in obj.items()}
     if isinstance(obj, list):
-        return [clean_nans(v) for v in obj]
+        return [_clean_nans(v) for v in obj]
     return obj
 
-def fetch_data(tickers: List[str], start_date: str, end_date: str):
+def _date_key(d) -> Optional[str]:
+    """Normalizes a date-like value to 'YYYY-MM-DD' (None stays None)."""
+    if d is None:
+        return None
+    return pd.Timestamp(d).strftime("%Y-%m-%d")
+
+def _period_start(period: str) -> Optional[str]:
+    """Converts a yfinance period ('5y', '6mo', '5d', 'ytd', 'max') to a start date."""
+    today = pd.Timestamp.today().normalize()
+    if period == "max":
+        return None
+    if period == "ytd":
+        return _date_key(today.replace(month=1, day=1))
+    m = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not m:
+        raise ValueError(f"Unsupported period: {period}")
+    n, unit = int(m.group(1)), m.group(2)
+    offset = {"d": pd.DateOffset(days=n), "wk": pd.DateOffset(weeks=n),
+              "mo": pd.DateOffset(months=n), "y": pd.DateOffset(years=n)}[unit]
+    return _date_key(today - offset)
+
+def _slice_dates(df: pd.DataFrame, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
+    """Rows with start <= date < end (yfinance treats 'end' as exclusive)."""
+    mask = np.ones(len(df), dtype=bool)
+    for bound, is_start in ((start, True), (end, False)):
+        if bound is None:
+            continue
+        ts = pd.Timestamp(bound)
+        if df.index.tz is not None:
+            ts = ts.tz_localize(df.index.tz)
+        mask &= (df.index >= ts) if is_start else (df.index < ts)
+    return df if mask.all() else df[mask]
+
+def _covers(entry: Optional[dict], start: Optional[str], end: Optional[str]) -> bool:
+    """True if a cached price entry spans the requested [start, end) range."""
+    if entry is None:
+        return False
+    if entry["start"] is not None and (start is None or start < entry["start"]):
+        return False
+    if entry["end"] is not None and (end is None or end > entry["end"]):
+        return False
+    return True
+
+def store_price_frames(data: pd.DataFrame, tickers: List[str], start: Optional[str], end: Optional[str],
+                       ttl: Optional[float] = None) -> Dict[str, pd.DataFrame]:
+    """Splits a raw download (e.g. from the warm-up job) and stores each ticker's frame in the price cache."""
+    frames = {t: total_return.compact(f) for t, f in batcher.split_download(data, tickers).items()}
+    for t, frame in frames.items():
+        cache.prices.set(t, {"frame": frame, "start": start, "end": end, "version": _checksum(frame)}, ttl)
+    return frames
+
+def _download_prices(tickers: List[str], start: Optional[str], end: Optional[str]) -> Dict[str, pd.DataFrame]:
+    fetched, got_start, got_end = batcher.batcher.download(tickers, start, end)
+    fetched = {t: total_return.compact(f) for t, f in fetched.items()}
+    for t, frame in fetched.items():
+        cache.prices.set(t, {"frame": frame, "start": got_start, "end": got_end, "version": _checksum(frame)})
+    return fetched
+
+@metrics.timed("load_prices")
+def load_price_frames(tickers: List[str], start_date=None, end_date=None) -> Dict[str, pd.DataFrame]:
     """
-    Fetches both Adjusted Close (TR) and Close (PR).
-    Returns a dict with 'tr' and 'pr' DataFrames.
+    Returns {ticker: OHLCV frame} for [start_date, end_date), served from the price cache.
+    Only tickers that are missing (or cached over a narrower range) are downloaded; concurrent
+    requests are merged into one upstream call by the download batcher.
     """
-    # Standard download without grouping (Columns: Attribute -> Ticker)
-    data = yf.download(tickers, start=start_date, end=end_date, progress=False, auto_adjust=False)
-    
-    # Handle Single Ticker Case (Columns are flat: Open, High...)
-    if len(tickers) == 1:
-        # Check if 'Adj Close' exists (auto_adjust=False ensures it usually)
-        t = tickers[0]
-        # Some yfinance versions might return MultiIndex even for 1 ticker if forced? No.
-        # But let's check columns.
-        
-        adj_col = 'Adj Close' if 'Adj Close' in data.columns else 'Close'
-        
-        # If data is empty
-        if data.empty:
-            return pd.DataFrame(), pd.DataFrame()
-            
-        try:
-             df_tr = data[[adj_col]].rename(columns={adj_col: t})
-             df_pr = data[['Close']].rename(columns={'Close': t})
-             return df_tr.dropna(), df_pr.dropna()
-        except:
-             # Fallback if something weird with columns
-             return pd.DataFrame(), pd.DataFrame()
-
-    # Multi Ticker Case
-    # Columns are MultiIndex: ('Adj Close', 'SPY'), ('Close', 'SPY')...
-    # Or just ('Adj Close', 'SPY') ...
-    
-    try:
-        # Check available top-level columns
-        # yfinance 0.2+ returns (Price, Ticker) usually
-        
-        # Extract TR
-        if 'Adj Close' in data.columns:
-            df_tr = data['Adj Close']
-        elif 'Close' in data.columns:
-            # Fallback
-            df_tr = data['Close']
+    tickers = batcher.normalize_tickers(tickers)
+    start, end = _date_key(start_date), _date_key(end_date)
+    frames = {}
+    missing = []
+    for t in tickers:
+        entry = cache.prices.get(t)
+        if _covers(entry, start, end):
+            frames[t] = entry["frame"]
         else:
-            df_tr = pd.DataFrame()
-            
-        # Extract PR
-        if 'Close' in data.columns:
-            df_pr = data['Close']
+            missing.append(t)
+
+    if missing:
+        stale = {t: cache.prices.get_stale(t) for t in missing}
+        if all(s is not None and _covers(s[0], start, end) for s in stale.values()):
+            # Expired but usable: give the upstream STALE_TIMEOUT, else serve what we have
+            try:
+                frames.update(resilience.fetch_or_stale(("prices", tuple(missing), start, end),
+                                                        lambda: _download_prices(missing, start, end)))
+            except resilience.Stale:
+                for t, (entry, age) in stale.items():
+                    frames[t] = entry["frame"]
+                    resilience.note_stale(cache.prices.name, age)
         else:
-            df_pr = pd.DataFrame()
-            
-        # Filter for requested tickers (columns might be more or fewer if some failed)
-        # Also ensure we only keep columns that are in our requested list
-        valid_tickers = [t for t in tickers if t in df_tr.columns]
-        df_tr = df_tr[valid_tickers].dropna()
-        
-        valid_tickers_pr = [t for t in tickers if t in df_pr.columns]
-        df_pr = df_pr[valid_tickers_pr].dropna()
-        
-        print(f"[DEBUG] Fetch Data - TR Shape: {df_tr.shape}, PR Shape: {df_pr.shape}")
+            frames.update(_download_prices(missing, start, end))
+
+    return {t: _slice_dates(frames[t], start, end) for t in tickers if t in frames}
+
+
+def _checksum(data) -> str:
+    """Row count and a hash of every value and date of a frame or series; any revision changes it."""
+    digest = hashlib.blake2b(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes(), digest_size=8)
+    return f"{len(data)}:{digest.hexdigest()}"
+
+
+def data_versions(tickers: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Per-ticker marker of the cached data (checksums of the price frame, taken when it was
+    stored, and of the dividends); it changes whenever a refresh brought new or revised
+    prices or dividends. None for a ticker with nothing cached.
+    """
+    versions = {}
+    for t in batcher.normalize_tickers(tickers):
+        entry, divs = cache.prices.get(t), cache.dividends.get(t)
+        if entry is None or entry["frame"].empty:
+            versions[t] = None
+            continue
+        # Entries written before versions were stored (shared cache) are hashed here
+        prices = entry.get("version") or _checksum(entry["frame"])
+        versions[t] = f"{prices}:{_checksum(divs) if divs is not None and len(divs) else '-'}"
+    return versions
+
+
+def versions_key(tickers: List[str]) -> str:
+    """data_versions(tickers) as one short string, for the keys of caches derived from that data."""
+    versions = data_versions(tickers)
+    return hashlib.blake2b(json.dumps(versions, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def fetch_data(tickers: List[str], start_date: str, end_date: str, align: str = "inner"):
+    """
+    Fetches total return (TR, see total_return.from_frames) and Close (PR).
+    Returns (df_tr, df_pr) DataFrames with one column per ticker,
+    aligned on dates according to `align` (see panel.ALIGN_MODES).
+    """
+    try:
+        tickers = batcher.normalize_tickers(tickers)
+        frames = load_price_frames(tickers, start_date, end_date)
+        if not frames:
+            return pd.DataFrame(), pd.DataFrame()
+
+        df_tr = total_return.from_frames(frames)
+        df_pr = pd.DataFrame({t: f['Close'] for t, f in frames.items() if 'Close' in f.columns})
+        df_tr, df_pr = align_frame(df_tr, align), align_frame(df_pr, align)
+
+        log.debug("fetch_data: TR shape %s, PR shape %s", df_tr.shape, df_pr.shape)
         return df_tr, df_pr
-        
+
+    except resilience.UpstreamUnavailable:
+        raise
     except Exception as e:
-        print(f"[DEBUG] Fetch Data Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("fetch_data failed: %s", e)
         return pd.DataFrame(), pd.DataFrame()
 
+def get_ticker_info(ticker: str) -> dict:
+    """yfinance .info, cached."""
+    return resilience.load(cache.info, ticker, lambda: provider.get_provider().info(ticker))
+
+def get_dividends(ticker: str) -> pd.Series:
+    """yfinance .dividends, cached."""
+    return resilience.load(cache.dividends, ticker, lambda: provider.get_provider().dividends(ticker))
+
+@metrics.timed("etf_holdings")
 def get_etf_holdings(tickers: List[str]):
     holdings = {}
-    print(f"[DEBUG] Fetching holdings for: {tickers}")
+    log.debug("Fetching holdings for %s", tickers)
     for t in tickers:
         try:
-            ticker = yf.Ticker(t)
+            ticker = provider.yfinance().Ticker(t)
             # Try funds_data (newer yfinance)
             if hasattr(ticker, 'funds_data'):
-                fd = ticker.funds_data
+                with metrics.upstream("funds_data"):
+                    fd = ticker.funds_data
                 if fd and hasattr(fd, 'top_holdings'):
-                     h_df = fd.top_holdings
+                     with metrics.upstream("funds_data"):
+                         h_df = fd.top_holdings
                      if hasattr(h_df, 'index'):
                          holdings_list = h_df.index.tolist()
                          holdings[t] = holdings_list
-                         print(f"[DEBUG] {t} holdings found: {len(holdings_list)} (Top 5: {holdings_list[:5]})")
+                         log.debug("%s holdings found: %d (top 5: %s)", t, len(holdings_list), holdings_list[:5])
                 else:
-                    print(f"[DEBUG] {t} funds_data.top_holdings is None")
+                    log.debug("%s funds_data.top_holdings is None", t)
                     holdings[t] = []
             else:
-                 print(f"[DEBUG] {t} has no funds_data")
+                 log.debug("%s has no funds_data", t)
                  holdings[t] = []
                  
         except Exception as e:
-            print(f"[ERROR] Error fetching holdings for {t}: {e}")
+            log.error("Error fetching holdings for %s: %s", t, e)
             holdings[t] = []
             
     return holdings
@@ -144,17 +253,17 @@ def check_etfrc_overlap(t1, t2):
     """
     Scrapes etfrc.com for overlap summary.
     """
+    from bs4 import BeautifulSoup  # only needed here; kept out of startup
+
     url = "https://www.etfrc.com/funds/overlap.php"
     params = {"f1": t1, "f2": t2}
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    
-    print(f"[DEBUG] Scraping ETFRC for {t1} vs {t2}...")
+
+    log.debug("Scraping ETFRC for %s vs %s", t1, t2)
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        with metrics.upstream("etfrc"):
+            response = provider.http_session().get(url, params=params, timeout=10)
         if response.status_code != 200:
-            print(f"[DEBUG] ETFRC Scrape Failed: {response.status_code}")
+            log.warning("ETFRC scrape failed: HTTP %s", response.status_code)
             return None
             
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -169,7 +278,7 @@ def check_etfrc_overlap(t1, t2):
             result['overlap_pct'] = float(pct_text)
             result['common_count'] = int(count_text)
         else:
-            print("[DEBUG] ETFRC Scrape: Could not find feature-data")
+            log.debug("ETFRC scrape: could not find feature-data")
             return None
 
         # 2. Sector Drift (Parse from Script)
@@ -194,12 +303,12 @@ def check_etfrc_overlap(t1, t2):
                     sector_drift.append({"sector": l, "drift": v})
                 
                 result['sector_drift'] = sector_drift
-                print(f"[DEBUG] Scraped {len(sector_drift)} sectors")
+                log.debug("Scraped %d sectors", len(sector_drift))
             except Exception as e:
-                 print(f"[DEBUG] Error parsing sector script: {e}")
+                 log.debug("Error parsing sector script: %s", e)
                  result['sector_drift'] = []
         else:
-             print("[DEBUG] Could not find sector regex match")
+             log.debug("Could not find sector regex match")
              result['sector_drift'] = []
              
         # 3. Overlapping Holdings Table
@@ -225,14 +334,15 @@ def check_etfrc_overlap(t1, t2):
                     })
         
         result['etfrc_holdings'] = holdings_list
-        print(f"[DEBUG] Scraped {len(holdings_list)} detailed holdings")
+        log.debug("Scraped %d detailed holdings", len(holdings_list))
         
         return result
         
     except Exception as e:
-        print(f"[DEBUG] Error scraping etfrc: {e}")
+        log.warning("Error scraping etfrc: %s", e)
         return None
 
+@metrics.timed("overlap")
 def calculate_overlap_hybrid(holdings_data, tickers):
     # Base calculation using local data
     local_result = calculate_overlap(holdings_data)
@@ -259,93 +369,328 @@ def calculate_overlap_hybrid(holdings_data, tickers):
             
     return local_result
 
-def calculate_rolling_returns(df: pd.DataFrame, window: int = 252) -> List[Dict]:
+def _as_panel(data) -> PricePanel:
+    return data if isinstance(data, PricePanel) else PricePanel.from_frame(data)
+
+@metrics.timed("load_panels")
+def load_panels(tickers: List[str], start_date: str, end_date: str, align: str = "inner"):
+    """
+    (TR, PR) price panels for a request, cached so /api/analyze, /api/advanced and
+    /api/simulate on the same tickers, dates and alignment share one copy.
+    """
+    tickers = batcher.normalize_tickers(tickers)
+    key = (tuple(tickers), _date_key(start_date), _date_key(end_date), align)
+    # The data version is part of the key: a warm-up refresh makes older panels unreachable
+    panels = cache.panels.get(key + (versions_key(tickers),))
+    if panels is None:
+        df_tr, df_pr = fetch_data(tickers, start_date, end_date, align)
+        panels = (PricePanel.from_frame(df_tr), PricePanel.from_frame(df_pr))
+        # Panels built from stale prices are not kept past this request
+        if not panels[0].empty and not resilience.served_stale():
+            cache.panels.set(key + (versions_key(tickers),), panels)
+    return panels
+
+def _window_rows(labels: List[str], matrix: np.ndarray, start_date: Optional[str], max_points: Optional[int]):
+    """Drops rows before start_date, then downsamples to max_points (LTTB)."""
+    if start_date:
+        first = bisect.bisect_left(labels, _date_key(start_date))
+        labels, matrix = labels[first:], matrix[first:]
+    return downsample_rows(labels, matrix, max_points)
+
+@metrics.timed("rolling_returns")
+def calculate_rolling_returns(df, window: int = 252, start_date: Optional[str] = None,
+                              max_points: Optional[int] = None) -> List[Dict]:
     """
     Calculates Rolling 1-Year (252 days) Returns.
+    Accepts a DataFrame or a PricePanel. Rows before start_date are dropped
+    and the series is downsampled to max_points if given.
     """
-    # Percentage change over 'window' periods
-    # (Price_t / Price_{t-window}) - 1
-    rolling = df.pct_change(periods=window).dropna() * 100
-    return calculate_timeseries(rolling)
+    p = _as_panel(df)
+    if p.shape[0] <= window:
+        return []
+    # (Price_t / Price_{t-window}) - 1, against the last valid price if t-window is a gap
+    rolling = (p.values[window:] / p.filled[:-window] - 1) * 100
+    rows = ~np.isnan(rolling).all(axis=1)
+    labels = p.date_labels[window:]
+    if not rows.all():
+        rolling, labels = rolling[rows], [l for l, keep in zip(labels, rows) if keep]
+    labels, rolling = _window_rows(labels, rolling, start_date, max_points)
+    return to_records(labels, p.tickers, rolling)
 
-def calculate_drawdown_series(df: pd.DataFrame) -> List[Dict]:
+@metrics.timed("drawdowns")
+def calculate_drawdown_series(df, start_date: Optional[str] = None, max_points: Optional[int] = None) -> List[Dict]:
     """
     Calculates Drawdown % from peak for each day.
+    Accepts a DataFrame or a PricePanel. Peaks before start_date still count;
+    only the output is trimmed (and downsampled to max_points if given).
     """
-    roll_max = df.cummax()
-    drawdown = (df / roll_max - 1) * 100
-    return calculate_timeseries(drawdown)
+    p = _as_panel(df)
+    if p.empty:
+        return []
+    labels, drawdown = _window_rows(p.date_labels, p.drawdown * 100, start_date, max_points)
+    return to_records(labels, p.tickers, drawdown)
 
+@metrics.timed("timeseries")
 def calculate_timeseries(df: pd.DataFrame) -> List[Dict]:
     """Helper to normalize and format timeseries"""
     if df.empty:
-        print("[DEBUG] calculate_timeseries: DF is empty!")
+        log.debug("calculate_timeseries: empty frame")
         return []
-        
-    timeseries = []
-    for date, row in df.iterrows():
-        item = {"date": date.strftime("%Y-%m-%d")}
-        for ticker, val in row.items():
-            item[ticker] = round(val, 2)
-        timeseries.append(item)
-    return timeseries
+    return to_records(df.index.strftime("%Y-%m-%d").tolist(), df.columns, df.to_numpy())
 
-def calculate_metrics(df_tr: pd.DataFrame, df_pr: pd.DataFrame) -> Dict[str, Any]:
+@metrics.timed("calculate_metrics")
+def calculate_metrics(df_tr, df_pr, max_points: Optional[int] = None, with_timeseries: bool = True) -> Dict[str, Any]:
     """
-    Calculates CAGR, MDD, Volatility using TR data.
-    Returns timeseries for both TR and PR.
+    Calculates CAGR, MDD, Volatility and tail risk (VaR / CVaR, see risk.py) using TR data.
+    Returns timeseries for both TR and PR (downsampled to max_points if given),
+    unless with_timeseries is False (e.g. when the caller serializes the panels itself).
+    Accepts DataFrames or PricePanels; all math runs on the panel matrices.
+    With a non-inner alignment every statistic uses each ticker's (or pair's)
+    full valid history instead of the common overlap.
     """
+    tr, pr = _as_panel(df_tr), _as_panel(df_pr)
+
     # Financial metrics based on TR (Total Return)
-    daily_returns = df_tr.pct_change().dropna()
-    print(f"[DEBUG] Daily Returns Shape: {daily_returns.shape}")
+    daily_returns = tr.returns
+    log.debug("Daily returns shape %s", daily_returns.shape)
     
-    days = (df_tr.index[-1] - df_tr.index[0]).days
-    total_return = (df_tr.iloc[-1] / df_tr.iloc[0])
-    cagr = (total_return ** (365.25 / days)) - 1
+    cols = np.arange(tr.shape[1])
+    first, last = first_valid(tr.values), last_valid(tr.values)
+    days = (tr.days[last] - tr.days[first]).astype(np.float64)
+    total_return = tr.values[last, cols] / tr.values[first, cols]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = (total_return ** (365.25 / days)) - 1
     
-    roll_max = df_tr.cummax()
-    drawdown = (df_tr / roll_max) - 1.0
-    mdd = drawdown.min()
+    mdd = np.nanmin(tr.drawdown, axis=0)
     
-    volatility = daily_returns.std() * np.sqrt(252)
+    volatility = np.nanstd(daily_returns, axis=0, ddof=1) * np.sqrt(252)
     
-    correlation_matrix = daily_returns.corr()
+    if tr.has_gaps:
+        correlation_matrix = nan_corr(daily_returns)
+    else:
+        correlation_matrix = np.atleast_2d(np.corrcoef(daily_returns, rowvar=False))
     
     # Stats Dict
     stats = {}
-    for ticker in df_tr.columns:
+    for i, ticker in enumerate(tr.tickers):
         stats[ticker] = {
-            "cagr": round(cagr.get(ticker, 0), 4),
-            "mdd": round(mdd.get(ticker, 0), 4),
-            "volatility": round(volatility.get(ticker, 0), 4)
+            "cagr": round(float(cagr[i]), 4),
+            "mdd": round(float(mdd[i]), 4),
+            "volatility": round(float(volatility[i]), 4)
         }
         
     # Heatmap Data
+    corr_values = np.round(correlation_matrix, 3).tolist()
     corr_data = []
-    for x in correlation_matrix.columns:
-        for y in correlation_matrix.columns:
+    for i, x in enumerate(tr.tickers):
+        for j, y in enumerate(tr.tickers):
             corr_data.append({
                 "x": x,
                 "y": y,
-                "value": round(correlation_matrix.loc[x, y], 3)
+                "value": corr_values[i][j]
             })
 
     return {
         "stats": stats,
         "correlation": corr_data,
-        "timeseries_tr": calculate_timeseries((df_tr / df_tr.iloc[0] - 1) * 100),
-        "timeseries_pr": calculate_timeseries((df_pr / df_pr.iloc[0] - 1) * 100),
-        "daily_returns": daily_returns
+        "risk": dict(zip(tr.tickers, risk.report(risk.tail_risk(daily_returns)))),
+        "timeseries_tr": _normalized_records(tr, max_points) if with_timeseries else [],
+        "timeseries_pr": _normalized_records(pr, max_points) if with_timeseries else [],
+        "daily_returns": tr.returns_frame()
     }
 
+def _weight_matrix(tickers: List[str], portfolios: List[Dict[str, float]]) -> np.ndarray:
+    """K x N weights over the panel's tickers, each portfolio normalized to sum 1 (unknown tickers dropped)."""
+    index = {t: i for i, t in enumerate(tickers)}
+    weights = np.zeros((len(portfolios), len(tickers)))
+    for i, p in enumerate(portfolios):
+        for t, w in p.items():
+            t = t.strip().upper()
+            if t in index:
+                weights[i, index[t]] += w
+    total = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, total, out=np.zeros_like(weights), where=total != 0)
+
+def portfolio_panel(p: PricePanel, weights: np.ndarray, names: List[str], rebalance: str = "daily") -> PricePanel:
+    """
+    Equity curves (base 100) of K weighted portfolios as a K-column panel, over the dates
+    where every held asset has a price. All curves come from one (T x N) . (N x K) product:
+    of the asset returns when rebalanced daily to the target weights, of the normalized
+    prices for buy-and-hold (rebalance="none").
+    """
+    held = np.flatnonzero((weights != 0).any(axis=0))
+    prices = p.values[:, held]
+    rows = np.flatnonzero(~np.isnan(prices).any(axis=1))
+    if len(held) == 0 or len(rows) < 2:
+        return PricePanel(np.empty(0, dtype=np.int32), np.empty((0, len(names))), names)
+    prices = prices[rows]
+    w = weights[:, held].T
+    if rebalance == "daily":
+        growth = np.cumprod(1 + (prices[1:] / prices[:-1] - 1) @ w, axis=0)
+        curves = np.vstack([np.ones((1, len(names))), growth])
+    else:
+        curves = (prices / prices[0]) @ w
+    return PricePanel(p.days[rows], curves * 100, names)
+
+@metrics.timed("compare_portfolios")
+def compare_portfolios(df_tr, df_pr, portfolios: List[Dict[str, float]], names: List[str],
+                       rebalance: str = "daily", max_points: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Side-by-side comparison of weighted portfolios built from one panel of the union of
+    their tickers: calculate_metrics() stats, tail risk and correlation of the portfolio
+    equity curves, plus the curves and their drawdowns.
+    """
+    tr, pr = _as_panel(df_tr), _as_panel(df_pr)
+    weights = _weight_matrix(tr.tickers, portfolios)
+    tr_port = portfolio_panel(tr, weights, names, rebalance)
+    pr_port = portfolio_panel(pr, _weight_matrix(pr.tickers, portfolios), names, rebalance) if not pr.empty else pr
+    if tr_port.empty:
+        return {}
+    result = calculate_metrics(tr_port, pr_port, max_points=max_points)
+    del result["daily_returns"]
+    result["drawdowns"] = calculate_drawdown_series(tr_port, max_points=max_points)
+    result["weights"] = {n: {t: round(float(x), 4) for t, x in zip(tr.tickers, w) if x}
+                         for n, w in zip(names, weights)}
+    result["period"] = {"start": tr_port.date_labels[0], "end": tr_port.date_labels[-1]}
+    return result
+
+def calculate_risk(df_tr, portfolios: Optional[List[Dict[str, float]]] = None,
+                   cloud: Optional[Dict[str, Any]] = None, confidence=risk.CONFIDENCE,
+                   horizons=risk.HORIZONS, methods=risk.METHODS, n_paths: int = risk.N_PATHS) -> Dict[str, Any]:
+    """
+    VaR / CVaR per ticker, per weighted portfolio ({ticker: weight}, normalized to sum 1)
+    and, given a monte_carlo_portfolios() result, for every portfolio of that cloud in one batch.
+    """
+    tr = _as_panel(df_tr)
+    options = {"confidence": confidence, "horizons": horizons}
+    returns = tr.returns
+    index = {t: i for i, t in enumerate(tr.tickers)}
+    result = {"tickers": dict(zip(tr.tickers, risk.report(
+        risk.tail_risk(returns, methods=methods, n_paths=n_paths, **options), **options)))}
+
+    def evaluate(weights: np.ndarray) -> List[Dict]:
+        port = risk.portfolio_returns(returns, weights)
+        return risk.report(risk.tail_risk(port, methods=methods, n_paths=n_paths, **options), **options)
+
+    if portfolios:
+        weights = _weight_matrix(tr.tickers, portfolios)
+        result["portfolios"] = [
+            {"weights": dict(zip(tr.tickers, np.round(w, 4).tolist())), **rep}
+            for w, rep in zip(weights, evaluate(weights))
+        ]
+
+    if cloud is not None:
+        # The cloud's tickers are a subset of the panel's; its weight columns map onto them
+        weights = np.zeros((len(cloud["weights"]), len(tr.tickers)))
+        for i, t in enumerate(cloud["tickers"]):
+            if t in index:
+                weights[:, index[t]] = cloud["weights"][:, i]
+        result["cloud"] = [
+            {"return": round(float(r), 4), "risk": round(float(v), 4), "sharpe": round(float(sh), 4),
+             "weights": dict(zip(cloud["tickers"], np.round(w, 4).tolist())), **rep}
+            for r, v, sh, w, rep in zip(cloud["return"], cloud["risk"], cloud["sharpe"], cloud["weights"],
+                                        evaluate(weights))
+        ]
+    return result
+
+@metrics.timed("calculate_factors")
+def calculate_factors(tickers: List[str], start_date: str, end_date: str, align: str = "outer_ffill",
+                      names=factors.DEFAULT_FACTORS, window: int = factors.TRADING_DAYS, step: int = 21,
+                      period: str = "M") -> Dict[str, Any]:
+    """
+    Factor betas, annualized alpha and R^2 per ticker over the whole range, rolling
+    betas / alpha / R^2 as chart rows, and per-period return attribution.
+    The factor ETFs are loaded in the same panel as the tickers, so every regression
+    uses one aligned return matrix.
+    """
+    tickers = batcher.normalize_tickers(tickers)
+    names = list(names)
+    tr, _ = load_panels(tickers + [t for t in factors.factor_tickers(names) if t not in tickers],
+                        start_date, end_date, align)
+    if tr.empty:
+        return {}
+    returns = tr.returns
+    y = returns[:, [tr.tickers.index(t) for t in tickers if t in tr.tickers]]
+    tickers = [t for t in tickers if t in tr.tickers]
+    x = factors.factor_returns(returns, tr.tickers, names)
+    fit = factors.ols(y, x)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_stats = fit["coef"] / fit["se"]
+    t_stats[~np.isfinite(t_stats)] = np.nan
+
+    regression = {}
+    for i, t in enumerate(tickers):
+        coef = fit["coef"][i]
+        regression[t] = {
+            "alpha": round(float(coef[0]) * factors.TRADING_DAYS * 100, 4),  # % per year
+            "alpha_t": round(float(t_stats[i, 0]), 2),
+            "r2": round(float(fit["r2"][i]), 4),
+            "n": int(fit["n"][i]),
+            "betas": {name: round(float(b), 4) for name, b in zip(names, coef[1:])},
+            "t_stats": {name: round(float(s), 2) for name, s in zip(names, t_stats[i, 1:])},
+        }
+
+    labels = tr.date_labels[1:]
+    rolled = factors.rolling_ols(y, x, window, step)
+    dates = [labels[e] for e in rolled["ends"]]
+    rolling = {name: to_records(dates, tickers, rolled["coef"][:, :, k], 4) for k, name in enumerate(names, start=1)}
+    rolling["alpha"] = to_records(dates, tickers, rolled["coef"][:, :, 0] * factors.TRADING_DAYS * 100, 4)
+    rolling["r2"] = to_records(dates, tickers, rolled["r2"], 4)
+
+    periods, parts = factors.attribution(y, x, fit["coef"], factors.period_keys(tr.days[1:], period), names)
+    attribution = {
+        t: [{"period": p, **{part: round(float(values[j, i]) * 100, 4) for part, values in parts.items()}}
+            for j, p in enumerate(periods)]
+        for i, t in enumerate(tickers)
+    }
+    return {"factors": names, "regression": regression, "rolling": rolling, "attribution": attribution}
+
+@metrics.timed("compare_fundamentals")
+def compare_fundamentals(tickers: List[str], freq: str = "A") -> Dict[str, Any]:
+    """
+    Growth, margins and valuation ratios for many tickers from the fundamentals store
+    (see fundamentals.compare), plus the aligned history of growth and margins
+    (one row per fiscal period back from the latest, 0 = latest).
+    Market caps use the last close of one batched price download.
+    """
+    tickers = batcher.normalize_tickers(tickers)
+    frames = load_price_frames(tickers, _period_start("1mo"), None)
+    prices = {}
+    for t, frame in frames.items():
+        close = frame["Close"].dropna() if "Close" in frame.columns else pd.Series(dtype=float)
+        if not close.empty:
+            prices[t] = float(close.iloc[-1])
+    result = fundamentals.compare(fundamentals.get_store(), tickers, prices, freq)
+
+    metrics_by_ticker = {t: {"period_end": result["latest"][i], "price": prices.get(t)} for i, t in enumerate(tickers)}
+    for name, values in result["metrics"].items():
+        rounded = np.round(values, 0 if name == "market_cap" else 4).tolist()
+        for i, t in enumerate(tickers):
+            metrics_by_ticker[t][name] = rounded[i]
+    keys = ["period", *tickers]
+    history = {name: [dict(zip(keys, (k, *row))) for k, row in enumerate(np.round(values.T, 4).tolist())]
+               for name, values in result["history"].items()}
+    period_ends = {t: [e for e in result["ends"][i] if e is not None] for i, t in enumerate(tickers)}
+    return {"freq": freq, "tickers": tickers, "metrics": metrics_by_ticker, "history": history,
+            "period_ends": period_ends}
+
+@metrics.timed("timeseries")
+def _normalized_records(p: PricePanel, max_points: Optional[int] = None) -> List[Dict]:
+    """Cumulative % change from each ticker's first price, as chart rows."""
+    if p.empty:
+        return []
+    labels, matrix = downsample_rows(p.date_labels, (p.values / p.base - 1) * 100, max_points)
+    return to_records(labels, p.tickers, matrix)
+
+@metrics.timed("allocation_curve")
 def calculate_allocation_curve(daily_returns: pd.DataFrame) -> List[Dict]:
     """
     Calculates Risk/Return for 2 assets from 0:100 to 100:0 weights (10% steps).
     Uses the first 2 columns of the DataFrame.
     """
-    print(f"[DEBUG] Calculating Allocation Curve. Columns: {daily_returns.columns}, Shape: {daily_returns.shape}")
+    log.debug("Allocation curve: columns %s, shape %s", daily_returns.columns, daily_returns.shape)
     if daily_returns.shape[1] < 2:
-        print("[DEBUG] Not enough assets for allocation curve.")
+        log.debug("Not enough assets for allocation curve")
         return []
         
     t1, t2 = daily_returns.columns[:2]
@@ -388,93 +733,95 @@ def calculate_allocation_curve(daily_returns: pd.DataFrame) -> List[Dict]:
     return results
 
 def fetch_history_multiple(tickers: List[str], period="5y") -> pd.DataFrame:
-    """Fetches historical adjusted close prices for multiple tickers."""
+    """Fetches historical total-return prices for multiple tickers."""
     try:
-        data = yf.download(tickers, period=period, progress=False, group_by='ticker', auto_adjust=False)
-        
-        # yf.download structure varies by version and grouping.
-        # If group_by='ticker', columns are MultiIndex (Ticker, Attribute)
-        # We need to extract Adj Close or Close for each ticker.
-        
-        price_data = {}
-        for t in tickers:
-            try:
-                # Try to get data for this ticker
-                if len(tickers) == 1:
-                    # Flat structure if 1 ticker usually
-                    ticker_df = data
-                else:
-                    ticker_df = data[t]
-                    
-                if 'Adj Close' in ticker_df:
-                    price_data[t] = ticker_df['Adj Close']
-                elif 'Close' in ticker_df:
-                    price_data[t] = ticker_df['Close']
-            except KeyError:
-                continue
-                
-        df = pd.DataFrame(price_data)
+        frames = load_price_frames(tickers, _period_start(period), None)
+        df = total_return.from_frames(frames)
         # Drop columns with all NaNs
         df = df.dropna(axis=1, how='all')
         return df
     except Exception as e:
-        print(f"Error fetching history: {e}")
+        log.error("Error fetching history: %s", e)
         return pd.DataFrame()
 
-def simulate_multi_asset_monte_carlo(tickers: List[str], n_simulations=2000):
+@metrics.timed("monte_carlo")
+def monte_carlo_portfolios(tickers: List[str], n_simulations=2000,
+                           progress: Optional[Callable[[float], None]] = None,
+                           strategy: Optional[str] = None, seed: Optional[int] = None) -> Optional[Dict[str, Any]]:
     """
-    Runs a Monte Carlo simulation for a portfolio of tickers.
-    Returns a list of {return, risk, sharpe, weights} objects.
+    Random-weight portfolios for a set of tickers, as arrays:
+    {tickers, weights (n x N), return, risk, sharpe, sampling}. None if there is not enough data.
+    strategy picks how weights are drawn (see sampling.STRATEGIES, default sampling.DEFAULT).
+    progress (optional) is called with the completed fraction, e.g. by a background job.
     """
     if len(tickers) < 2:
-        return []
+        return None
 
     # 1. Fetch Data
     df = fetch_history_multiple(tickers)
     if df.empty or len(df.columns) < 2:
-        return []
+        return None
 
     # 2. Daily Returns & Covariance
     daily_returns = df.pct_change().dropna()
     if daily_returns.empty: 
-        return []
+        return None
         
-    mean_daily_returns = daily_returns.mean()
-    cov_matrix = daily_returns.cov()
+    mean_daily_returns = daily_returns.mean().to_numpy()
+    cov_matrix = daily_returns.cov().to_numpy()
 
-    # Annualize
-    # Expected Annual Return = Mean Daily * 252
-    # Expected Annual Risk = sqrt(Daily Var * 252)
-    
-    results = []
-    
-    num_assets = len(df.columns)
-    valid_tickers = df.columns.tolist()
+    # 3. Weights, then all portfolios at once (annualized: mean * 252, sqrt(var * 252))
+    strategy = strategy or sampling.DEFAULT
+    if progress:
+        progress(0.0)
+    weights_all = sampling.sample(strategy, n_simulations, len(df.columns), mean_daily_returns, cov_matrix, seed)
+    if progress:
+        progress(0.5)
+    returns, risks = sampling.risk_return(weights_all, mean_daily_returns, cov_matrix)
+    returns = returns * 252
+    risks = risks * np.sqrt(252)
 
-    for _ in range(n_simulations):
-        weights = np.random.random(num_assets)
-        weights /= np.sum(weights)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(risks > 0, returns / risks, 0.0)
 
-        # Portfolio Return
-        port_return = np.sum(weights * mean_daily_returns) * 252
+    return {
+        "tickers": df.columns.tolist(),
+        "weights": weights_all,
+        "return": returns,
+        "risk": risks,
+        "sharpe": sharpe,
+        "sampling": strategy,
+    }
 
-        # Portfolio Volatility
-        # var = w.T * Cov * w
-        port_variance = np.dot(weights.T, np.dot(cov_matrix, weights))
-        port_volatility = np.sqrt(port_variance) * np.sqrt(252)
+def simulate_multi_asset_monte_carlo(tickers: List[str], n_simulations=2000,
+                                     progress: Optional[Callable[[float], None]] = None,
+                                     strategy: Optional[str] = None):
+    """
+    Runs a Monte Carlo simulation for a portfolio of tickers.
+    Returns a list of {return, risk, sharpe, weights} objects.
+    progress (optional) is called with the completed fraction, e.g. by a background job.
+    """
+    sim = monte_carlo_portfolios(tickers, n_simulations, progress, strategy)
+    if sim is None:
+        return []
 
-        # Record
-        weight_dict = {ticker: round(weight, 4) for ticker, weight in zip(valid_tickers, weights)}
-        
-        results.append({
-            "return": round(port_return, 4),
-            "risk": round(port_volatility, 4),
-            "sharpe": round(port_return / port_volatility, 4) if port_volatility > 0 else 0,
-            "weights": weight_dict
-        })
+    valid_tickers = sim["tickers"]
+    weights = np.round(sim["weights"], 4).tolist()
+    returns = np.round(sim["return"], 4).tolist()
+    risks = np.round(sim["risk"], 4).tolist()
+    sharpe = np.round(sim["sharpe"], 4).tolist()
 
-    return results
+    return [
+        {
+            "return": r,
+            "risk": v,
+            "sharpe": sh,
+            "weights": dict(zip(valid_tickers, w))
+        }
+        for r, v, sh, w in zip(returns, risks, sharpe, weights)
+    ]
 
+@metrics.timed("dividend_stats")
 def get_dividend_stats(tickers: List[str]):
     """
     Fetches dividend statistics: Yield, 5Y CAGR, Paying Years.
@@ -483,13 +830,12 @@ def get_dividend_stats(tickers: List[str]):
     stats = {}
     for t in tickers:
         try:
-            ticker = yf.Ticker(t)
             # Fetch info
-            info = ticker.info
+            info = get_ticker_info(t)
             div_yield = info.get('dividendYield', 0)
             
             # Historical dividends
-            divs = ticker.dividends
+            divs = get_dividends(t)
             cagr_5y = 0
             paying_years = 0
             
@@ -528,9 +874,7 @@ def get_dividend_calendar(tickers: List[str]):
     
     for t in tickers:
         try:
-            ticker = yf.Ticker(t)
-            # Fetch 2 years to be safe
-            divs = ticker.dividends
+            divs = get_dividends(t)
             if divs.empty:
                 calendar[t] = {'months': [], 'avg_amount': 0}
                 continue
@@ -554,14 +898,15 @@ def get_dividend_calendar(tickers: List[str]):
                 'months': payout_months,
                 'avg_amount': avg_amount
             }
-            print(f"[DEBUG] {t} Dividends: Months {payout_months}, Avg {avg_amount:.4f}")
+            log.debug("%s dividends: months %s, avg %.4f", t, payout_months, avg_amount)
             
         except Exception as e:
-            print(f"Error fetching div calendar for {t}: {e}")
+            log.error("Error fetching div calendar for %s: %s", t, e)
             calendar[t] = {'months': [], 'avg_amount': 0}
             
     return calendar
 
+@metrics.timed("project_income")
 def project_income(portfolio: List[dict]):
     """
     Project future income based on portfolio.
@@ -683,13 +1028,13 @@ def calculate_growth_rate(series: pd.Series, years: int) -> float:
         # print(f"CAGR Calc Error: {e}")
         return 0
 
+@metrics.timed("stock_details")
 def get_stock_details(ticker: str):
     """
     Fetches detailed info for Dashboard.
     """
     try:
-        t = yf.Ticker(ticker)
-        info = t.info
+        info = get_ticker_info(ticker)
         
         # 1. Basic Info
         details = {
@@ -709,7 +1054,7 @@ def get_stock_details(ticker: str):
         }
         
         # 2. Dividend Growth
-        divs = t.dividends
+        divs = get_dividends(ticker)
         growth = {
             "cagr_3y": 0,
             "cagr_5y": 0,
@@ -741,26 +1086,20 @@ def get_stock_details(ticker: str):
         details["dividend_growth"] = growth
         details["dividend_history"] = [{"year": y, "amount": round(v, 4)} for y, v in divs.groupby(divs.index.year).sum().items()]
         
-        # 3. Financials (Stocks)
-        # Revenue/Net Income Trajectory
+        # 3. Financials (Stocks): revenue / net income trajectory from the fundamentals store
         financials_data = []
         try:
-            fin = t.financials
-            if not fin.empty:
-                 # Columns are dates.
-                 dates = fin.columns
-                 for d in dates:
-                     rev = fin.loc['Total Revenue'][d] if 'Total Revenue' in fin.index else 0
-                     income = fin.loc['Net Income'][d] if 'Net Income' in fin.index else 0
-                     financials_data.append({
-                         "date": d.strftime("%Y-%m-%d"),
-                         "revenue": rev,
-                         "net_income": income
-                     })
-                 # Sort charts
-                 financials_data.sort(key=lambda x: x['date'])
-        except:
-             pass
+            fin = fundamentals.get_store().statement(ticker, "A", ["Total Revenue", "Net Income"])
+            for d, row in fin.iterrows():
+                financials_data.append({
+                    "date": d,
+                    "revenue": row.get("Total Revenue", 0),
+                    "net_income": row.get("Net Income", 0),
+                })
+        except resilience.UpstreamUnavailable:
+            raise
+        except Exception as e:
+            log.warning("Financials unavailable for %s: %s", ticker, e)
         details["financials"] = financials_data
         
         # 4. Sector Weightings (ETF Proxy for Holdings)
@@ -769,8 +1108,10 @@ def get_stock_details(ticker: str):
         
         return clean_nans(details)
         
+    except resilience.UpstreamUnavailable:
+        raise
     except Exception as e:
-        print(f"Detail Fetch Error {ticker}: {e}")
+        log.error("Detail fetch error %s: %s", ticker, e)
         return None
 
 def calculate_rsi(series: pd.Series, period: int = 14) -> pd.Series:
@@ -810,26 +1151,24 @@ def calculate_bollinger_bands(series: pd.Series, period: int = 20, std_dev: int
     lower = middle - (std * std_dev)
     return middle, upper, lower
 
+@metrics.timed("technical_analysis")
 def get_technical_analysis(ticker: str, period="2y"):
     """
     Fetches history and calculates RSI, MFI, Bollinger Bands.
     Returns current signals and timeseries.
     period="2y" to ensure enough data for MAs/RSI.
+    Results are cached; the warm-up scheduler refreshes them for popular tickers.
     """
+    ticker = ticker.strip().upper()
+    cached = cache.technical.get((ticker, period))
+    if cached is not None:
+        return cached
+
     try:
-        # Need Open/High/Low/Close/Volume
-        df = yf.download(ticker, period=period, interval="1d", progress=False, auto_adjust=False)
-        
-        # Flatten columns if multi-index (common in newer yfinance)
-        if isinstance(df.columns, pd.MultiIndex):
-            # If specifically ticker level
-            try:
-                # Iterate columns to check if Ticker is level 0
-                if ticker in df.columns.levels[0]:
-                    df = df.xs(ticker, axis=1, level=0, drop_level=True)
-                # else: assume flat or just use what is there
-            except:
-                pass
+        # Need Open/High/Low/Close/Volume (flat columns from the price cache)
+        df = load_price_frames([ticker], _period_start(period), None).get(ticker)
+        if df is None:
+            return None
                 
         # Column Check (Case insensitive or adjusting)
         # yfinance columns: Open, High, Low, Close, Adj Close, Volume
@@ -897,11 +1236,16 @@ def get_technical_analysis(ticker: str, period="2y"):
                 "bb_mid": round(row['bb_mid'], 2)
             })
             
-        return {
+        result = {
             "summary": signals,
             "timeseries": timeseries
         }
+        if not resilience.served_stale():
+            cache.technical.set((ticker, period), result)
+        return result
 
+    except resilience.UpstreamUnavailable:
+        raise
     except Exception as e:
-        print(f"Technical Analysis Error {ticker}: {e}")
+        log.error("Technical analysis error %s: %s", ticker, e)
         return None
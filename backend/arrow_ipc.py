@@ -0,0 +1,68 @@
+"""
+Arrow IPC responses for the heavy analytic endpoints.
+
+Clients that send `Accept: application/vnd.apache.arrow.stream` get one Arrow
+record batch built straight from the panel / result arrays (no per-row dicts,
+no clean_nans walk). The date axis is the panel's int32 day numbers reused
+as Arrow date32. Small non-tabular parts of a response (summary stats,
+correlation...) travel as JSON in the schema metadata. JSON stays the default.
+
+pyarrow is imported lazily, so JSON-only deployments never load it.
+"""
+import json
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from fastapi import HTTPException, Request, Response
+
+import metrics
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+
+
+def wants_arrow(request: Optional[Request]) -> bool:
+    """True if the client asked for Arrow (request may be None for internal calls, e.g. jobs)."""
+    return request is not None and ARROW_MIME in request.headers.get("accept", "")
+
+
+def _pa():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise HTTPException(status_code=406, detail="Arrow responses need pyarrow installed on the server")
+
+
+def table(columns: Dict[str, np.ndarray], metadata: Optional[Dict[str, object]] = None, days: Optional[np.ndarray] = None):
+    """
+    Builds a pyarrow Table. `days` (int32 days since epoch) becomes a leading
+    date32 'date' column; float columns keep NaN as NaN.
+    """
+    pa = _pa()
+    arrays, names = [], []
+    if days is not None:
+        arrays.append(pa.Array.from_buffers(pa.date32(), len(days), [None, pa.py_buffer(np.ascontiguousarray(days, dtype=np.int32))]))
+        names.append("date")
+    for name, values in columns.items():
+        arrays.append(pa.array(values))
+        names.append(name)
+    meta = {k: json.dumps(v) for k, v in (metadata or {}).items()}
+    return pa.Table.from_arrays(arrays, names=names, metadata=meta)
+
+
+def matrix_columns(tickers: Sequence[str], matrix: np.ndarray, prefix: str = "") -> Dict[str, np.ndarray]:
+    """One column per ticker; slices of a Fortran-ordered matrix are contiguous (no copy)."""
+    return {f"{prefix}{t}": matrix[:, i] for i, t in enumerate(tickers)}
+
+
+@metrics.timed("arrow_encode")
+def to_bytes(tbl) -> bytes:
+    pa = _pa()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, tbl.schema) as writer:
+        writer.write_table(tbl)
+    return sink.getvalue().to_pybytes()
+
+
+def response(tbl) -> Response:
+    return Response(content=to_bytes(tbl), media_type=ARROW_MIME)
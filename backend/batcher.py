@@ -0,0 +1,139 @@
+"""
+Download batching for upstream price requests.
+
+Ticker lists are normalized (stripped, upper-cased, de-duplicated) and
+concurrent requests arriving within a short window are merged into a single
+multi-ticker download over the union of their date ranges. Each caller gets
+back only its own tickers.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+import provider
+import total_return
+
+
+def normalize_tickers(tickers: Iterable[str]) -> List[str]:
+    """'spy ', 'SPY', 'qqq' -> ['SPY', 'QQQ'] (order of first appearance kept)."""
+    seen = []
+    for t in tickers:
+        t = (t or "").strip().upper()
+        if t and t not in seen:
+            seen.append(t)
+    return seen
+
+
+def split_download(data: pd.DataFrame, tickers: List[str]) -> Dict[str, pd.DataFrame]:
+    """
+    Splits a yf.download result into one OHLCV frame per ticker.
+    Handles both MultiIndex layouts ((Ticker, Price) and (Price, Ticker)) and the flat single-ticker layout.
+    """
+    frames = {}
+    if data is None or data.empty:
+        return frames
+
+    if isinstance(data.columns, pd.MultiIndex):
+        level = 0 if any(t in data.columns.get_level_values(0) for t in tickers) else 1
+        available = set(data.columns.get_level_values(level))
+        for t in tickers:
+            if t in available:
+                frame = data.xs(t, axis=1, level=level).dropna(how="all")
+                if not frame.empty:
+                    frames[t] = frame
+    elif len(tickers) == 1:
+        frame = data.dropna(how="all")
+        if not frame.empty:
+            frames[tickers[0]] = frame
+    return frames
+
+
+def _union_start(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    # None means "max history" and wins
+    return None if a is None or b is None else min(a, b)
+
+
+def _union_end(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    # None means "up to today" and wins
+    return None if a is None or b is None else max(a, b)
+
+
+class _Batch:
+    def __init__(self, start: Optional[str], end: Optional[str]):
+        self.tickers: List[str] = []
+        self.start = start
+        self.end = end
+        self.done = threading.Event()
+        self.frames: Dict[str, pd.DataFrame] = {}
+        self.error: Optional[Exception] = None
+
+
+class DownloadBatcher:
+    """
+    The first caller of a window becomes the leader: it waits `window` seconds
+    for others to join, then performs one download for everybody.
+    """
+
+    def __init__(self, window: float = 0.05, max_tickers: int = 200):
+        self.window = window
+        self.max_tickers = max_tickers
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        self.downloads = 0
+        self.requests = 0
+
+    def download(self, tickers: List[str], start: Optional[str], end: Optional[str]
+                 ) -> Tuple[Dict[str, pd.DataFrame], Optional[str], Optional[str]]:
+        """
+        Returns ({ticker: frame}, start, end) where [start, end) is the range actually
+        downloaded - the union of all merged requests, so it may be wider than asked.
+        """
+        tickers = normalize_tickers(tickers)
+        with self._lock:
+            self.requests += 1
+            batch = self._open
+            leader = batch is None or len(batch.tickers) + len(tickers) > self.max_tickers
+            if leader:
+                batch = _Batch(start, end)
+                self._open = batch if self.window > 0 else None
+            else:
+                batch.start = _union_start(batch.start, start)
+                batch.end = _union_end(batch.end, end)
+            batch.tickers.extend(t for t in tickers if t not in batch.tickers)
+
+        if leader:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._run(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return {t: batch.frames[t] for t in tickers if t in batch.frames}, batch.start, batch.end
+
+    def _run(self, batch: _Batch):
+        try:
+            upstream = provider.get_provider()
+            # Dividends / splits come along when TR is built locally
+            actions = total_return.SOURCE == "local"
+            if batch.start is None:
+                data = upstream.download(batch.tickers, period="max", actions=actions)
+                batch.end = None
+            else:
+                data = upstream.download(batch.tickers, start=batch.start, end=batch.end, actions=actions)
+            self.downloads += 1
+            batch.frames = split_download(data, batch.tickers)
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+
+batcher = DownloadBatcher(window=float(os.getenv("DOWNLOAD_BATCH_WINDOW", "0.05")))
@@ -0,0 +1,69 @@
+"""
+Size / latency comparison of the JSON and Arrow IPC encodings of /api/analyze.
+
+Runs offline on synthetic prices:
+    cd backend && python benchmarks/arrow_vs_json.py
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import analysis  # noqa: E402
+import arrow_ipc  # noqa: E402
+import main  # noqa: E402
+from panel import PricePanel  # noqa: E402
+
+
+def synthetic_panel(n_tickers: int, years: int, seed: int = 0) -> PricePanel:
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end="2024-12-31", periods=252 * years)
+    prices = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, (len(index), n_tickers)), axis=0)
+    return PricePanel.from_frame(pd.DataFrame(prices, index=index, columns=[f"T{i:03d}" for i in range(n_tickers)]))
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def encode_json(tr, pr):
+    metrics = analysis.calculate_metrics(tr, pr)
+    del metrics["daily_returns"]
+    body = analysis.clean_nans({
+        "summary": metrics["stats"],
+        "charts": {"trend_tr": metrics["timeseries_tr"], "trend_pr": metrics["timeseries_pr"],
+                   "correlation": metrics["correlation"], "allocation_curve": []},
+    })
+    return json.dumps(body).encode()
+
+
+def encode_arrow(tr, pr):
+    metrics = analysis.calculate_metrics(tr, pr, with_timeseries=False)
+    return arrow_ipc.to_bytes(main._analyze_table(tr, pr, metrics, [], None))
+
+
+def main_():
+    print(f"{'tickers':>7} {'years':>5} | {'json KB':>9} {'json ms':>8} | {'arrow KB':>9} {'arrow ms':>8} | {'size x':>6} {'speed x':>7}")
+    for n_tickers, years in [(2, 5), (10, 10), (50, 20), (200, 30)]:
+        tr = synthetic_panel(n_tickers, years)
+        pr = synthetic_panel(n_tickers, years, seed=1)
+        json_size = len(encode_json(tr, pr))
+        arrow_size = len(encode_arrow(tr, pr))
+        json_t = best_of(lambda: encode_json(tr, pr))
+        arrow_t = best_of(lambda: encode_arrow(tr, pr))
+        print(f"{n_tickers:>7} {years:>5} | {json_size / 1024:>9.0f} {json_t * 1000:>8.1f} | "
+              f"{arrow_size / 1024:>9.0f} {arrow_t * 1000:>8.1f} | {json_size / arrow_size:>6.1f} {json_t / arrow_t:>7.1f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,39 @@
+"""Batched factor regressions (full range, rolling, attribution) across panel sizes."""
+import numpy as np
+import pytest
+
+import factors
+from conftest import TICKERS, YEARS, synthetic_prices
+from panel import PricePanel
+
+GRID = [(n, y) for n in TICKERS for y in YEARS]
+
+
+@pytest.fixture(params=GRID, ids=lambda case: f"{case[0]}t-{case[1]}y")
+def system(request):
+    n_tickers, years = request.param
+    panel = PricePanel.from_frame(synthetic_prices(n_tickers + 4, years, seed=0, listed_fraction=0.2))
+    returns = panel.returns
+    # The last four columns stand in for the factor returns
+    return returns[:, :n_tickers], np.nan_to_num(returns[:, n_tickers:]), panel.days[1:]
+
+
+@pytest.mark.benchmark(group="factor_ols")
+def bench_ols(benchmark, system):
+    y, x, _ = system
+    benchmark(factors.ols, y, x)
+
+
+@pytest.mark.benchmark(group="factor_rolling")
+@pytest.mark.parametrize("step", (21, 5))
+def bench_rolling_ols(benchmark, system, step):
+    y, x, _ = system
+    benchmark(factors.rolling_ols, y, x, factors.TRADING_DAYS, step)
+
+
+@pytest.mark.benchmark(group="factor_attribution")
+def bench_attribution(benchmark, system):
+    y, x, days = system
+    coef = factors.ols(y, x)["coef"]
+    keys = factors.period_keys(days, "M")
+    benchmark(factors.attribution, y, x, coef, keys, ["a", "b", "c", "d"])
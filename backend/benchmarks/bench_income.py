@@ -0,0 +1,17 @@
+"""Dividend income projection across portfolio sizes."""
+import pytest
+
+import analysis
+from conftest import TICKERS
+
+
+@pytest.mark.benchmark(group="project_income")
+@pytest.mark.parametrize("n_holdings", TICKERS, ids=lambda n: f"{n}t")
+def bench_project_income(benchmark, n_holdings):
+    portfolio = [
+        {"ticker": f"T{i:03d}", "shares": 10 + i, "monthly_buy": 50.0}
+        for i in range(n_holdings)
+    ]
+    # Warm the info / dividend caches; the projection itself is what is measured
+    analysis.project_income(portfolio)
+    benchmark(analysis.project_income, portfolio)
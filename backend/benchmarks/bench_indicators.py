@@ -0,0 +1,39 @@
+"""Technical indicators on a single price series across history lengths."""
+import pytest
+
+import analysis
+import cache
+from conftest import YEARS, ohlcv, synthetic_prices
+
+
+@pytest.fixture(params=YEARS, ids=lambda y: f"{y}y")
+def bars(request):
+    return ohlcv(synthetic_prices(1, request.param).iloc[:, 0])
+
+
+@pytest.mark.benchmark(group="calculate_rsi")
+def bench_calculate_rsi(benchmark, bars):
+    benchmark(analysis.calculate_rsi, bars["Close"])
+
+
+@pytest.mark.benchmark(group="calculate_mfi")
+def bench_calculate_mfi(benchmark, bars):
+    benchmark(analysis.calculate_mfi, bars["High"], bars["Low"], bars["Close"], bars["Volume"])
+
+
+@pytest.mark.benchmark(group="calculate_bollinger_bands")
+def bench_calculate_bollinger_bands(benchmark, bars):
+    benchmark(analysis.calculate_bollinger_bands, bars["Close"])
+
+
+@pytest.mark.benchmark(group="get_technical_analysis")
+@pytest.mark.parametrize("period", ["1y", "2y", "10y"])
+def bench_get_technical_analysis(benchmark, period):
+    analysis.load_price_frames(["SPY"], analysis._period_start(period), None)
+
+    def run():
+        # Indicators are cached per (ticker, period); measure the computation
+        cache.technical.clear()
+        return analysis.get_technical_analysis("SPY", period)
+
+    benchmark(run)
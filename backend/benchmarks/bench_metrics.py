@@ -0,0 +1,53 @@
+"""calculate_metrics / calculate_timeseries / clean_nans / calculate_allocation_curve across panel sizes."""
+import pytest
+
+import analysis
+from conftest import TICKERS, YEARS, synthetic_prices
+
+GRID = [(n, y) for n in TICKERS for y in YEARS]
+
+
+def grid_id(case):
+    return f"{case[0]}t-{case[1]}y"
+
+
+@pytest.fixture(params=GRID, ids=grid_id)
+def prices(request):
+    n_tickers, years = request.param
+    tr = synthetic_prices(n_tickers, years, seed=0, listed_fraction=0.2)
+    pr = synthetic_prices(n_tickers, years, seed=1, listed_fraction=0.2)
+    return tr, pr
+
+
+@pytest.mark.benchmark(group="calculate_metrics")
+def bench_calculate_metrics(benchmark, prices):
+    tr, pr = prices
+    # DataFrames in, so every round builds fresh panels (no lazily cached returns / drawdowns)
+    benchmark(analysis.calculate_metrics, tr, pr)
+
+
+@pytest.mark.benchmark(group="calculate_metrics_downsampled")
+def bench_calculate_metrics_max_points(benchmark, prices):
+    tr, pr = prices
+    benchmark(analysis.calculate_metrics, tr, pr, max_points=500)
+
+
+@pytest.mark.benchmark(group="calculate_timeseries")
+def bench_calculate_timeseries(benchmark, prices):
+    tr, _ = prices
+    benchmark(analysis.calculate_timeseries, tr)
+
+
+@pytest.mark.benchmark(group="clean_nans")
+def bench_clean_nans(benchmark, prices):
+    metrics = analysis.calculate_metrics(*prices)
+    del metrics["daily_returns"]
+    benchmark(analysis.clean_nans, metrics)
+
+
+@pytest.mark.benchmark(group="calculate_allocation_curve")
+@pytest.mark.parametrize("years", YEARS, ids=lambda y: f"{y}y")
+def bench_calculate_allocation_curve(benchmark, years):
+    # Only the first two assets are used, so this scales with history length only
+    daily_returns = synthetic_prices(2, years).pct_change().dropna()
+    benchmark(analysis.calculate_allocation_curve, daily_returns)
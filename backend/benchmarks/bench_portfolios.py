@@ -0,0 +1,27 @@
+"""Batch portfolio comparison: K equity curves from one (T x N) . (N x K) product, then their metrics."""
+import numpy as np
+import pytest
+
+import analysis
+from conftest import YEARS, synthetic_prices
+from panel import PricePanel
+
+
+@pytest.fixture(params=YEARS, ids=lambda y: f"200t-{y}y")
+def panel(request):
+    return PricePanel.from_frame(synthetic_prices(200, request.param, seed=0))
+
+
+@pytest.mark.benchmark(group="portfolio_panel")
+@pytest.mark.parametrize("k", (5, 100))
+@pytest.mark.parametrize("rebalance", ("daily", "none"))
+def bench_portfolio_panel(benchmark, panel, k, rebalance):
+    weights = np.random.default_rng(0).dirichlet(np.ones(panel.shape[1]), k)
+    benchmark(analysis.portfolio_panel, panel, weights, [f"P{i}" for i in range(k)], rebalance)
+
+
+@pytest.mark.benchmark(group="compare_portfolios")
+def bench_compare_portfolios(benchmark, panel):
+    rng = np.random.default_rng(0)
+    portfolios = [dict(zip(panel.tickers, rng.dirichlet(np.ones(panel.shape[1])))) for _ in range(5)]
+    benchmark(analysis.compare_portfolios, panel, panel, portfolios, [f"P{i}" for i in range(5)], max_points=500)
@@ -0,0 +1,29 @@
+"""VaR / CVaR estimators across panel sizes, and a Monte Carlo cloud evaluated in one batch."""
+import numpy as np
+import pytest
+
+import risk
+from conftest import TICKERS, YEARS, synthetic_prices
+from panel import PricePanel
+
+GRID = [(n, y) for n in TICKERS for y in YEARS]
+
+
+@pytest.fixture(params=GRID, ids=lambda case: f"{case[0]}t-{case[1]}y")
+def returns(request):
+    n_tickers, years = request.param
+    return PricePanel.from_frame(synthetic_prices(n_tickers, years, seed=0, listed_fraction=0.2)).returns
+
+
+@pytest.mark.benchmark(group="tail_risk")
+@pytest.mark.parametrize("method", risk.METHODS)
+def bench_tail_risk(benchmark, returns, method):
+    benchmark(risk.tail_risk, returns, methods=[method])
+
+
+@pytest.mark.benchmark(group="tail_risk_cloud")
+@pytest.mark.parametrize("n_portfolios", (500, 2000))
+def bench_tail_risk_cloud(benchmark, n_portfolios):
+    returns = PricePanel.from_frame(synthetic_prices(10, 5, seed=0)).returns
+    weights = np.random.default_rng(0).dirichlet(np.ones(10), n_portfolios)
+    benchmark(lambda: risk.tail_risk(risk.portfolio_returns(returns, weights)))
@@ -0,0 +1,70 @@
+"""
+Portfolio weight sampling: samples each strategy needs to reach a frontier-coverage error.
+
+For each strategy the sample count is doubled until sampling.frontier_error (mean relative
+risk gap to the exact long-only frontier) drops to TARGET_ERROR; that count and the error
+reached are stored in the benchmark's extra_info, and the timed round draws that many
+weights. `python bench_sampling.py` prints the convergence table instead.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import sampling  # noqa: E402
+
+ASSETS = (3, 5, 10, 20)
+TARGET_ERROR = 0.05
+COUNTS = [2 ** p for p in range(7, 17)]  # 128 .. 65536
+
+
+def market(k: int, seed: int = 0):
+    """Daily mean returns and covariance of k assets with one common factor and spread-out drifts / vols."""
+    rng = np.random.default_rng(seed)
+    beta = rng.uniform(0.3, 1.5, k)
+    vol = rng.uniform(0.005, 0.025, k)
+    cov = 0.01 ** 2 * np.outer(beta, beta) + np.diag(vol ** 2)
+    mean = rng.uniform(-0.0002, 0.0008, k)
+    return mean, cov
+
+
+def samples_needed(strategy: str, mean, cov, targets, risks, seed: int = 0):
+    """(sample count, error) of the first count in COUNTS reaching TARGET_ERROR, else (None, best error)."""
+    error = 1.0
+    for n in COUNTS:
+        weights = sampling.sample(strategy, n, len(mean), mean, cov, seed=seed)
+        error = sampling.frontier_error(weights, mean, cov, targets, risks)
+        if error <= TARGET_ERROR:
+            return n, error
+    return None, error
+
+
+@pytest.fixture(scope="module", params=ASSETS, ids=lambda k: f"{k}a")
+def problem(request):
+    mean, cov = market(request.param)
+    return mean, cov, *sampling.efficient_frontier(mean, cov)
+
+
+@pytest.mark.benchmark(group="sampling_convergence")
+@pytest.mark.parametrize("strategy", sampling.STRATEGIES)
+def bench_samples_to_target(benchmark, problem, strategy):
+    mean, cov, targets, risks = problem
+    n, error = samples_needed(strategy, mean, cov, targets, risks)
+    benchmark.extra_info.update({"samples": n, "error": round(error, 4), "target": TARGET_ERROR})
+    benchmark(sampling.sample, strategy, n or COUNTS[-1], len(mean), mean, cov)
+
+
+if __name__ == "__main__":
+    print(f"samples to reach a frontier error of {TARGET_ERROR:.0%} (- = not within {COUNTS[-1]})")
+    print("assets  " + "".join(f"{s:>12}" for s in sampling.STRATEGIES))
+    for k in ASSETS:
+        mean, cov = market(k)
+        targets, risks = sampling.efficient_frontier(mean, cov)
+        cells = []
+        for strategy in sampling.STRATEGIES:
+            n, error = samples_needed(strategy, mean, cov, targets, risks)
+            cells.append(f"{n if n else '-':>6} ({error:.2f})")
+        print(f"{k:>6}  " + "".join(f"{c:>12}" for c in cells))
@@ -0,0 +1,14 @@
+"""Monte Carlo portfolio simulation across ticker counts (5y of synthetic history)."""
+import pytest
+
+import analysis
+from conftest import TICKERS
+
+
+@pytest.mark.benchmark(group="simulate_multi_asset_monte_carlo")
+@pytest.mark.parametrize("n_tickers", TICKERS, ids=lambda n: f"{n}t")
+def bench_simulate_multi_asset_monte_carlo(benchmark, n_tickers):
+    tickers = [f"T{i:03d}" for i in range(n_tickers)]
+    # Prime the price cache so rounds measure the simulation, not the synthetic download
+    analysis.fetch_history_multiple(tickers)
+    benchmark(analysis.simulate_multi_asset_monte_carlo, tickers)
@@ -0,0 +1,33 @@
+"""Symbol search over a synthetic directory the size of the real one (~12k listings)."""
+import random
+import string
+
+import pytest
+
+import symbols
+
+WORDS = ["Global", "Capital", "Holdings", "Energy", "Therapeutics", "Bank", "Trust", "Fund", "Technologies",
+         "Systems", "Realty", "Income", "Growth", "Partners", "Pharmaceuticals", "Resources", "Group", "Apple"]
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    rng = random.Random(0)
+    rows = [("AAPL", "Apple Inc.", "NASDAQ", "Stock"), ("MSFT", "Microsoft Corporation", "NASDAQ", "Stock")]
+    for _ in range(12000):
+        symbol = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5)))
+        rows.append((symbol, " ".join(rng.sample(WORDS, 3)) + " Inc.", "NYSE", "Stock"))
+    directory = str(tmp_path_factory.mktemp("symbols"))
+    symbols.build(rows, directory)
+    return symbols.SymbolIndex.load(directory)
+
+
+@pytest.mark.benchmark(group="symbol_search")
+@pytest.mark.parametrize("query", ("AAPL", "A", "apple", "global cap", "microsft"))
+def bench_search(benchmark, index, query):
+    benchmark(index.search, query, 10)
+
+
+@pytest.mark.benchmark(group="symbol_validate")
+def bench_unknown(benchmark, index):
+    benchmark(index.unknown, ["AAPL", "MSFT", "APPL", "^GSPC", "BRK-B"] * 4)
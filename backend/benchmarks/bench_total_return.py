@@ -0,0 +1,30 @@
+"""Local total-return reconstruction: one cumulative product over the T x N close matrix."""
+import numpy as np
+import pytest
+
+import total_return
+from conftest import TICKERS, YEARS, synthetic_prices
+
+
+@pytest.fixture(params=[(n, y) for n in TICKERS for y in YEARS], ids=lambda p: f"{p[0]}t-{p[1]}y")
+def events(request):
+    n, years = request.param
+    close = synthetic_prices(n, years, seed=0, listed_fraction=0.2).to_numpy()
+    # Quarterly dividends around a 2% yield
+    dividends = np.zeros_like(close)
+    dividends[::63] = np.nan_to_num(close[::63]) * 0.005
+    return close, dividends
+
+
+@pytest.mark.benchmark(group="total_return")
+@pytest.mark.parametrize("convention", total_return.CONVENTIONS)
+def bench_build(benchmark, events, convention):
+    close, dividends = events
+    benchmark(total_return.build, close, dividends, convention=convention)
+
+
+@pytest.mark.benchmark(group="total_return_extend")
+def bench_extend_one_day(benchmark, events):
+    close, dividends = events
+    _, state = total_return.build(close[:-1], dividends[:-1])
+    benchmark(total_return.build, close[-1:], dividends[-1:], state=state)
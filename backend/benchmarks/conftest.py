@@ -0,0 +1,128 @@
+"""
+Offline benchmark suite for the analysis hot paths (pytest-benchmark).
+
+    cd backend/benchmarks
+    pytest                               # run, compare against the last saved baseline
+    pytest --benchmark-save=baseline     # store a new baseline in .benchmarks/
+    pytest -k "metrics and 500"          # a subset
+
+A run fails when a benchmark's best time is more than 25% slower than the
+baseline (see pytest.ini); until a baseline is saved, runs only report.
+Baselines are machine-specific and not committed.
+
+All data is synthetic: a SyntheticProvider replaces yfinance and outbound
+connections are refused, so nothing here touches the network.
+"""
+import glob
+import os
+import socket
+import sys
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cache  # noqa: E402
+import provider  # noqa: E402
+
+# Scaling grid: ticker counts x history lengths (years of trading days)
+TICKERS = (2, 10, 50, 200, 500)
+YEARS = (1, 5, 30)
+END = "2024-12-31"
+
+
+def synthetic_prices(n_tickers: int, years: int, seed: int = 0, listed_fraction: float = 0.0) -> pd.DataFrame:
+    """
+    Random-walk closes on business days, one column per ticker. With listed_fraction > 0
+    that share of tickers starts partway through the history (leading NaNs), as new
+    listings do.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=END, periods=252 * years)
+    prices = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, (len(index), n_tickers)), axis=0)
+    late = rng.random(n_tickers) < listed_fraction
+    for i in np.flatnonzero(late):
+        prices[: rng.integers(1, len(index) // 2), i] = np.nan
+    return pd.DataFrame(prices, index=index, columns=[f"T{i:03d}" for i in range(n_tickers)])
+
+
+def ohlcv(close: pd.Series, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    spread = np.abs(rng.normal(0, 0.005, len(close)))
+    return pd.DataFrame({
+        "Open": close.shift(1).fillna(close),
+        "High": close * (1 + spread),
+        "Low": close * (1 - spread),
+        "Close": close,
+        "Adj Close": close,
+        "Volume": rng.integers(1e5, 1e7, len(close)).astype(float),
+    })
+
+
+FIELDS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+
+
+class SyntheticProvider:
+    """Upstream stand-in with deterministic per-ticker data (same interface as provider.YFinanceProvider)."""
+
+    def __init__(self, years: int = 30):
+        self.index = pd.bdate_range(end=END, periods=252 * years)
+
+    def _bars(self, ticker: str) -> np.ndarray:
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        n = len(self.index)
+        close = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, n))
+        spread = np.abs(rng.normal(0, 0.005, n))
+        volume = rng.integers(1e5, 1e7, n).astype(float)
+        return np.column_stack([np.r_[close[0], close[:-1]], close * (1 + spread), close * (1 - spread), close, close, volume])
+
+    def download(self, tickers, start=None, end=None, period=None, **kwargs):
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        rows = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            rows &= self.index >= pd.Timestamp(start)
+        if end is not None:
+            rows &= self.index < pd.Timestamp(end)
+        # One (T, 6 * N) block in yfinance's group_by="ticker" layout
+        values = np.hstack([self._bars(t)[rows] for t in tickers])
+        columns = pd.MultiIndex.from_product([tickers, FIELDS], names=["Ticker", "Price"])
+        return pd.DataFrame(values, index=self.index[rows], columns=columns)
+
+    def info(self, ticker):
+        return {"shortName": ticker, "dividendYield": 0.02, "currentPrice": 100.0}
+
+    def dividends(self, ticker):
+        index = pd.date_range("2015-03-15", END, freq="QS-MAR") + pd.Timedelta(days=14)
+        return pd.Series(0.5, index=index)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # Nothing to compare against before the first --benchmark-save
+    storage = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+    if not glob.glob(os.path.join(storage, "*", "*.json")):
+        config.option.benchmark_compare_fail = None
+
+
+@pytest.fixture(scope="session", autouse=True)
+def offline():
+    """Synthetic upstream for the whole session; any outbound connection is an error."""
+    def refuse(self, address):
+        raise RuntimeError(f"benchmarks must run offline (tried to connect to {address})")
+
+    # Unguarded: the upstream rate limit would throttle the cold-cache rounds
+    previous = provider.set_provider(SyntheticProvider(), guarded=False)
+    connect, socket.socket.connect = socket.socket.connect, refuse
+    yield
+    socket.socket.connect = connect
+    provider.set_provider(previous)
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    """Each benchmark starts without cached prices / panels from the previous one."""
+    for c in cache.ALL_CACHES:
+        c.clear()
@@ -0,0 +1,80 @@
+"""
+Cold-start benchmark.
+
+    cd backend && python benchmarks/startup.py [runs]
+
+- import: fresh interpreter, `import main` (what every worker pays before it can
+  serve), next to the same import with yfinance / bs4 / requests loaded eagerly
+  as they were before they became lazy.
+- ready: `python serve.py` until /health answers, and until the background
+  preload has finished (/health -> preloaded: true).
+"""
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENV = {**os.environ, "WARMUP_ENABLED": "0", "LOG_LEVEL": "WARNING"}
+
+
+def import_time(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=ENV, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def health(port: int):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as r:
+            return json.load(r)
+    except OSError:
+        return None
+
+
+def ready_time(timeout: float = 60):
+    """(seconds until /health answers, seconds until preloaded) for one serve.py process."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "serve.py"], cwd=BACKEND, env={**ENV, "PORT": str(port)},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    serving = None
+    try:
+        while time.perf_counter() - start < timeout:
+            status = health(port)
+            if status is not None:
+                serving = serving or time.perf_counter() - start
+                if status.get("preloaded"):
+                    return serving, time.perf_counter() - start
+            time.sleep(0.01)
+        raise RuntimeError("server did not become ready")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(runs: int = 5):
+    lazy = [import_time("import main") for _ in range(runs)]
+    eager = [import_time("import yfinance, bs4, requests; import main") for _ in range(runs)]
+    ready = [ready_time() for _ in range(runs)]
+    print(f"{'':32} {'median':>8} {'min':>8}   ({runs} runs)")
+    for name, values in (("import main", lazy),
+                         ("import main (eager upstream)", eager),
+                         ("serve.py -> /health", [r[0] for r in ready]),
+                         ("serve.py -> preloaded", [r[1] for r in ready])):
+        print(f"{name:32} {statistics.median(values) * 1000:>6.0f}ms {min(values) * 1000:>6.0f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,172 @@
+"""
+In-process caches for upstream data (prices, ticker info, dividends, indicators).
+
+Caches created with shared=True are backed by shared_cache.store when it is
+enabled (several workers): an in-process miss falls through to the shared
+store, and writes go to both, so a worker reuses what another one fetched.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+import shared_cache
+
+_MISSING = object()
+
+
+class _Shared(NamedTuple):
+    """A value in the shared store, with the ttl it was set with (its age is derived from that)."""
+    value: Any
+    ttl: float
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+    A per-entry ttl can be passed to set(), e.g. to keep warmed data until the next refresh.
+    With a `shared` store, entries are also kept there under "<name>:<repr(key)>".
+    With stale_ttl > 0, expired entries are kept that much longer (here and in the
+    shared store) for get_stale(), served when the upstream is down (see resilience.py).
+    With maxbytes, the total sizeof() of the values is bounded too; a value larger than
+    that on its own is not kept.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 1024, timer: Callable[[], float] = time.monotonic,
+                 shared: Optional["shared_cache.SharedStore"] = None, stale_ttl: float = 0.0,
+                 maxbytes: Optional[int] = None, sizeof: Callable[[Any], int] = len):
+        self.name = name
+        self.shared = shared
+        self.stale_ttl = stale_ttl
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            now = self._timer()
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not _MISSING and entry[0] + self.stale_ttl <= now:
+                self._pop(key)
+        found = self._get_shared(key)
+        if found is not None and found[1] > 0:
+            value, ttl, _ = found
+            self._set_local(key, value, ttl)
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def get_stale(self, key: Hashable) -> Optional[tuple]:
+        """(value, age in seconds) of an entry, expired or not, within its stale_ttl; else None."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            now = self._timer()
+            if entry is not _MISSING and entry[0] + self.stale_ttl > now:
+                return entry[1], now - entry[2]
+        # Another worker may still have it (this one restarted, or never fetched it)
+        found = self._get_shared(key)
+        if found is None:
+            return None
+        value, _, age = found
+        return value, age
+
+    def _get_shared(self, key: Hashable) -> Optional[tuple]:
+        """(value, remaining ttl, age) of the shared entry, the ttl <= 0 once it is only stale; else None."""
+        if self.shared is None:
+            return None
+        found = self.shared.get(self._shared_key(key))
+        # Entries written in an older format are ignored
+        if found is None or not isinstance(found[0], _Shared):
+            return None
+        stored, remaining = found
+        return stored.value, remaining - self.stale_ttl, stored.ttl + self.stale_ttl - remaining
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.name}:{key!r}"
+
+    def _pop(self, key: Hashable):
+        """Removes an entry (lock held)."""
+        entry = self._data.pop(key, _MISSING)
+        if entry is not _MISSING:
+            self._bytes -= entry[3]
+
+    def _set_local(self, key: Hashable, value: Any, ttl: float):
+        size = self._sizeof(value) if self.maxbytes is not None else 0
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            now = self._timer()
+            self._data[key] = (now + ttl, value, now, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self._bytes > self.maxbytes):
+                self._pop(next(iter(self._data)))
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._set_local(key, value, ttl)
+        if self.shared is not None:
+            # Kept there stale_ttl longer too, for get_stale() in any worker
+            self.shared.set(self._shared_key(key), _Shared(value, ttl), ttl + self.stale_ttl)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Returns the cached value or calls loader() and caches its result (None is not cached)."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._pop(key)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+        if self.shared is not None:
+            self.shared.clear(f"{self.name}:")
+
+    def __len__(self):
+        return len(self._data)
+
+
+HOUR = 3600
+SHARED = shared_cache.store
+# How long expired upstream data may still be served while the upstream is down
+STALE = float(os.getenv("STALE_TTL", 7 * 24 * HOUR))
+
+prices = TTLCache("prices", ttl=float(os.getenv("PRICE_CACHE_TTL", 6 * HOUR)), maxsize=2000, shared=SHARED, stale_ttl=STALE)
+info = TTLCache("info", ttl=float(os.getenv("INFO_CACHE_TTL", 24 * HOUR)), maxsize=2000, shared=SHARED, stale_ttl=STALE)
+dividends = TTLCache("dividends", ttl=float(os.getenv("DIVIDEND_CACHE_TTL", 24 * HOUR)), maxsize=2000, shared=SHARED, stale_ttl=STALE)
+technical = TTLCache("technical", ttl=float(os.getenv("TECHNICAL_CACHE_TTL", 6 * HOUR)), maxsize=1000, shared=SHARED)
+# Aligned (TR, PR) price panels per (tickers, start, end), shared across endpoints
+panels = TTLCache("panels", ttl=float(os.getenv("PANEL_CACHE_TTL", 1 * HOUR)), maxsize=256, shared=SHARED)
+
+# Compressed response bodies per (encoding, level, body digest); see compression.py
+compressed = TTLCache("compressed", ttl=float(os.getenv("COMPRESSED_CACHE_TTL", 1 * HOUR)), maxsize=128,
+                      maxbytes=int(os.getenv("COMPRESSED_CACHE_BYTES", 32 * 1024 * 1024)))
+
+# Finished JSON responses of the deterministic POST endpoints per (path, request body)
+responses = TTLCache("responses", ttl=float(os.getenv("RESPONSE_CACHE_TTL", 1 * HOUR)), maxsize=256, shared=SHARED)
+
+ALL_CACHES = [prices, info, dividends, technical, panels, compressed, responses]
@@ -0,0 +1,170 @@
+"""
+Response compression middleware.
+
+Negotiates zstd / brotli / gzip from Accept-Encoding (brotli and zstd only if
+the optional `brotli` / `zstandard` packages are installed) and compresses
+bodies above COMPRESS_MIN_SIZE bytes. Levels depend on the payload type: our
+JSON is rounded numbers that shrink ~5x and is worth a mid level, while Arrow
+IPC is raw float64 that barely compresses (~7% with gzip), so it only gets a
+cheap zstd pass.
+
+Compressed bodies are cached by (encoding, level, body digest), so a repeat of
+a cached analysis response skips re-compression. Streaming responses (SSE) and
+responses that are already encoded pass through untouched.
+"""
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+import cache
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+# Level per payload type and encoding; None = don't compress this type with it
+LEVELS: Dict[str, Dict[str, Optional[int]]] = {
+    "application/json": {"zstd": 6, "br": 5, "gzip": 6},
+    "application/vnd.apache.arrow.stream": {"zstd": 1, "br": None, "gzip": None},
+    "text/event-stream": {"zstd": None, "br": None, "gzip": None},
+}
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 5}
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body: bytes, level: int) -> bytes:
+    return brotli.compress(body, quality=level)
+
+
+def _zstd(body: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# Server preference order (used to break ties between equal q-values)
+ENCODERS = {"zstd": _zstd, "br": _brotli, "gzip": _gzip}
+if zstandard is None:
+    del ENCODERS["zstd"]
+if brotli is None:
+    del ENCODERS["br"]
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """'gzip, br;q=0.8, *;q=0' -> {'gzip': 1.0, 'br': 0.8, '*': 0.0}"""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(header: str, content_type: str) -> Optional[str]:
+    """Best encoding the client accepts and this payload type is compressed with, or None."""
+    accepted = parse_accept_encoding(header)
+    levels = LEVELS.get(content_type.split(";")[0].strip().lower(), DEFAULT_LEVELS)
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q and levels.get(name) is not None:
+            best, best_q = name, q
+    return best
+
+
+def compress(body: bytes, encoding: str, content_type: str, cacheable: bool = True) -> bytes:
+    levels = LEVELS.get(content_type.split(";")[0].strip().lower(), DEFAULT_LEVELS)
+    level = levels[encoding]
+
+    def encode():
+        with metrics.span("compress"):
+            return ENCODERS[encoding](body, level)
+
+    if not cacheable:
+        return encode()
+    key = (encoding, level, hashlib.blake2b(body, digest_size=16).digest())
+    return cache.compressed.get_or_load(key, encode)
+
+
+class CompressionMiddleware:
+    """ASGI middleware; buffers single-message responses and compresses them if worthwhile."""
+
+    def __init__(self, app, min_size: int = MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        if not accept or not ENCODERS:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Hold the headers back until the body shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            pending, start = start, None
+            body = message.get("body", b"")
+            headers = [(k, v) for k, v in pending.get("headers", []) if k.lower() != b"content-length"]
+            names = {k.lower(): v for k, v in headers}
+            content_type = names.get(b"content-type", b"").decode("latin-1")
+            encoding = None
+            if (not message.get("more_body", False)
+                    and len(body) >= self.min_size
+                    and b"content-encoding" not in names):
+                encoding = choose_encoding(accept, content_type)
+
+            if encoding is None:
+                await send(pending)
+                await send(message)
+                return
+
+            cache_control = names.get(b"cache-control", b"").lower()
+            cacheable = pending.get("status", 200) == 200 and b"no-store" not in cache_control
+            body = compress(body, encoding, content_type, cacheable)
+            vary = names.get(b"vary")
+            headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send({**pending, "headers": headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_wrapper)
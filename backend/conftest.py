@@ -0,0 +1,64 @@
+"""
+Test setup: the fake upstream (fake_provider.py) instead of yfinance, no background
+threads, and throwaway data directories - set before any backend module is imported.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="backend-tests-")
+for name, value in {
+    "UPSTREAM": "fake",
+    "PRELOAD": "0",
+    "WARMUP_ENABLED": "0",
+    "LOG_LEVEL": "WARNING",
+    "SHARED_CACHE": "0",
+    "INTRADAY_DIR": os.path.join(_tmp, "intraday"),
+    "SYMBOLS_DIR": os.path.join(_tmp, "symbols"),
+    "PROFILE_DIR": os.path.join(_tmp, "profiles"),
+    "PORTFOLIOS_PATH": os.path.join(_tmp, "portfolios.sqlite"),
+    "FUNDAMENTALS_PATH": os.path.join(_tmp, "fundamentals.sqlite"),
+    "JOBS_PATH": os.path.join(_tmp, "jobs.sqlite"),
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest  # noqa: E402
+
+
+class Clock:
+    """Manual monotonic timer for breakers, buckets and caches."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def fake(monkeypatch, clock):
+    """A FakeProvider behind a fresh breaker (3 failures, 10s cooldown on `clock`) and bucket, with empty caches."""
+    import cache
+    import fake_provider
+    import provider
+    import resilience
+
+    for c in cache.ALL_CACHES:
+        c.clear()
+    breaker = resilience.CircuitBreaker(failures=3, cooldown=10.0, timer=clock)
+    breaker.on_close(resilience.revalidate_pending)
+    monkeypatch.setattr(provider, "breaker", breaker)
+    monkeypatch.setattr(provider, "bucket", resilience.TokenBucket(100, 100))
+    upstream = fake_provider.FakeProvider()
+    previous = provider.set_provider(upstream)
+    yield upstream
+    provider.set_provider(previous)
+    for c in cache.ALL_CACHES:
+        c.clear()
@@ -0,0 +1,118 @@
+"""
+Server-side downsampling of chart timeseries.
+
+- lttb_indices: Largest-Triangle-Three-Buckets for line series. Runs on all
+  columns of a T x N matrix at once and returns the union of the selected rows
+  (plus each column's max and min), so multi-ticker charts keep one shared date
+  axis and every peak / drawdown trough survives. The union is held to
+  max_points rows in total, not per series.
+- ohlc_buckets: equal-count bucketing of price bars (first open, max high,
+  min low, last close, summed volume).
+"""
+import warnings
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def lttb_indices(matrix: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Sorted row indices to keep, at most max_points of them. Each column gets ~max_points / N
+    points of its own, less its max and min; if the union still overshoots (many columns),
+    the first and last rows and the extremes are kept and the other picks are thinned evenly.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[:, None]
+    n_rows, n_cols = matrix.shape
+    if max_points is None or n_rows <= max_points or n_rows < 3:
+        return np.arange(n_rows)
+
+    threshold = max((max_points - 2 * n_cols) // max(n_cols, 1), 3)
+    x = np.arange(n_rows, dtype=np.float64)
+    cols = np.arange(n_cols)
+
+    # Bucket edges over rows 1 .. n_rows-2 (first and last row are always kept)
+    edges = np.linspace(1, n_rows - 1, threshold - 1).astype(np.int64)
+    selected = np.empty((threshold, n_cols), dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n_rows - 1
+
+    prev = np.zeros(n_cols, dtype=np.int64)
+    with warnings.catch_warnings():
+        # nanmean of an all-NaN bucket (ticker not listed yet) -> NaN, handled below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for b in range(threshold - 2):
+            lo, hi = edges[b], max(edges[b + 1], edges[b] + 1)
+            nxt_lo, nxt_hi = hi, (edges[b + 2] if b + 2 < len(edges) else n_rows)
+            nxt_hi = max(nxt_hi, nxt_lo + 1)
+
+            # Average point of the next bucket, per column
+            avg_y = np.nanmean(matrix[nxt_lo:nxt_hi], axis=0)
+            avg_x = x[nxt_lo:nxt_hi].mean()
+
+            # Triangle (previous pick, candidate, next average); keep the largest per column
+            ax = x[prev]
+            ay = matrix[prev, cols]
+            area = np.abs((ax - avg_x) * (matrix[lo:hi] - ay) - (ax - x[lo:hi, None]) * (avg_y - ay))
+            area = np.where(np.isnan(area), -np.inf, area)
+            prev = lo + np.argmax(area, axis=0)
+            selected[b + 1] = prev
+
+    must = [np.array([0, n_rows - 1])]
+    valid = ~np.isnan(matrix).all(axis=0)
+    if valid.any():
+        must.append(np.nanargmax(matrix[:, valid], axis=0))
+        must.append(np.nanargmin(matrix[:, valid], axis=0))
+    must = np.unique(np.concatenate(must))
+    rows = np.union1d(selected.ravel(), must)
+    if len(rows) <= max_points:
+        return rows
+    if len(must) >= max_points:
+        return must[_spread(len(must), max_points)]
+    rest = np.setdiff1d(rows, must)
+    return np.union1d(must, rest[_spread(len(rest), max_points - len(must))])
+
+
+def _spread(n: int, k: int) -> np.ndarray:
+    """k evenly spaced positions out of range(n), k <= n."""
+    return np.linspace(0, n - 1, k).round().astype(np.int64)
+
+
+def downsample_rows(labels: Sequence[str], matrix: np.ndarray, max_points: Optional[int]):
+    """(labels, matrix) reduced to the LTTB rows. No-op when max_points is None."""
+    if not max_points or len(labels) <= max_points:
+        return labels, matrix
+    idx = lttb_indices(matrix, max_points)
+    return [labels[i] for i in idx], matrix[idx]
+
+
+def ohlc_buckets(labels: Sequence[str], open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, volume: Optional[np.ndarray], max_points: Optional[int]) -> List[Dict]:
+    """
+    Aggregates price bars into at most max_points equal-count buckets.
+    Each bucket is labelled with its first date.
+    """
+    n = len(labels)
+    if not max_points or n <= max_points:
+        starts = np.arange(n)
+    else:
+        starts = np.unique(np.linspace(0, n, max_points, endpoint=False).astype(np.int64))
+    ends = np.append(starts[1:], n) - 1
+
+    o = open_[starts]
+    h = np.fmax.reduceat(high, starts)
+    l = np.fmin.reduceat(low, starts)
+    c = close[ends]
+    v = np.add.reduceat(np.nan_to_num(volume), starts) if volume is not None else None
+
+    cols = {
+        "open": np.round(o, 2).tolist(),
+        "high": np.round(h, 2).tolist(),
+        "low": np.round(l, 2).tolist(),
+        "close": np.round(c, 2).tolist(),
+    }
+    if v is not None:
+        cols["volume"] = v.astype(np.int64).tolist()
+    keys = ["date", *cols]
+    return [dict(zip(keys, row)) for row in zip((labels[i] for i in starts), *cols.values())]
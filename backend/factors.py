@@ -0,0 +1,220 @@
+"""
+Factor regressions and return attribution.
+
+Every ticker's daily returns are regressed on a factor matrix (market and
+long/short style spreads built from liquid ETFs, see FACTORS):
+
+    r_t = alpha + sum_k beta_k * f_k,t + e_t
+
+All tickers are solved together: the masked normal equations (X'MX, X'My)
+of every column are built with two matrix products and solved as one
+batched (N x K x K) system, so a ticker with a shorter history simply
+contributes fewer rows. Rolling regressions keep those sums and update them
+incrementally - rows entering the window are added, rows leaving it are
+subtracted - so each window costs O(step) instead of O(window).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+# name -> (long leg, short leg); the factor return is long - short (market: SPY alone)
+FACTORS: Dict[str, Tuple[str, Optional[str]]] = {
+    "market": ("SPY", None),
+    "size": ("IWM", "SPY"),         # small caps minus large caps
+    "value": ("IWD", "IWF"),        # Russell 1000 value minus growth
+    "momentum": ("MTUM", "SPY"),
+    "quality": ("QUAL", "SPY"),
+    "low_vol": ("USMV", "SPY"),
+}
+DEFAULT_FACTORS = ("market", "size", "value", "momentum")
+
+TRADING_DAYS = 252
+
+
+def factor_tickers(names: Sequence[str]) -> List[str]:
+    """ETF tickers needed to build the given factors."""
+    tickers = []
+    for name in names:
+        for t in FACTORS[name]:
+            if t and t not in tickers:
+                tickers.append(t)
+    return tickers
+
+
+def factor_returns(returns: np.ndarray, tickers: Sequence[str], names: Sequence[str]) -> np.ndarray:
+    """T x K factor returns from a return matrix whose columns include the factor ETFs (NaN if one is missing)."""
+    index = {t: i for i, t in enumerate(tickers)}
+    out = np.full((returns.shape[0], len(names)), np.nan)
+    for k, name in enumerate(names):
+        long, short = FACTORS[name]
+        if long in index and (short is None or short in index):
+            out[:, k] = returns[:, index[long]] - (returns[:, index[short]] if short else 0)
+    return out
+
+
+def _system(returns: np.ndarray, factors: np.ndarray):
+    """Design matrix with intercept (invalid rows zeroed), row mask per column and the per-row outer products."""
+    x = np.column_stack([np.ones(len(factors)), factors])
+    x_ok = ~np.isnan(x).any(axis=1)
+    mask = (~np.isnan(returns) & x_ok[:, None]).astype(float)
+    x = np.where(x_ok[:, None], x, 0.0)
+    y = np.where(mask > 0, returns, 0.0)
+    outer = (x[:, :, None] * x[:, None, :]).reshape(len(x), -1)
+    return x, y, mask, outer
+
+
+# SSR below this share of sum(y^2) is rounding noise: the fit is exact (e.g. SPY on the market factor)
+PERFECT_FIT = 1e-10
+
+
+def _solve(gram: np.ndarray, xty: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """
+    Batched normal equations (N x K+1 coefficients). Columns with too few rows get an
+    identity system (their results are discarded); collinear factors fall back to pinv.
+    """
+    k = gram.shape[1]
+    gram = np.where((n <= k)[:, None, None], np.eye(k), gram)
+    try:
+        return np.linalg.solve(gram, xty[:, :, None])[:, :, 0]
+    except np.linalg.LinAlgError:
+        return np.einsum("nij,nj->ni", np.linalg.pinv(gram), xty)
+
+
+def _inverse_diagonal(gram: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Diagonal of each (X'MX)^-1, for the coefficient standard errors."""
+    k = gram.shape[1]
+    gram = np.where((n <= k)[:, None, None], np.eye(k), gram)
+    try:
+        inverse = np.linalg.solve(gram, np.broadcast_to(np.eye(k), gram.shape))
+    except np.linalg.LinAlgError:
+        inverse = np.linalg.pinv(gram)
+    return np.diagonal(inverse, axis1=1, axis2=2)
+
+
+def _sum_ssr(coef, gram, xty, syy) -> np.ndarray:
+    """Residual sum of squares from the sums alone - the residuals are never formed."""
+    return syy - 2 * (coef * xty).sum(axis=1) + np.einsum("ni,nij,nj->n", coef, gram, coef)
+
+
+def _fit_stats(ssr, n, k, sy, syy) -> Tuple[np.ndarray, np.ndarray]:
+    """(R^2, residual variance); the variance is NaN for exact fits, so are their standard errors."""
+    perfect = ssr <= PERFECT_FIT * syy
+    ssr = np.where(perfect, 0.0, np.maximum(ssr, 0.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sst = syy - sy * sy / n
+        r2 = 1 - ssr / sst
+        sigma2 = ssr / (n - k)
+    sigma2[perfect] = np.nan
+    few = n <= k
+    r2[few] = np.nan
+    sigma2[few] = np.nan
+    return r2, sigma2
+
+
+@metrics.timed("factor_ols")
+def ols(returns: np.ndarray, factors: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    OLS of every column of `returns` (T x N) on `factors` (T x K), using each column's valid rows.
+    Returns coef (N x K+1, intercept first), se, r2 and n (observations per column).
+    """
+    x, y, mask, outer = _system(returns, factors)
+    k = x.shape[1]
+    gram = (mask.T @ outer).reshape(-1, k, k)
+    xty = y.T @ x
+    n = mask.sum(axis=0)
+    coef = _solve(gram, xty, n)
+    # Full sample: SSR from the residuals themselves (the sum form cancels badly for good fits)
+    ssr = (mask * (y - x @ coef.T) ** 2).sum(axis=0)
+    r2, sigma2 = _fit_stats(ssr, n, k, y.sum(axis=0), (y * y).sum(axis=0))
+    with np.errstate(invalid="ignore"):
+        se = np.sqrt(sigma2[:, None] * _inverse_diagonal(gram, n))
+    coef[n <= k] = np.nan
+    return {"coef": coef, "se": se, "r2": r2, "n": n}
+
+
+@metrics.timed("factor_rolling")
+def rolling_ols(returns: np.ndarray, factors: np.ndarray, window: int = TRADING_DAYS,
+                step: int = 21) -> Dict[str, np.ndarray]:
+    """
+    OLS over trailing `window` rows, evaluated every `step` rows (ends at row window-1, then
+    every step). The window sums are updated incrementally between evaluations.
+    Returns ends (row index of each window's last row), coef (S x N x K+1) and r2 (S x N).
+    """
+    x, y, mask, outer = _system(returns, factors)
+    t, k = x.shape
+    n_cols = y.shape[1]
+    ends = np.arange(window - 1, t, step)
+    coef = np.full((len(ends), n_cols, k), np.nan)
+    r2 = np.full((len(ends), n_cols), np.nan)
+
+    gram = np.zeros((n_cols, k * k))
+    xty = np.zeros((n_cols, k))
+    n = np.zeros(n_cols)
+    sy = np.zeros(n_cols)
+    syy = np.zeros(n_cols)
+
+    def add(rows: slice, sign: float):
+        m, yy = mask[rows], y[rows]
+        gram[:] += sign * (m.T @ outer[rows])
+        xty[:] += sign * (yy.T @ x[rows])
+        n[:] += sign * m.sum(axis=0)
+        sy[:] += sign * yy.sum(axis=0)
+        syy[:] += sign * (yy * yy).sum(axis=0)
+
+    covered = 0  # rows [covered - window, covered) are in the sums
+    for s, end in enumerate(ends):
+        stop = end + 1
+        add(slice(covered, stop), 1.0)
+        old_start, new_start = max(covered - window, 0), max(stop - window, 0)
+        if new_start > old_start:
+            add(slice(old_start, new_start), -1.0)
+        covered = stop
+        g = gram.reshape(-1, k, k)
+        c = _solve(g, xty, n)
+        fit_r2, _ = _fit_stats(_sum_ssr(c, g, xty, syy), n, k, sy, syy)
+        # Require most of the window to be valid for a column
+        ok = n >= 0.8 * window
+        coef[s, ok] = c[ok]
+        r2[s, ok] = fit_r2[ok]
+    return {"ends": ends, "coef": coef, "r2": r2}
+
+
+def period_keys(days: np.ndarray, period: str = "M") -> List[str]:
+    """Period label per day number: 'M' -> '2024-03', 'Q' -> '2024Q1', 'Y' -> '2024'."""
+    dates = days.astype("datetime64[D]")
+    if period == "Y":
+        return dates.astype("datetime64[Y]").astype(str).tolist()
+    months = dates.astype("datetime64[M]").astype(str).tolist()
+    if period == "M":
+        return months
+    return [f"{m[:4]}Q{(int(m[5:7]) - 1) // 3 + 1}" for m in months]
+
+
+@metrics.timed("factor_attribution")
+def attribution(returns: np.ndarray, factors: np.ndarray, coef: np.ndarray, keys: Sequence[str],
+                names: Sequence[str]) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """
+    Splits each column's summed daily returns per period into alpha, one part per factor
+    (beta_k * f_k,t) and the residual; the parts add up to the total.
+    keys: period label per row (rows sorted by date); names: the factor names.
+    Returns (periods, {part: P x N}) with parts total, alpha, <factor>..., residual.
+    """
+    x, y, mask, _ = _system(returns, factors)
+    labels = list(keys)
+    starts = [0] + [i for i in range(1, len(labels)) if labels[i] != labels[i - 1]]
+    periods = [labels[i] for i in starts]
+
+    def per_period(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, starts, axis=0) if len(values) else np.zeros((0, values.shape[1]))
+
+    coef = np.nan_to_num(coef)
+    parts = {"total": per_period(y), "alpha": per_period(mask * coef[:, 0])}
+    explained = parts["alpha"].copy()
+    for k, name in enumerate(names, start=1):
+        contribution = per_period(mask * x[:, k:k + 1] * coef[:, k])
+        parts[name] = contribution
+        explained += contribution
+    parts["residual"] = parts["total"] - explained
+    return periods, parts
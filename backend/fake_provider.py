@@ -0,0 +1,140 @@
+"""
+Local stand-in for yfinance with failure injection.
+
+Serves deterministic random-walk prices, info and dividends without network
+access, and can be told to fail: a share of calls raising errors, added
+latency, or answering with rate-limit errors. Run the API against it with
+
+    UPSTREAM=fake FAKE_FAIL_RATE=0.5 FAKE_LATENCY=0.2 python serve.py
+
+or run this file to watch the circuit breaker open, stale data being served
+and the background revalidation once the fake recovers.
+"""
+import os
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import resilience
+
+
+class UpstreamError(Exception):
+    """An injected upstream failure."""
+
+
+class FakeProvider:
+    def __init__(self, fail_rate: float = 0.0, latency: float = 0.0, rate_limited: bool = False, seed: int = 0):
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeProvider":
+        return cls(fail_rate=float(os.getenv("FAKE_FAIL_RATE", "0")),
+                   latency=float(os.getenv("FAKE_LATENCY", "0")),
+                   rate_limited=os.getenv("FAKE_RATE_LIMITED", "0") == "1")
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.fail_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limited:
+            raise resilience.RateLimited("Too Many Requests. Rate limited. Try after a while.")
+        if fail:
+            raise UpstreamError("injected upstream failure")
+
+    def download(self, tickers, start=None, end=None, period=None, interval="1d", actions=False,
+                 **kwargs) -> pd.DataFrame:
+        """
+        Business-day OHLCV per ticker, (Ticker, Price) columns like yf.download(group_by='ticker');
+        actions=True adds Dividends (the quarterly 0.5 of .dividends) and Stock Splits.
+        """
+        self._maybe_fail()
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        index = pd.bdate_range(start or "2000-01-03", pd.Timestamp(end) - pd.Timedelta(days=1) if end else pd.Timestamp.today().normalize())
+        parts = {}
+        for t in tickers:
+            rng = np.random.default_rng(zlib.crc32(t.encode()))
+            close = 100 * np.cumprod(1 + rng.normal(0.0003, 0.01, len(index)))
+            parts[t] = pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99, "Close": close,
+                                     "Adj Close": close, "Volume": 1e6}, index=index)
+            if actions:
+                # Ex-dates of .dividends rolled forward to the next business day
+                ex_dates = self.dividend_dates() + pd.offsets.BDay(0)
+                parts[t]["Dividends"] = np.where(index.isin(ex_dates), 0.5, 0.0)
+                parts[t]["Stock Splits"] = 0.0
+        data = pd.concat(parts, axis=1)
+        data.columns.names = ["Ticker", "Price"]
+        return data
+
+    def info(self, ticker: str) -> dict:
+        self._maybe_fail()
+        return {"shortName": ticker, "longName": f"{ticker} (fake)", "dividendYield": 0.02}
+
+    @staticmethod
+    def dividend_dates() -> pd.DatetimeIndex:
+        return pd.date_range("2010-03-01", pd.Timestamp.today(), freq="QS")
+
+    def dividends(self, ticker: str) -> pd.Series:
+        self._maybe_fail()
+        return pd.Series(0.5, index=self.dividend_dates(), name="Dividends")
+
+    def statements(self, ticker: str, freq: str = "yearly") -> pd.DataFrame:
+        """A few statement line items (line items x period ends, newest first) like yfinance's pretty statements."""
+        self._maybe_fail()
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        periods = 4 if freq == "yearly" else 5
+        step = pd.DateOffset(years=1) if freq == "yearly" else pd.DateOffset(months=3)
+        last = pd.Timestamp.today().normalize() - pd.offsets.QuarterEnd(1)
+        dates = [last - step * i for i in range(periods)]
+        revenue = rng.uniform(1e9, 1e11) * (1 + rng.normal(0.08, 0.1, periods)).cumprod()[::-1]
+        revenue /= 1 if freq == "yearly" else 4
+        margin = rng.uniform(0.05, 0.3)
+        items = {
+            "Total Revenue": revenue,
+            "Gross Profit": revenue * (margin + 0.3),
+            "Operating Income": revenue * (margin + 0.05),
+            "Net Income": revenue * margin,
+            "EBITDA": revenue * (margin + 0.1),
+            "Stockholders Equity": revenue * rng.uniform(0.5, 2),
+            "Total Debt": revenue * rng.uniform(0, 1),
+            "Cash And Cash Equivalents": revenue * rng.uniform(0.05, 0.3),
+            "Ordinary Shares Number": np.full(periods, rng.uniform(1e8, 1e10)),
+            "Free Cash Flow": revenue * margin * 0.9,
+        }
+        return pd.DataFrame(items, index=dates).T
+
+
+if __name__ == "__main__":
+    import cache
+    import provider
+    from analysis import get_ticker_info
+
+    fake = FakeProvider()
+    provider.set_provider(fake)
+    provider.breaker.cooldown = 1.0
+    get_ticker_info("SPY")
+    # Expire the entry (it stays available as stale data), then take the upstream down
+    cache.info.set("SPY", cache.info.get("SPY"), ttl=0)
+    fake.fail_rate = 1.0
+    for i in range(provider.breaker.failures + 1):
+        get_ticker_info("SPY")
+        print(f"call {i}: breaker {provider.breaker.state}, upstream calls {fake.calls}")
+    try:
+        get_ticker_info("QQQ")
+    except resilience.UpstreamUnavailable as e:
+        print(f"no stale data for QQQ: {e} (retry after {e.retry_after:.1f}s)")
+    fake.fail_rate = 0.0
+    time.sleep(1.1)
+    get_ticker_info("SPY")  # the half-open probe succeeds, the breaker closes
+    time.sleep(0.2)
+    print(f"recovered: breaker {provider.breaker.state}, SPY fresh again: {cache.info.get('SPY') is not None}")
@@ -0,0 +1,287 @@
+"""
+Local fundamentals store.
+
+Financial statements (income statement, balance sheet, cash flow; yearly and
+quarterly) are normalized into one long SQLite table with a row per
+(ticker, freq, line item, period end), next to the other local data stores:
+
+- a ticker's statements are only re-fetched once FUNDAMENTALS_TTL has passed
+  since its last refresh (tracked in the store, so all workers and restarts
+  share it), and a refresh only writes the values that are new or changed;
+- periods the upstream no longer reports are kept, so history grows beyond
+  the last four years / five quarters the upstream returns.
+
+compare() reads every requested ticker with one query, pivots the rows into a
+ticker x period x item array and computes growth, margins and valuation
+ratios column-wise for all tickers at once.
+"""
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import provider
+import resilience
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fundamentals.sqlite")
+TTL = float(os.getenv("FUNDAMENTALS_TTL", str(24 * 3600)))
+
+FREQS = {"A": "yearly", "Q": "quarterly"}
+
+# Line items used by compare() (yfinance 'pretty' names)
+ITEMS = {
+    "revenue": "Total Revenue",
+    "gross_profit": "Gross Profit",
+    "operating_income": "Operating Income",
+    "net_income": "Net Income",
+    "ebitda": "EBITDA",
+    "free_cash_flow": "Free Cash Flow",
+    "equity": "Stockholders Equity",
+    "debt": "Total Debt",
+    "cash": "Cash And Cash Equivalents",
+    "shares": "Ordinary Shares Number",
+}
+# Flows are summed over four quarters (TTM) in quarterly mode; the rest are point-in-time balances
+FLOWS = ("revenue", "gross_profit", "operating_income", "net_income", "ebitda", "free_cash_flow")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    ticker     TEXT NOT NULL,
+    freq       TEXT NOT NULL,
+    item       TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    value      REAL NOT NULL,
+    PRIMARY KEY (ticker, freq, item, period_end)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS refreshed (
+    ticker  TEXT NOT NULL,
+    freq    TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (ticker, freq)
+) WITHOUT ROWID;
+"""
+
+
+def normalize(frame: pd.DataFrame) -> List[tuple]:
+    """Statement frame (line items x period ends) -> [(item, 'YYYY-MM-DD', value), ...] without empty cells."""
+    if frame is None or frame.empty:
+        return []
+    long = frame.apply(pd.to_numeric, errors="coerce").stack()
+    long = long[np.isfinite(long.to_numpy(dtype=float))]
+    items = long.index.get_level_values(0).astype(str)
+    dates = pd.DatetimeIndex(long.index.get_level_values(1)).strftime("%Y-%m-%d")
+    return list(zip(items, dates, long.to_numpy(dtype=float).tolist()))
+
+
+class FundamentalsStore:
+    def __init__(self, path: str = DEFAULT_PATH, ttl: float = TTL, workers: int = 4, timer=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._timer = timer
+        self._local = threading.local()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fundamentals")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread and process; the file and schema are created on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def write(self, ticker: str, freq: str, rows: Sequence[tuple]) -> int:
+        """Upserts (item, period_end, value) rows; returns how many were new or changed."""
+        conn = self._conn()
+        before = conn.total_changes
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT INTO facts (ticker, freq, item, period_end, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (ticker, freq, item, period_end) DO UPDATE SET value = excluded.value "
+                "WHERE value != excluded.value",
+                [(ticker, freq, item, period, value) for item, period, value in rows])
+            conn.execute("INSERT OR REPLACE INTO refreshed (ticker, freq, fetched) VALUES (?, ?, ?)",
+                         (ticker, freq, self._timer()))
+        return conn.total_changes - before - 1
+
+    def stale(self, tickers: Sequence[str], freq: str) -> List[str]:
+        """Tickers never fetched, or last fetched more than ttl ago."""
+        marks = ",".join("?" * len(tickers))
+        fetched = dict(self._conn().execute(
+            f"SELECT ticker, fetched FROM refreshed WHERE freq = ? AND ticker IN ({marks})", (freq, *tickers)))
+        now = self._timer()
+        return [t for t in tickers if now - fetched.get(t, -np.inf) > self.ttl]
+
+    def _fetch(self, ticker: str, freq: str) -> int:
+        frame = provider.get_provider().statements(ticker, FREQS[freq])
+        return self.write(ticker, freq, normalize(frame))
+
+    @metrics.timed("fundamentals_refresh")
+    def refresh(self, tickers: Sequence[str], freq: str = "A", force: bool = False) -> Dict[str, int]:
+        """
+        Re-fetches the statements of stale tickers (all of them with force) in parallel;
+        returns {ticker: rows written}. A ticker that fails keeps its stored data; if the
+        upstream is unavailable and a ticker has nothing stored, UpstreamUnavailable is raised.
+        """
+        todo = list(tickers) if force else self.stale(tickers, freq)
+        written: Dict[str, int] = {}
+        unavailable: Optional[resilience.UpstreamUnavailable] = None
+        futures = {t: self._executor.submit(self._fetch, t, freq) for t in todo}
+        for t, future in futures.items():
+            try:
+                written[t] = future.result()
+            except resilience.UpstreamUnavailable as e:
+                unavailable = e
+            except Exception as e:
+                log.warning("Fundamentals refresh failed for %s: %s", t, e)
+        if unavailable is not None:
+            missing = set(todo) - set(written)
+            known = {row[0] for row in self._conn().execute(
+                f"SELECT ticker FROM refreshed WHERE freq = ? AND ticker IN ({','.join('?' * len(missing))})",
+                (freq, *missing))}
+            if missing - known:
+                raise unavailable
+        if written:
+            log.info("Fundamentals refreshed for %d tickers (%d rows written)", len(written), sum(written.values()))
+        return written
+
+    def read(self, tickers: Sequence[str], freq: str = "A", items: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Long rows (ticker, item, period_end, value) for the tickers, in one query."""
+        sql = f"SELECT ticker, item, period_end, value FROM facts WHERE freq = ? AND ticker IN ({','.join('?' * len(tickers))})"
+        params = [freq, *tickers]
+        if items:
+            sql += f" AND item IN ({','.join('?' * len(items))})"
+            params += list(items)
+        rows = self._conn().execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=["ticker", "item", "period_end", "value"])
+
+    def statement(self, ticker: str, freq: str = "A", items: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """A ticker's stored statement as a wide frame (period ends ascending x line items)."""
+        self.refresh([ticker], freq)
+        rows = self.read([ticker], freq, items)
+        return rows.pivot(index="period_end", columns="item", values="value").sort_index()
+
+
+def _stack(rows: pd.DataFrame, tickers: List[str], periods: int, months: int = 12):
+    """
+    Long rows -> (N x P x I values, N x P period ends) with period 0 the latest of each
+    ticker, so tickers with different fiscal year ends line up by fiscal period. A period's
+    slot is its distance in `months` from the ticker's latest one, so a period missing
+    upstream stays an empty (NaN) slot instead of shifting the older ones.
+    """
+    values = np.full((len(tickers), periods, len(ITEMS)), np.nan)
+    ends = np.full((len(tickers), periods), None, dtype=object)
+    if rows.empty:
+        return values, ends
+    item_index = {name: i for i, name in enumerate(ITEMS.values())}
+    ticker_index = {t: i for i, t in enumerate(tickers)}
+    period_end = pd.to_datetime(rows["period_end"])
+    age = (period_end.groupby(rows["ticker"]).transform("max") - period_end).dt.days.to_numpy()
+    # Rounded, as 52/53-week fiscal periods end a few days apart from year to year
+    slot = np.rint(age / (365.25 * months / 12)).astype(int)
+    keep = slot < periods
+    t = rows["ticker"].map(ticker_index).to_numpy()[keep]
+    p = slot[keep]
+    values[t, p, rows["item"].map(item_index).to_numpy()[keep]] = rows["value"].to_numpy()[keep]
+    ends[t, p] = rows["period_end"].to_numpy()[keep]
+    return values, ends
+
+
+def _ratio(a: np.ndarray, b: np.ndarray, positive: bool = False) -> np.ndarray:
+    """a / b, NaN where b is 0 (or, with positive, not > 0)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = a / b
+    out[(b <= 0) if positive else (b == 0)] = np.nan
+    return out
+
+
+@metrics.timed("fundamentals_compare")
+def compare(store: "FundamentalsStore", tickers: Sequence[str], prices: Dict[str, float],
+            freq: str = "A") -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Growth, margins and valuation ratios for all tickers at once, aligned by fiscal period.
+    Yearly: the latest fiscal year vs the one before (and a 3-year revenue CAGR).
+    Quarterly: margins and valuation on trailing twelve months, growth of the latest
+    quarter against the same quarter a year earlier.
+    prices: last price per ticker, used with the share count for market cap.
+    Returns {"latest": ..., "metrics": {name: N array}, "history": {name: N x H array}}.
+    """
+    tickers = list(tickers)
+    store.refresh(tickers, freq)
+    periods = 5 if freq == "A" else 8
+    values, ends = _stack(store.read(tickers, freq, list(ITEMS.values())), tickers, periods,
+                          12 if freq == "A" else 3)
+    item = {name: values[:, :, i] for i, name in enumerate(ITEMS)}
+
+    lag = 1 if freq == "A" else 4
+    if freq == "A":
+        flows = {name: item[name] for name in FLOWS}
+    else:
+        # Trailing twelve months at every quarter that has the three before it
+        flows = {name: np.lib.stride_tricks.sliding_window_view(item[name], 4, axis=1).sum(axis=2) for name in FLOWS}
+
+    def growth(series: np.ndarray) -> np.ndarray:
+        """Period-over-period (lagged) growth, N x (P - lag); against a negative base it is not meaningful."""
+        return _ratio(series[:, :-lag], series[:, lag:], positive=True) - 1
+
+    revenue, net_income = flows["revenue"][:, 0], flows["net_income"][:, 0]
+    equity, shares = item["equity"][:, 0], item["shares"][:, 0]
+    price = np.array([prices.get(t, np.nan) for t in tickers], dtype=float)
+    market_cap = price * shares
+    enterprise_value = market_cap + np.nan_to_num(item["debt"][:, 0]) - np.nan_to_num(item["cash"][:, 0])
+
+    revenue_growth = growth(item["revenue"])
+    earnings_growth = growth(item["net_income"])
+    result = {
+        "revenue_growth": revenue_growth[:, 0],
+        "earnings_growth": earnings_growth[:, 0],
+        "gross_margin": _ratio(flows["gross_profit"][:, 0], revenue),
+        "operating_margin": _ratio(flows["operating_income"][:, 0], revenue),
+        "net_margin": _ratio(net_income, revenue),
+        "fcf_margin": _ratio(flows["free_cash_flow"][:, 0], revenue),
+        "roe": _ratio(net_income, equity, positive=True),
+        "debt_to_equity": _ratio(item["debt"][:, 0], equity, positive=True),
+        "market_cap": market_cap,
+        "pe": _ratio(market_cap, net_income, positive=True),
+        "ps": _ratio(market_cap, revenue, positive=True),
+        "pb": _ratio(market_cap, equity, positive=True),
+        "ev_ebitda": _ratio(enterprise_value, flows["ebitda"][:, 0], positive=True),
+        "fcf_yield": _ratio(flows["free_cash_flow"][:, 0], market_cap, positive=True),
+    }
+    if freq == "A":
+        with np.errstate(invalid="ignore"):
+            result["revenue_cagr_3y"] = _ratio(item["revenue"][:, 0], item["revenue"][:, 3], positive=True) ** (1 / 3) - 1
+    history = {
+        "revenue_growth": revenue_growth,
+        "earnings_growth": earnings_growth,
+        "operating_margin": _ratio(flows["operating_income"], flows["revenue"]),
+        "net_margin": _ratio(flows["net_income"], flows["revenue"]),
+    }
+    return {"latest": ends[:, 0], "ends": ends, "metrics": result, "history": history}
+
+
+_store: Optional[FundamentalsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> FundamentalsStore:
+    """The process-wide store (FUNDAMENTALS_PATH), created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FundamentalsStore(os.getenv("FUNDAMENTALS_PATH", DEFAULT_PATH))
+    return _store
@@ -0,0 +1,249 @@
+"""
+Intraday bar store.
+
+1-minute bars are kept per ticker in day partitions on disk:
+    <INTRADAY_DIR>/<TICKER>/<YYYY-MM-DD>.npy   (UTC day, structured array sorted by ts)
+Partitions are opened memory-mapped, so serving a [start, end) slice only
+touches the pages it needs. Coarser intervals (5m, 15m, 1h, 1d, ...) are
+built on the fly with vectorized bucket aggregation. Sub-day buckets are
+anchored at the 09:30 session open in MARKET_TZ (so 1h bars are 09:30-10:30,
+not 09:00-10:00 as epoch-aligned buckets would be), daily ones at local midnight.
+
+Refreshing only asks the upstream for bars newer than the last stored one,
+and clients polling with `since` only receive new (or still-forming) bars.
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import batcher
+import metrics
+import provider
+import symbols
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),       # bar open time, epoch seconds (UTC)
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+DAY = 86400
+MARKET_TZ = "America/New_York"
+SESSION_OPEN = 9 * 3600 + 30 * 60  # 09:30 in MARKET_TZ, seconds after local midnight
+
+DATA_DIR = os.getenv("INTRADAY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intraday"))
+
+
+def interval_seconds(interval: str) -> int:
+    """'1m' -> 60, '15m' -> 900, '1h' -> 3600, '1d' -> 86400."""
+    m = re.fullmatch(r"(\d+)(m|h|d)", interval)
+    if not m:
+        raise ValueError(f"Unsupported interval: {interval}")
+    return int(m.group(1)) * {"m": 60, "h": 3600, "d": DAY}[m.group(2)]
+
+
+def to_epoch(value) -> int:
+    """Date / datetime string or Timestamp -> epoch seconds (naive values are UTC)."""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return int(ts.timestamp())
+
+
+def frame_to_bars(frame: pd.DataFrame) -> np.ndarray:
+    """yfinance OHLCV frame -> structured bar array (rows without a close are dropped)."""
+    frame = frame.dropna(subset=["Close"])
+    bars = np.empty(len(frame), dtype=BAR_DTYPE)
+    index = frame.index if frame.index.tz is not None else frame.index.tz_localize("UTC")
+    bars["ts"] = (index - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    for name, col in (("open", "Open"), ("high", "High"), ("low", "Low"), ("close", "Close"), ("volume", "Volume")):
+        bars[name] = frame[col].to_numpy(dtype=float) if col in frame.columns else np.nan
+    bars.sort(order="ts")
+    return bars
+
+
+def bucket_starts(ts: np.ndarray, seconds: int) -> np.ndarray:
+    """
+    Start (epoch seconds) of the `seconds`-wide bucket of each timestamp: buckets step from
+    the session open of the timestamp's market-time day (from local midnight for >= 1 day).
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    index = pd.to_datetime(ts, unit="s", utc=True).tz_convert(MARKET_TZ).tz_localize(None)
+    local = (index - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    local = np.asarray(local, dtype=np.int64)
+    if seconds >= DAY:
+        anchor = 0
+    else:
+        anchor = local // DAY * DAY + SESSION_OPEN
+    # Back to UTC with each timestamp's own offset (DST changes happen outside trading hours)
+    return anchor + (local - anchor) // seconds * seconds - (local - ts)
+
+
+def resample(bars: np.ndarray, seconds: int) -> np.ndarray:
+    """Aggregates bars into `seconds`-wide buckets (first open, max high, min low, last close, summed volume)."""
+    if len(bars) == 0 or seconds <= 60:
+        return bars
+    bucket = bucket_starts(bars["ts"], seconds)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bars)] - 1
+    out = np.empty(len(starts), dtype=BAR_DTYPE)
+    out["ts"] = bucket[starts]
+    out["open"] = bars["open"][starts]
+    out["high"] = np.fmax.reduceat(bars["high"], starts)
+    out["low"] = np.fmin.reduceat(bars["low"], starts)
+    out["close"] = bars["close"][ends]
+    out["volume"] = np.add.reduceat(np.nan_to_num(bars["volume"]), starts)
+    return out
+
+
+class IntradayStore:
+    def __init__(self, root: str = DATA_DIR, min_refresh_interval: float = 60):
+        self.root = root
+        self.min_refresh_interval = min_refresh_interval
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._last_refresh: Dict[str, float] = {}
+
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    def _dir(self, ticker: str) -> str:
+        ticker = ticker.upper()
+        # The ticker is a path component: nothing but plain symbol characters (no '/', no '..')
+        if not symbols.is_symbol(ticker):
+            raise ValueError(f"Invalid symbol: {ticker!r}")
+        return os.path.join(self.root, ticker)
+
+    def _path(self, ticker: str, day: int) -> str:
+        name = np.datetime64(day, "D").astype(str)
+        return os.path.join(self._dir(ticker), f"{name}.npy")
+
+    def days(self, ticker: str) -> List[int]:
+        """Stored partitions as day numbers (days since epoch), ascending."""
+        d = self._dir(ticker)
+        if not os.path.isdir(d):
+            return []
+        names = [f[:-4] for f in os.listdir(d) if f.endswith(".npy")]
+        return sorted(int(np.datetime64(n, "D").astype(np.int64)) for n in names)
+
+    def _load(self, ticker: str, day: int) -> np.ndarray:
+        path = self._path(ticker, day)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.load(path, mmap_mode="r")
+
+    def last_ts(self, ticker: str) -> Optional[int]:
+        days = self.days(ticker)
+        for day in reversed(days):
+            part = self._load(ticker, day)
+            if len(part):
+                return int(part["ts"][-1])
+        return None
+
+    def append(self, ticker: str, bars: np.ndarray) -> int:
+        """
+        Adds bars to their day partitions. The store is append-only: bars older than
+        a partition's last stored bar are ignored, and the last bar itself is replaced
+        (it may still have been forming when it was stored). Returns the number of new bars.
+        """
+        if len(bars) == 0:
+            return 0
+        added = 0
+        with self._lock(ticker):
+            os.makedirs(self._dir(ticker), exist_ok=True)
+            day_of = bars["ts"] // DAY
+            for day in np.unique(day_of):
+                new = bars[day_of == day]
+                existing = np.array(self._load(ticker, int(day)))
+                if len(existing):
+                    last = existing["ts"][-1]
+                    new = new[new["ts"] >= last]
+                    if len(new) == 0:
+                        continue
+                    added += int((new["ts"] > last).sum())
+                    merged = np.concatenate([existing[existing["ts"] < new["ts"][0]], new])
+                else:
+                    added += len(new)
+                    merged = new
+                path = self._path(ticker, int(day))
+                tmp = f"{path}.tmp{os.getpid()}"
+                with open(tmp, "wb") as f:
+                    np.save(f, merged)
+                os.replace(tmp, path)
+        return added
+
+    @metrics.timed("intraday_refresh")
+    def refresh(self, ticker: str, force: bool = False) -> int:
+        """Pulls bars newer than the last stored one from the upstream (at most once per min_refresh_interval)."""
+        ticker = ticker.upper()
+        now = time.time()
+        if not force and now - self._last_refresh.get(ticker, 0) < self.min_refresh_interval:
+            return 0
+        self._last_refresh[ticker] = now
+
+        last = self.last_ts(ticker)
+        upstream = provider.get_provider()
+        if last is None:
+            data = upstream.download(ticker, period="7d", interval="1m")
+        else:
+            start = pd.Timestamp(last, unit="s", tz="UTC").strftime("%Y-%m-%d")
+            data = upstream.download(ticker, start=start, interval="1m")
+        frame = batcher.split_download(data, [ticker]).get(ticker)
+        if frame is None:
+            return 0
+        return self.append(ticker, frame_to_bars(frame))
+
+    def read(self, ticker: str, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """1m bars with start <= ts < end (epoch seconds), copied out of the memory-mapped partitions."""
+        parts = []
+        for day in self.days(ticker):
+            if start is not None and (day + 1) * DAY <= start:
+                continue
+            if end is not None and day * DAY >= end:
+                break
+            part = self._load(ticker, day)
+            lo = np.searchsorted(part["ts"], start) if start is not None else 0
+            hi = np.searchsorted(part["ts"], end) if end is not None else len(part)
+            if hi > lo:
+                parts.append(np.array(part[lo:hi]))
+        if not parts:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.concatenate(parts)
+
+    @metrics.timed("intraday_query")
+    def query(self, ticker: str, start: Optional[int] = None, end: Optional[int] = None,
+              interval: str = "1m", since: Optional[int] = None) -> np.ndarray:
+        """
+        Bars resampled to `interval`. With `since` (ts of the newest bar the client holds)
+        only that bucket and newer ones are returned - the last bucket may have changed.
+        """
+        seconds = interval_seconds(interval)
+        if since is not None:
+            since_bucket = int(bucket_starts([since], seconds)[0])
+            start = since_bucket if start is None else max(start, since_bucket)
+        elif start is not None:
+            start = int(bucket_starts([start], seconds)[0])
+        return resample(self.read(ticker, start, end), seconds)
+
+
+def bars_to_records(bars: np.ndarray) -> List[Dict]:
+    """Structured bars -> JSON rows with a market-time label."""
+    if len(bars) == 0:
+        return []
+    labels = pd.to_datetime(bars["ts"], unit="s", utc=True).tz_convert(MARKET_TZ).strftime("%Y-%m-%d %H:%M").tolist()
+    cols = [bars["ts"].tolist(), labels] + [np.round(bars[c], 2).tolist() for c in ("open", "high", "low", "close")]
+    cols.append(np.nan_to_num(bars["volume"]).astype(np.int64).tolist())
+    keys = ["ts", "date", "open", "high", "low", "close", "volume"]
+    return [dict(zip(keys, row)) for row in zip(*cols)]
+
+
+store = IntradayStore(min_refresh_interval=float(os.getenv("INTRADAY_REFRESH_INTERVAL", "60")))
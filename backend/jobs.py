@@ -0,0 +1,311 @@
+"""
+Background job queue for long-running analysis
+(multi-asset Monte Carlo, large backtests).
+
+Jobs run on a bounded thread pool in the worker process that accepted them.
+Their status, progress and result are also written to a SQLite file (JobStore,
+JOBS_PATH) that all workers open, so with WEB_CONCURRENCY > 1 any worker can
+answer a poll, return the result or pass on a cancellation. Finished jobs are
+kept until their TTL expires.
+"""
+import contextvars
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "jobs.sqlite")
+# Seconds between progress writes / cancellation checks of a running job
+SYNC_INTERVAL = 0.5
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class QueueFull(Exception):
+    """Raised when too many jobs are already pending or running."""
+
+
+class Job:
+    def __init__(self, kind: str, params: Dict[str, Any], store: Optional["JobStore"] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = PENDING
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._future = None
+        self._store = store
+        self._synced = 0.0
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def report(self, fraction: float):
+        """
+        Progress callback handed to the worker function.
+        Also the cancellation point: raises JobCancelled once cancel() was called
+        (in this process, or in another one through the store).
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+        self.progress = round(min(max(float(fraction), 0.0), 1.0), 4)
+        if self._store is not None and time.monotonic() - self._synced >= SYNC_INTERVAL:
+            self._synced = time.monotonic()
+            try:
+                cancelled = self._store.progress(self.id, self.progress)
+            except sqlite3.Error as e:
+                log.warning("Job %s progress not stored: %s", self.id, e)
+                cancelled = False
+            if cancelled:
+                self._cancel_event.set()
+                raise JobCancelled()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    progress    REAL NOT NULL,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    cancel      INTEGER NOT NULL DEFAULT 0,
+    result      BLOB
+) WITHOUT ROWID;
+"""
+
+
+class JobStore:
+    """
+    Job states and (pickled) results in SQLite, shared by the worker processes.
+    Only the process running a job writes its state; others read it and may set its cancel flag.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread and process; the file and schema are created on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def save(self, job: Job):
+        """Writes a job's state (and its result once done); a pending cancellation request is kept."""
+        result = pickle.dumps(job.result, protocol=pickle.HIGHEST_PROTOCOL) if job.status == DONE else None
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, status, progress, error, created_at, started_at, finished_at, result) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET status = excluded.status, "
+            "progress = excluded.progress, error = excluded.error, started_at = excluded.started_at, "
+            "finished_at = excluded.finished_at, result = excluded.result",
+            (job.id, job.kind, job.status, job.progress, job.error, job.created_at, job.started_at,
+             job.finished_at, result))
+
+    def progress(self, job_id: str, progress: float) -> bool:
+        """Stores a running job's progress; returns True if its cancellation was requested."""
+        conn = self._conn()
+        conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+        row = conn.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self._conn().execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def request_cancel(self, job_id: str):
+        """Flags an unfinished job for cancellation; the process running it picks the flag up."""
+        self._conn().execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND status IN (?, ?)",
+                             (job_id, PENDING, RUNNING))
+
+    def load(self, job_id: str) -> Optional[Job]:
+        """A snapshot of a job (run by any process), or None."""
+        row = self._conn().execute(
+            "SELECT id, kind, status, progress, error, created_at, started_at, finished_at, result "
+            "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = Job(row[1], {})
+        job.id, job.status, job.progress, job.error, job.created_at, job.started_at, job.finished_at = (
+            row[0], *row[2:8])
+        job.result = pickle.loads(row[8]) if row[8] is not None else None
+        return job
+
+    def purge(self, cutoff: float):
+        """Drops jobs that finished before `cutoff` (epoch seconds)."""
+        self._conn().execute("DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+                             (*FINISHED_STATES, cutoff))
+
+
+class JobQueue:
+    """
+    Bounded worker pool plus a result store with TTL.
+    `max_active` caps pending + running jobs so a burst of submissions
+    cannot grow the executor's queue without limit.
+    With a JobStore, jobs accepted by other processes can be read and cancelled too.
+    """
+
+    def __init__(self, max_workers: int = 2, max_active: int = 16, ttl: float = 3600,
+                 store: Optional[JobStore] = None):
+        self.max_workers = max_workers
+        self.max_active = max_active
+        self.ttl = ttl
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[[Dict[str, Any], Job], Any], params: Dict[str, Any]) -> Job:
+        """Schedules fn(params, job). The worker should call job.report() periodically."""
+        self.purge_expired()
+        job = Job(kind, params, self.store)
+        with self._lock:
+            active = sum(1 for j in self._jobs.values() if j.status in (PENDING, RUNNING))
+            if active >= self.max_active:
+                raise QueueFull(f"{active} jobs already queued or running")
+            self._jobs[job.id] = job
+        self._save(job)
+        # The submitting request's context (e.g. its request id for log lines) follows the job
+        job._future = self._executor.submit(contextvars.copy_context().run, self._run, job, fn)
+        return job
+
+    def _save(self, job: Job):
+        if self.store is not None:
+            try:
+                self.store.save(job)
+            except (sqlite3.Error, pickle.PicklingError, TypeError) as e:
+                log.warning("Job %s state not stored: %s", job.id, e)
+
+    def _cancelled_elsewhere(self, job: Job) -> bool:
+        try:
+            return self.store is not None and self.store.cancel_requested(job.id)
+        except sqlite3.Error as e:
+            log.warning("Job %s cancellation flag unreadable: %s", job.id, e)
+            return False
+
+    def _run(self, job: Job, fn):
+        if job.cancel_requested or self._cancelled_elsewhere(job):
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        self._save(job)
+        try:
+            result = fn(job.params, job)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            log.exception("Job %s (%s) failed: %s", job.id, job.kind, e)
+            job.error = str(e)
+            self._finish(job, FAILED)
+        else:
+            job.result = result
+            job.progress = 1.0
+            self._finish(job, DONE)
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        self._save(job)
+        log.info("Job %s (%s) %s", job.id, job.kind, status.lower(), extra={
+            "job_id": job.id,
+            "duration_ms": round((job.finished_at - (job.started_at or job.created_at)) * 1000, 1),
+        })
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job if this process runs it, else its last stored state (from whichever process runs it)."""
+        self.purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.load(job_id)
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            local = job_id in self._jobs
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        if not local:
+            # Run by another worker: it stops at its next progress report
+            self.store.request_cancel(job_id)
+            return job
+        job._cancel_event.set()
+        # Not started yet: drop it from the executor queue right away.
+        if job._future is not None and job._future.cancel():
+            self._finish(job, CANCELLED)
+        return job
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, j in self._jobs.items()
+                if j.status in FINISHED_STATES and j.finished_at is not None and j.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.purge(cutoff)
+            except sqlite3.Error as e:
+                log.warning("Purging stored jobs failed: %s", e)
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for j in jobs:
+            j._cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+queue = JobQueue(
+    max_workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_active=int(os.getenv("JOB_MAX_ACTIVE", "16")),
+    ttl=float(os.getenv("JOB_RESULT_TTL", "3600")),
+    store=JobStore(os.getenv("JOBS_PATH", DEFAULT_PATH)),
+)
@@ -0,0 +1,389 @@
+"""
+Live quotes and technical signals over WebSocket (/ws/quotes).
+
+Clients send {"action": "subscribe" | "unsubscribe", "tickers": [...]} and
+receive {"type": "quote", ...} messages for their tickers.
+
+- One Poller per subscribed ticker (per worker process), however many
+  clients watch it: it refreshes the intraday store at most once per
+  LIVE_POLL_INTERVAL seconds and fans the result out to every subscriber.
+  The poller stops when the last subscriber leaves.
+- RSI / MFI (14) and Bollinger Bands (20, 2) are the daily indicators of
+  /api/technical with today's still-forming bar as the last row. They are
+  kept incrementally: the completed days' windows are stored once, and
+  every tick only combines them with today's bar (O(1) per update).
+- Backpressure: each subscriber holds at most one undelivered quote per
+  ticker; a newer quote replaces an unsent one (counted as dropped), so a
+  slow client gets fewer, current updates and never grows a queue. A client
+  that does not accept a message within LIVE_SEND_TIMEOUT is disconnected.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import analysis
+import batcher
+import intraday
+import metrics
+import resilience
+import symbols
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "30"))
+SEND_TIMEOUT = float(os.getenv("LIVE_SEND_TIMEOUT", "10"))
+MAX_TICKERS = int(os.getenv("LIVE_MAX_TICKERS", "50"))
+
+polls = metrics.Counter("live_polls_total", "Live quote polls by outcome.", ("outcome",))
+sent = metrics.Counter("live_updates_sent_total", "Live quote messages sent to clients.")
+dropped = metrics.Counter("live_updates_dropped_total", "Live quotes replaced before a slow client received them.")
+
+
+def _index(up: float, down: float) -> Optional[float]:
+    """100 - 100 / (1 + up / down), as RSI and MFI define it (100 when down is 0)."""
+    if down == 0:
+        return 100.0 if up > 0 else None
+    return 100 - 100 / (1 + up / down)
+
+
+class Indicators:
+    """
+    RSI, MFI and Bollinger Bands over daily bars whose last bar is still forming.
+    Completed days are pushed once (commit); update() combines their windows with
+    the current bar in constant time.
+    """
+
+    def __init__(self, rsi_period: int = 14, mfi_period: int = 14, bb_period: int = 20, bb_std: float = 2):
+        self.rsi_period, self.mfi_period, self.bb_period, self.bb_std = rsi_period, mfi_period, bb_period, bb_std
+        # The completed part of each window (one slot is left for the forming bar)
+        self.gains: Deque[float] = deque(maxlen=rsi_period - 1)
+        self.losses: Deque[float] = deque(maxlen=rsi_period - 1)
+        self.positive_flow: Deque[float] = deque(maxlen=mfi_period - 1)
+        self.negative_flow: Deque[float] = deque(maxlen=mfi_period - 1)
+        self.closes: Deque[float] = deque(maxlen=bb_period - 1)
+        self.last_close: Optional[float] = None
+        self.last_typical: Optional[float] = None
+        self.day = None
+        self.bar: Optional[Tuple[float, float, float, float]] = None
+        self._sums = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, **periods) -> "Indicators":
+        """Seeded with the completed daily OHLCV rows of a price frame."""
+        ind = cls(**periods)
+        frame = frame.dropna(subset=["Close"])
+        for high, low, close, volume in frame[["High", "Low", "Close", "Volume"]].to_numpy(dtype=float).tolist():
+            ind.commit(high, low, close, volume)
+        if len(frame):
+            ind.day = frame.index[-1].date()
+        return ind
+
+    def commit(self, high: float, low: float, close: float, volume: float):
+        """Adds a completed day to the windows."""
+        if self.last_close is not None:
+            delta = close - self.last_close
+            self.gains.append(max(delta, 0.0))
+            self.losses.append(max(-delta, 0.0))
+        typical = (high + low + close) / 3
+        if self.last_typical is not None:
+            flow = typical * (0.0 if np.isnan(volume) else volume)
+            self.positive_flow.append(flow if typical > self.last_typical else 0.0)
+            self.negative_flow.append(flow if typical < self.last_typical else 0.0)
+        self.closes.append(close)
+        self.last_close, self.last_typical = close, typical
+        # Close sums are taken around the last close to keep the variance numerically stable
+        shifted = [c - close for c in self.closes]
+        self._sums = (sum(self.gains), sum(self.losses), sum(self.positive_flow), sum(self.negative_flow),
+                      sum(shifted), sum(d * d for d in shifted))
+
+    def update(self, day, high: float, low: float, close: float, volume: float) -> Dict[str, Optional[float]]:
+        """Indicator values with (high, low, close, volume) as the forming bar of `day`."""
+        if self.bar is not None and day != self.day:
+            self.commit(*self.bar)
+        self.day, self.bar = day, (high, low, close, volume)
+        gains, losses, positive, negative, s, ss = self._sums
+        out: Dict[str, Optional[float]] = {"rsi": None, "mfi": None, "bb_upper": None, "bb_mid": None, "bb_lower": None}
+
+        if self.last_close is not None and len(self.gains) == self.rsi_period - 1:
+            delta = close - self.last_close
+            out["rsi"] = _index(gains + max(delta, 0.0), losses + max(-delta, 0.0))
+
+        typical = (high + low + close) / 3
+        if self.last_typical is not None and len(self.positive_flow) == self.mfi_period - 1:
+            flow = typical * (0.0 if np.isnan(volume) else volume)
+            out["mfi"] = _index(positive + (flow if typical > self.last_typical else 0.0),
+                                negative + (flow if typical < self.last_typical else 0.0))
+
+        if len(self.closes) == self.bb_period - 1:
+            n = self.bb_period
+            d = close - self.last_close
+            s, ss = s + d, ss + d * d
+            mean = self.last_close + s / n
+            std = max((ss - s * s / n) / (n - 1), 0.0) ** 0.5
+            out.update(bb_mid=mean, bb_upper=mean + self.bb_std * std, bb_lower=mean - self.bb_std * std)
+        return out
+
+
+def _round(value: Optional[float], decimals: int = 2) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), decimals)
+
+
+class Poller:
+    """Polls one ticker while it has subscribers and publishes changed quotes to the hub."""
+
+    def __init__(self, hub: "QuoteHub", ticker: str, interval: float):
+        self.hub = hub
+        self.ticker = ticker
+        self.interval = interval
+        self.latest: Optional[dict] = None
+        self.indicators: Optional[Indicators] = None
+        self._fallback = None
+        self.task: Optional[asyncio.Task] = None
+
+    def _daily(self) -> pd.DataFrame:
+        start = (datetime.now(timezone.utc) - timedelta(days=120)).strftime("%Y-%m-%d")
+        frame = analysis.load_price_frames([self.ticker], start, None).get(self.ticker)
+        return frame if frame is not None else pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"], index=pd.DatetimeIndex([]))
+
+    def _today(self):
+        """(day, ts, open, high, low, close, volume) of the latest intraday session, or None."""
+        days = intraday.store.days(self.ticker)
+        if not days:
+            return None
+        bars = intraday.store.read(self.ticker, days[-1] * intraday.DAY, (days[-1] + 1) * intraday.DAY)
+        if len(bars) == 0:
+            return None
+        ts = int(bars["ts"][-1])
+        day = pd.Timestamp(ts, unit="s", tz="UTC").tz_convert(intraday.MARKET_TZ).date()
+        return (day, ts, float(bars["open"][0]), float(np.nanmax(bars["high"])), float(np.nanmin(bars["low"])),
+                float(bars["close"][-1]), float(np.nansum(bars["volume"])))
+
+    def poll(self) -> Optional[dict]:
+        """One upstream refresh and the resulting quote (runs in a worker thread)."""
+        intraday.store.refresh(self.ticker, force=True)
+        today = self._today()
+        indicators = self.indicators
+        if indicators is None:
+            daily = self._daily()
+            seeded = len(daily) > 0
+            if today is not None:
+                # The daily history may already hold today's partial bar
+                daily = daily[daily.index.date < today[0]]
+            elif len(daily):
+                # No intraday bars (e.g. market closed): the last daily bar stands in for the forming one
+                date, last = daily.index[-1], daily.iloc[-1]
+                self._fallback = (date.date(), int(date.timestamp()), float(last["Open"]), float(last["High"]),
+                                  float(last["Low"]), float(last["Close"]), float(last["Volume"]))
+                daily = daily.iloc[:-1]
+            indicators = Indicators.from_frame(daily)
+            # Without a daily history (load failed) seed again on the next poll
+            if seeded:
+                self.indicators = indicators
+        today = today or self._fallback
+        if today is None:
+            return None
+        day, ts, open_, high, low, close, volume = today
+        values = indicators.update(day, high, low, close, volume)
+        previous = indicators.last_close  # the last completed day's close
+        band = None
+        if values["bb_upper"] is not None and values["bb_upper"] != values["bb_lower"]:
+            band = (close - values["bb_lower"]) / (values["bb_upper"] - values["bb_lower"]) * 100
+        return {
+            "type": "quote",
+            "ticker": self.ticker,
+            "ts": ts,
+            "date": day.isoformat(),
+            "price": _round(close),
+            "change_pct": _round((close / previous - 1) * 100) if previous else None,
+            "day": {"open": _round(open_), "high": _round(high), "low": _round(low), "volume": int(np.nan_to_num(volume))},
+            "indicators": {**{k: _round(v) for k, v in values.items()}, "bb_position": _round(band, 1)},
+        }
+
+    async def run(self):
+        while True:
+            delay = self.interval
+            try:
+                quote = await asyncio.to_thread(self.poll)
+                polls.inc("ok")
+            except resilience.UpstreamUnavailable as e:
+                polls.inc("unavailable")
+                delay = max(delay, e.retry_after)
+                quote = None
+            except Exception as e:
+                polls.inc("error")
+                log.warning("Live poll failed for %s: %s", self.ticker, e)
+                quote = None
+            if quote is not None and quote != self.latest:
+                self.latest = quote
+                self.hub.publish(self.ticker, quote)
+            await asyncio.sleep(delay)
+
+
+class Subscriber:
+    """One WebSocket client: its tickers plus the latest undelivered message per ticker."""
+
+    def __init__(self, websocket: WebSocket, send_timeout: float = SEND_TIMEOUT):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.tickers: Set[str] = set()
+        self.control: Deque[dict] = deque(maxlen=100)
+        self.pending: Dict[str, dict] = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, ticker: str, message: dict):
+        """Queues a quote; replaces the previous one for the ticker if it was not sent yet."""
+        if ticker in self.pending:
+            dropped.inc()
+        self.pending[ticker] = message
+        self.ready.set()
+
+    def notify(self, message: dict):
+        self.control.append(message)
+        self.ready.set()
+
+    async def send_loop(self):
+        """The only sender on the socket; a client that stalls longer than send_timeout is dropped."""
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            messages = list(self.control)
+            self.control.clear()
+            messages += self.pending.values()
+            self.pending = {}
+            for message in messages:
+                await asyncio.wait_for(self.websocket.send_json(message), self.send_timeout)
+                if message.get("type") == "quote":
+                    sent.inc()
+
+
+class QuoteHub:
+    """Pollers by ticker and their subscribers; used from the event loop only."""
+
+    def __init__(self, interval: float = POLL_INTERVAL):
+        self.interval = interval
+        self.pollers: Dict[str, Poller] = {}
+        self.subscribers: Dict[str, Set[Subscriber]] = {}
+
+    def subscribe(self, sub: Subscriber, ticker: str):
+        self.subscribers.setdefault(ticker, set()).add(sub)
+        sub.tickers.add(ticker)
+        poller = self.pollers.get(ticker)
+        if poller is None:
+            poller = self.pollers[ticker] = Poller(self, ticker, self.interval)
+            poller.task = asyncio.create_task(poller.run(), name=f"live:{ticker}")
+        elif poller.latest is not None:
+            sub.offer(ticker, poller.latest)
+
+    def unsubscribe(self, sub: Subscriber, ticker: str):
+        sub.tickers.discard(ticker)
+        sub.pending.pop(ticker, None)
+        subs = self.subscribers.get(ticker)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self.subscribers[ticker]
+            poller = self.pollers.pop(ticker, None)
+            if poller is not None and poller.task is not None:
+                poller.task.cancel()
+
+    def publish(self, ticker: str, message: dict):
+        for sub in self.subscribers.get(ticker, ()):
+            sub.offer(ticker, message)
+
+    async def close(self):
+        tasks = [p.task for p in self.pollers.values() if p.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.pollers.clear()
+        self.subscribers.clear()
+
+
+hub = QuoteHub()
+
+
+class BinaryMessage(Exception):
+    """The client sent a binary frame; the protocol is JSON text only."""
+
+
+def _check(tickers) -> Tuple[list, list]:
+    """(accepted, rejected) tickers of a subscribe message: malformed ones, and unlisted ones with SYMBOLS_VALIDATE=reject."""
+    tickers = batcher.normalize_tickers(t for t in tickers if isinstance(t, str))
+    rejected = {t for t in tickers if not symbols.is_symbol(t)}
+    tickers = [t for t in tickers if t not in rejected]
+    index = symbols.get_index() if symbols.VALIDATE == "reject" else None
+    if index is not None:
+        rejected.update(index.unknown(tickers))
+    return [t for t in tickers if t not in rejected], sorted(rejected)
+
+
+async def serve(websocket: WebSocket):
+    """Runs one client connection until it disconnects or stalls."""
+    await websocket.accept()
+    sub = Subscriber(websocket)
+    sender = asyncio.create_task(sub.send_loop())
+    receiver = asyncio.create_task(_receive(websocket, sub))
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = None if task.cancelled() else task.exception()
+            if isinstance(error, asyncio.TimeoutError):
+                log.info("Disconnecting slow live client (%d tickers)", len(sub.tickers))
+                await websocket.close(code=1013, reason="Client too slow")
+            elif isinstance(error, BinaryMessage):
+                # Stop the sender first: the close frame must be the last thing sent
+                sender.cancel()
+                await asyncio.gather(sender, return_exceptions=True)
+                await websocket.close(code=1003, reason="Messages must be JSON text")
+            elif error is not None and not isinstance(error, WebSocketDisconnect):
+                log.warning("Live connection failed: %s", error)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        for ticker in list(sub.tickers):
+            hub.unsubscribe(sub, ticker)
+
+
+async def _receive(websocket: WebSocket, sub: Subscriber):
+    while True:
+        frame = await websocket.receive()
+        if frame["type"] == "websocket.disconnect":
+            return
+        if frame.get("text") is None:
+            raise BinaryMessage()
+        try:
+            message = json.loads(frame["text"])
+        except ValueError:
+            sub.notify({"type": "error", "message": "Messages must be JSON"})
+            continue
+        action = message.get("action") if isinstance(message, dict) else None
+        tickers = message.get("tickers", []) if isinstance(message, dict) else []
+        if action not in ("subscribe", "unsubscribe") or not isinstance(tickers, list):
+            sub.notify({"type": "error", "message": 'Expected {"action": "subscribe" | "unsubscribe", "tickers": [...]}'})
+            continue
+        if action == "unsubscribe":
+            for t in batcher.normalize_tickers(t for t in tickers if isinstance(t, str)):
+                hub.unsubscribe(sub, t)
+        else:
+            accepted, rejected = _check(tickers)
+            for t in accepted:
+                if t in sub.tickers:
+                    continue
+                if len(sub.tickers) >= MAX_TICKERS:
+                    sub.notify({"type": "error", "message": f"At most {MAX_TICKERS} tickers per connection"})
+                    break
+                hub.subscribe(sub, t)
+            if rejected:
+                sub.notify({"type": "error", "message": f"Unknown symbol(s): {', '.join(rejected)}"})
+        sub.notify({"type": "subscribed", "tickers": sorted(sub.tickers)})
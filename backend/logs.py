@@ -0,0 +1,127 @@
+"""
+Structured logging.
+
+Modules log through `logging.getLogger(__name__)`; setup() routes every record
+through a QueueHandler, so the request thread only enqueues and a background
+QueueListener does the formatting and the (blocking) stream writes.
+
+- LOG_LEVEL (default INFO) gates records before any formatting happens; pass
+  values as %-style args (`log.debug("shape %s", df.shape)`) so disabled debug
+  lines cost one level check.
+- LOG_FORMAT=json (default) writes one JSON object per line; LOG_FORMAT=text
+  is for local development.
+- Every record carries the current request id (X-Request-ID, or a generated
+  one, set by RequestIdMiddleware and echoed in the response). Extra fields
+  passed as `extra={...}` (e.g. duration_ms) are included as-is.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+from typing import Optional
+
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord attributes that are not user-supplied extra fields
+_STANDARD = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep the record as-is (message args, extra fields, exc_info): the listener
+        # thread formats it. Only the request id (a contextvar of this thread) is resolved here.
+        record.request_id = request_id.get()
+        return record
+
+
+def setup(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Configures the root logger once (idempotent). Called on import of main."""
+    global _listener
+    if _listener is not None:
+        return
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+
+    stream = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    q: "queue.SimpleQueue" = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [_QueueHandler(q)]
+    root.setLevel(level)
+    # Chatty third-party loggers stay at WARNING unless LOG_LEVEL asks for less
+    for name in ("yfinance", "urllib3", "peewee"):
+        logging.getLogger(name).setLevel(max(logging.getLevelName(level), logging.WARNING))
+
+
+class RequestIdMiddleware:
+    """ASGI middleware: sets the request id contextvar, echoes X-Request-ID and logs one access line."""
+
+    def __init__(self, app):
+        self.app = app
+        self.log = logging.getLogger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = None
+        for key, value in scope.get("headers", []):
+            if key == b"x-request-id":
+                rid = value.decode("latin-1")[:64]
+                break
+        rid = rid or uuid.uuid4().hex[:16]
+        token = request_id.set(rid)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", rid.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.log.info("%s %s %s", scope["method"], scope["path"], status, extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+            })
+            request_id.reset(token)
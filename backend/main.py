@@ -1,14 +1,73 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, List, Optional, Dict, Any, Literal
+from contextlib import asynccontextmanager
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import pandas as pd
-import yfinance as yf
+import numpy as np
 import analysis
+import arrow_ipc
+import batcher
+import cache
+import compression
+import downsample
+import intraday
+import jobs
+import live
+import logs
+import metrics
+import portfolios
+import profiling
+import provider
+import resilience
+import symbols
+import warmup
+from panel import PricePanel
+import json
+import logging
+import math
 import os
+import threading
+import time
 
-app = FastAPI(title="Investment Analyzer API")
+# Structured logging through a background queue listener (LOG_LEVEL, LOG_FORMAT)
+logs.setup()
+log = logging.getLogger(__name__)
+
+_preloaded = threading.Event()
+
+def _preload():
+    """Loads what module import deferred (yfinance, bs4, HTTP session) before the first request needs it."""
+    start = time.perf_counter()
+    try:
+        provider.get_provider()
+        provider.preload()
+        _preloaded.set()
+        log.info("Preloaded upstream modules", extra={"duration_ms": round((time.perf_counter() - start) * 1000, 1)})
+    except Exception as e:
+        log.warning("Preload failed: %s", e)
+    # Build the symbol index on first start, rebuild it once it is older than SYMBOLS_MAX_AGE_DAYS
+    symbols.refresh()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve immediately; heavy imports finish in the background (PRELOAD=0 to skip)
+    if os.getenv("PRELOAD", "1") == "1":
+        threading.Thread(target=_preload, name="preload", daemon=True).start()
+    # Refresh popular tickers after market close (set WARMUP_ENABLED=0 to disable)
+    if os.getenv("WARMUP_ENABLED", "1") == "1":
+        warmup.scheduler.start()
+    yield
+    await live.hub.close()
+    warmup.scheduler.stop()
+    jobs.queue.shutdown()
+
+app = FastAPI(title="Investment Analyzer API", lifespan=lifespan,
+              default_response_class=metrics.TimedJSONResponse)
+# Sync endpoints record their worker thread for the request profiler (see profiling.py)
+app.router.route_class = profiling.ProfiledRoute
 
 # CORS Setup (Allow Frontend)
 origins = ["http://localhost:3000", os.getenv("FRONTEND_URL")]
@@ -21,19 +80,129 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / brotli / zstd by Accept-Encoding, levels per payload type (see compression.py)
+app.add_middleware(compression.CompressionMiddleware)
+
+# Age / X-Data-Stale headers on responses built from stale cached data (see resilience.py)
+app.add_middleware(resilience.StaleMiddleware)
+
+# Admin-only per-request profiling (X-Profile: collapsed | speedscope, see profiling.py)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Per-route latency and the optional Server-Timing header (outside compression, so it sees it too)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Correlation id for every log line of a request, plus one access log line (outermost)
+app.add_middleware(logs.RequestIdMiddleware)
+
+
+# Date alignment across tickers (see panel.ALIGN_MODES). The default keeps every
+# ticker's full history instead of truncating all of them to the youngest one.
+AlignMode = Literal["inner", "outer_ffill", "pairwise"]
+
+# Malformed tickers are rejected before anything is fetched; ones the local symbol index
+# does not know get suggestions with the 404 if no data is found (see symbols.validate)
+Ticker = Annotated[str, AfterValidator(symbols.validate_symbol)]
+Tickers = Annotated[List[str], AfterValidator(symbols.validate)]
 
 class AnalyzeRequest(BaseModel):
-    tickers: List[str]
+    tickers: Tickers
     start_date: str = "2020-01-01"
     end_date: str = "2023-12-31"
+    align: AlignMode = "outer_ffill"
+    # Downsample chart series to about this many points (None = every day)
+    max_points: Optional[int] = Field(None, ge=10)
+
+def _server_error(e: Exception) -> HTTPException:
+    """503 with Retry-After while the upstream is unavailable (circuit open, rate limited), else 500."""
+    if isinstance(e, resilience.UpstreamUnavailable):
+        return HTTPException(status_code=503, detail=str(e),
+                             headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    return HTTPException(status_code=500, detail=str(e))
+
+def _no_data(tickers: List[str], detail: str) -> HTTPException:
+    """404, naming the tickers the symbol index does not know (with suggestions) as the likely cause."""
+    hints = symbols.unknown_hints(tickers)
+    return HTTPException(status_code=404, detail=f"{detail} Unknown symbol(s): {'; '.join(hints)}" if hints else detail)
+
+def _response_key(path: str, request: BaseModel, tickers: List[str]):
+    """
+    Response cache key: these endpoints' output depends only on the request body and the
+    cached data of its tickers, whose version is part of the key (see analysis.data_versions).
+    Computed again when storing, so the entry is filed under the data it was built from.
+    """
+    return (path, request.model_dump_json(), analysis.versions_key(tickers))
+
+# How /api/simulate_multi draws portfolio weights (see sampling.py); None = server default
+SamplingStrategy = Literal["normalized", "dirichlet", "sobol", "frontier"]
 
 class SimulationRequest(BaseModel):
-    tickers: List[str] # Expect exactly 2
+    tickers: Tickers # Expect exactly 2
     start_date: str
     end_date: str
+    align: AlignMode = "outer_ffill"
+    sampling: Optional[SamplingStrategy] = None
+
+RiskMethod = Literal["historical", "cornish_fisher", "monte_carlo"]
+
+class RiskRequest(BaseModel):
+    tickers: Tickers
+    start_date: str = "2020-01-01"
+    end_date: str = "2023-12-31"
+    align: AlignMode = "outer_ffill"
+    # Weighted portfolios to evaluate, e.g. [{"SPY": 0.6, "TLT": 0.4}] (normalized to sum 1)
+    portfolios: List[Dict[str, float]] = []
+    # Also evaluate every portfolio of the Monte Carlo cloud (as /api/simulate_multi)
+    cloud: bool = False
+    sampling: Optional[SamplingStrategy] = None
+    confidence: List[float] = Field([0.95, 0.99], min_length=1, max_length=5)
+    horizons: List[int] = Field([1, 10, 21], min_length=1, max_length=5)
+    methods: List[RiskMethod] = ["historical", "cornish_fisher", "monte_carlo"]
+    n_paths: int = Field(5000, ge=100, le=50000)
+
+FactorName = Literal["market", "size", "value", "momentum", "quality", "low_vol"]
+
+class FactorRequest(BaseModel):
+    tickers: Tickers
+    start_date: str = "2020-01-01"
+    end_date: str = "2023-12-31"
+    align: AlignMode = "outer_ffill"
+    factors: List[FactorName] = Field(["market", "size", "value", "momentum"], min_length=1)
+    # Rolling regression: window and spacing of the evaluations, in trading days
+    window: int = Field(252, ge=60, le=1260)
+    step: int = Field(21, ge=1, le=252)
+    # Attribution period: month, quarter or year
+    period: Literal["M", "Q", "Y"] = "M"
+
+class FundamentalsRequest(BaseModel):
+    tickers: Tickers = Field(..., min_length=1, max_length=100)
+    # 'A': latest fiscal years; 'Q': trailing twelve months and year-over-year quarters
+    freq: Literal["A", "Q"] = "A"
+
+def _known_weights(weights: Dict[str, float]) -> Dict[str, float]:
+    symbols.validate(list(weights))
+    if any(w < 0 for w in weights.values()) or sum(weights.values()) <= 0:
+        raise ValueError("Weights must be non-negative and not all zero")
+    return weights
+
+Holdings = Annotated[Dict[str, float], AfterValidator(_known_weights)]
+
+class PortfolioSpec(BaseModel):
+    name: Optional[str] = Field(None, max_length=64)
+    # {ticker: weight}, normalized to sum 1
+    weights: Holdings
+
+class CompareRequest(BaseModel):
+    portfolios: List[PortfolioSpec] = Field(..., min_length=1, max_length=20)
+    start_date: str = "2020-01-01"
+    end_date: str = "2023-12-31"
+    align: AlignMode = "outer_ffill"
+    # "daily": rebalanced to the target weights every day; "none": buy and hold
+    rebalance: Literal["daily", "none"] = "daily"
+    max_points: Optional[int] = Field(None, ge=10)
 
 class OverlapRequest(BaseModel):
-    tickers: List[str]
+    tickers: Tickers
 
 @app.post("/api/overlap")
 def analyze_overlap(request: OverlapRequest):
@@ -41,72 +210,145 @@ def analyze_overlap(request: OverlapRequest):
         if len(request.tickers) < 2:
             raise HTTPException(status_code=400, detail="Select at least 2 ETFs")
             
-        print(f"Analyzing overlap for {request.tickers}")
+        log.info("Analyzing overlap for %s", request.tickers)
         holdings = analysis.get_etf_holdings(request.tickers)
         # Use Hybrid calculation (Scraper + Local)
         overlap = analysis.calculate_overlap_hybrid(holdings, request.tickers)
         
         return {"overlap": overlap, "holdings": holdings}
     except Exception as e:
-        print(f"Overlap Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("Overlap error: %s", e)
+        raise _server_error(e)
+
+# --- Arrow IPC builders (Accept: application/vnd.apache.arrow.stream) ---
+
+def _analyze_table(tr, pr, metrics, allocation_curve, max_points):
+    """Normalized TR / PR series as 'tr:<T>' / 'pr:<T>' columns on the TR date axis."""
+    norm_tr = (tr.values / tr.base - 1) * 100
+    norm_pr = np.full_like(norm_tr, np.nan)
+    if not pr.empty:
+        # PR may be aligned separately; map its rows onto the TR dates
+        pos = np.minimum(np.searchsorted(pr.days, tr.days), len(pr.days) - 1)
+        hit = pr.days[pos] == tr.days
+        pr_norm = (pr.values / pr.base - 1) * 100
+        for i, t in enumerate(tr.tickers):
+            if t in pr.tickers:
+                norm_pr[hit, i] = pr_norm[pos[hit], pr.tickers.index(t)]
+    rows = downsample.lttb_indices(norm_tr, max_points) if max_points else slice(None)
+    columns = {**arrow_ipc.matrix_columns(tr.tickers, np.asfortranarray(norm_tr[rows]), "tr:"),
+               **arrow_ipc.matrix_columns(tr.tickers, np.asfortranarray(norm_pr[rows]), "pr:")}
+    meta = analysis.clean_nans({
+        "summary": metrics['stats'],
+        "correlation": metrics['correlation'],
+        "allocation_curve": allocation_curve,
+        "risk": metrics['risk'],
+    })
+    return arrow_ipc.table(columns, meta, days=tr.days[rows])
+
+def _advanced_table(tr, request):
+    """'rolling_1y:<T>' and 'drawdown:<T>' columns from start_date on."""
+    window = 252
+    rolling = np.full(tr.shape, np.nan)
+    if tr.shape[0] > window:
+        rolling[window:] = (tr.values[window:] / tr.filled[:-window] - 1) * 100
+    drawdown = tr.drawdown * 100
+    start_day = pd.Timestamp(request.start_date).to_datetime64().astype("datetime64[D]").astype(np.int64)
+    rows = np.arange(int(np.searchsorted(tr.days, start_day)), tr.shape[0])
+    if request.max_points:
+        rows = rows[downsample.lttb_indices(drawdown[rows], request.max_points)]
+    columns = {**arrow_ipc.matrix_columns(tr.tickers, np.asfortranarray(rolling[rows]), "rolling_1y:"),
+               **arrow_ipc.matrix_columns(tr.tickers, np.asfortranarray(drawdown[rows]), "drawdown:")}
+    return arrow_ipc.table(columns, days=tr.days[rows])
+
+def _simulation_table(sim):
+    """One row per simulated portfolio: return, risk, sharpe and 'w:<T>' weights."""
+    if sim is None:
+        return arrow_ipc.table({"return": np.empty(0), "risk": np.empty(0), "sharpe": np.empty(0)})
+    columns = {"return": sim["return"], "risk": sim["risk"], "sharpe": sim["sharpe"],
+               **arrow_ipc.matrix_columns(sim["tickers"], np.asfortranarray(sim["weights"]), "w:")}
+    return arrow_ipc.table(columns, {"tickers": sim["tickers"], "sampling": sim["sampling"]})
+
+def _history_table(frame, bars):
+    columns = {"date": frame.index.values}
+    if bars:
+        for col in ("Open", "High", "Low", "Close", "Volume"):
+            if col in frame.columns:
+                columns[col.lower()] = frame[col].to_numpy(dtype=float)
+    else:
+        col = 'Adj Close' if 'Adj Close' in frame.columns else 'Close'
+        columns["price"] = frame[col].to_numpy(dtype=float)
+    return arrow_ipc.table(columns)
 
 @app.post("/api/advanced")
-def analyze_advanced(request: AnalyzeRequest):
+def analyze_advanced(request: AnalyzeRequest, http: Request):
     try:
-        print(f"Advanced Analysis for {request.tickers}")
+        log.info("Advanced analysis for %s", request.tickers)
+        warmup.record(request.tickers)
+        as_arrow = arrow_ipc.wants_arrow(http)
+        key = _response_key("/api/advanced", request, request.tickers)
+        cached = None if as_arrow else cache.responses.get(key)
+        if cached is not None:
+            return cached
         
         # Calculate start_date - 1 year for Rolling Window context
         start_dt = pd.to_datetime(request.start_date)
         adjusted_start = (start_dt - pd.Timedelta(days=366)).strftime("%Y-%m-%d")
         
-        df_tr, _ = analysis.fetch_data(request.tickers, adjusted_start, request.end_date)
+        tr_panel, _ = analysis.load_panels(request.tickers, adjusted_start, request.end_date, request.align)
         
-        if df_tr.empty:
-            raise HTTPException(status_code=404, detail="No data.")
+        if tr_panel.empty:
+            raise _no_data(request.tickers, "No data.")
 
         # Calculate Rolling & Drawdown using the extended data
         # Rolling window is 252. The first 252 will be NaN, which corresponds to the 'extra' year we fetched.
         # So the result mostly aligns with the requested start date.
-        rolling_1y = analysis.calculate_rolling_returns(df_tr, window=252)
-        drawdowns = analysis.calculate_drawdown_series(df_tr)
-        
-        # Optional: Filter the result timeseries to match the requested window?
-        # The frontend chart usually auto-scales X-axis, so showing 'more' data is often fine/better context.
-        # But if user requested exactly 2024, seeing 2023 might be confusing?
-        # The prompt says "I set 2024~2026, but it ignores it". 
-        # Actually, showing exact window is cleaner. Let's filter the FINAL list.
-        
-        def filter_ts(ts):
-            return [x for x in ts if x['date'] >= request.start_date]
+        # Showing the exact requested window is cleaner, so both series are trimmed
+        # to start_date (and downsampled to max_points) after the calculation.
+        if as_arrow:
+            return arrow_ipc.response(_advanced_table(tr_panel, request))
+
+        rolling_1y = analysis.calculate_rolling_returns(tr_panel, window=252, start_date=request.start_date,
+                                                        max_points=request.max_points)
+        drawdowns = analysis.calculate_drawdown_series(tr_panel, start_date=request.start_date,
+                                                       max_points=request.max_points)
             
-        return {
-            "rolling_1y": filter_ts(rolling_1y),
-            "drawdowns": filter_ts(drawdowns)
-        }
+        result = analysis.clean_nans({
+            "rolling_1y": rolling_1y,
+            "drawdowns": drawdowns
+        })
+        if not resilience.served_stale():
+            cache.responses.set(_response_key("/api/advanced", request, request.tickers), result)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Advanced Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("Advanced error: %s", e)
+        raise _server_error(e)
 
 @app.post("/api/simulate_multi")
-def simulate_multi_endpoint(req: SimulationRequest):
+def simulate_multi_endpoint(req: SimulationRequest, http: Request):
     try:
         # Only using tickers from SimulationRequest
-        print(f"Multi-asset simulation for {req.tickers}")
-        result = analysis.simulate_multi_asset_monte_carlo(req.tickers)
+        log.info("Multi-asset simulation for %s", req.tickers)
+        warmup.record(req.tickers)
+        if arrow_ipc.wants_arrow(http):
+            return arrow_ipc.response(_simulation_table(analysis.monte_carlo_portfolios(req.tickers, strategy=req.sampling)))
+        result = analysis.simulate_multi_asset_monte_carlo(req.tickers, strategy=req.sampling)
         return analysis.clean_nans({"simulation": result})
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Multi-asset Simulation Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("Multi-asset simulation error: %s", e)
+        raise _server_error(e)
 
 class PortfolioItem(BaseModel):
-    ticker: str
+    ticker: Ticker
     shares: float
     cost_basis: float = 0
     monthly_contribution: float = 0
 
 class DividendRequest(BaseModel):
-    tickers: List[str]
+    tickers: Tickers
 
 class ProjectionRequest(BaseModel):
     portfolio: List[PortfolioItem]
@@ -114,20 +356,22 @@ class ProjectionRequest(BaseModel):
 @app.post("/api/dividend_stats")
 def get_dividend_stats(req: DividendRequest):
     try:
+        warmup.record(req.tickers)
         stats = analysis.get_dividend_stats(req.tickers)
         return stats
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _server_error(e)
 
 @app.post("/api/project_income")
 def project_income(req: ProjectionRequest):
     try:
         # Convert Pydantic models to dicts for analysis function
         portfolio_dicts = [item.dict() for item in req.portfolio]
+        warmup.record(p['ticker'] for p in portfolio_dicts)
         result = analysis.project_income(portfolio_dicts)
         return result
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _server_error(e)
 
 @app.post("/api/simulate")
 def simulate_allocation(request: SimulationRequest):
@@ -135,106 +379,304 @@ def simulate_allocation(request: SimulationRequest):
         if len(request.tickers) != 2:
             raise HTTPException(status_code=400, detail="Please select exactly 2 tickers.")
         
-        if request.tickers[0] == request.tickers[1]:
+        if len(batcher.normalize_tickers(request.tickers)) != 2:
              raise HTTPException(status_code=400, detail="Please select two different tickers.")
              
-        print(f"Simulating for {request.tickers}")
+        log.info("Simulating for %s", request.tickers)
+        warmup.record(request.tickers)
+        key = _response_key("/api/simulate", request, request.tickers)
+        cached = cache.responses.get(key)
+        if cached is not None:
+            return cached
         # Fetch just these 2 to ensure we have aligned data
-        df_tr, _ = analysis.fetch_data(request.tickers, request.start_date, request.end_date)
+        tr_panel, _ = analysis.load_panels(request.tickers, request.start_date, request.end_date, request.align)
         
-        if df_tr.empty or df_tr.shape[1] < 2:
+        if tr_panel.empty or tr_panel.shape[1] < 2:
              raise HTTPException(status_code=404, detail="Insufficient data for simulation.")
              
-        daily_returns = df_tr.pct_change().dropna()
+        daily_returns = tr_panel.returns_frame()
         curve = analysis.calculate_allocation_curve(daily_returns)
         
-        return analysis.clean_nans({"curve": curve})
+        result = analysis.clean_nans({"curve": curve})
+        if not resilience.served_stale():
+            cache.responses.set(_response_key("/api/simulate", request, request.tickers), result)
+        return result
         
     except Exception as e:
-        print(f"Simulation Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("Simulation error: %s", e)
+        raise _server_error(e)
+
+def _analyze_view(tr_panel, pr_panel, max_points: Optional[int] = None, with_timeseries: bool = True):
+    """(metrics, allocation curve) of the analyze view; also used for saved portfolios."""
+    # 2. Calculate Basic Metrics (Using TR for stats)
+    # Check if TR and PR are identical (Debugging)
+    if not pr_panel.empty and tr_panel.shape == pr_panel.shape and np.array_equal(tr_panel.values, pr_panel.values):
+        log.warning("TR and PR panels are identical; no dividends in range or dividend events missing")
+        
+    metrics = analysis.calculate_metrics(tr_panel, pr_panel, max_points=max_points,
+                                         with_timeseries=with_timeseries)
+    
+    # 3. Allocation Curve (Default to first 2)
+    allocation_curve = []
+    if len(metrics['stats'].keys()) >= 2:
+        # Pass the daily returns of the *requested* tickers (or available ones)
+        # metrics['stats'] keys are the compiled valid tickers
+        valid_tickers = list(metrics['stats'].keys())
+        if len(valid_tickers) >= 2:
+             # We need daily returns for the curve. calculate_metrics returns it?
+             # No, I removed it from return dict in previous helper but it returns distinct 'daily_returns' key.
+             # Let's use that.
+             curve_returns = metrics['daily_returns'][[valid_tickers[0], valid_tickers[1]]]
+             allocation_curve = analysis.calculate_allocation_curve(curve_returns)
+        
+    # Remove raw dataframe from response
+    if 'daily_returns' in metrics:
+        del metrics['daily_returns']
+    return metrics, allocation_curve
+
+def _analyze_json(metrics, allocation_curve) -> dict:
+    return analysis.clean_nans({
+        "summary": metrics['stats'],
+        "risk": metrics['risk'],
+        "charts": {
+            "trend_tr": metrics['timeseries_tr'],
+            "trend_pr": metrics['timeseries_pr'],
+            "correlation": metrics['correlation'],
+            "allocation_curve": allocation_curve
+        }
+    })
 
 @app.post("/api/analyze")
-def analyze_portfolio(request: AnalyzeRequest):
+def analyze_portfolio(request: AnalyzeRequest, http: Request):
     try:
         # 1. Fetch Data
-        print(f"Fetching data for {request.tickers} from {request.start_date} to {request.end_date}")
-        df_tr, df_pr = analysis.fetch_data(request.tickers, request.start_date, request.end_date)
+        log.info("Fetching data for %s from %s to %s", request.tickers, request.start_date, request.end_date)
+        warmup.record(request.tickers)
+        as_arrow = arrow_ipc.wants_arrow(http)
+        key = _response_key("/api/analyze", request, request.tickers)
+        cached = None if as_arrow else cache.responses.get(key)
+        if cached is not None:
+            return cached
+        tr_panel, pr_panel = analysis.load_panels(request.tickers, request.start_date, request.end_date, request.align)
         
-        if df_tr.empty:
-            raise HTTPException(status_code=404, detail="No data found for the given tickers/dates.")
+        if tr_panel.empty:
+            raise _no_data(request.tickers, "No data found for the given tickers/dates.")
             
-        # 2. Calculate Basic Metrics (Using TR for stats)
-        # Check if TR and PR are identical (Debugging)
-        if not df_pr.empty and df_tr.equals(df_pr):
-            print("[WARNING] TR and PR DataFrames are identical! 'Adj Close' fetching might be failing.")
-            
-        metrics = analysis.calculate_metrics(df_tr, df_pr)
-        
-        # 3. Allocation Curve (Default to first 2)
-        allocation_curve = []
-        if len(metrics['stats'].keys()) >= 2:
-            # Pass the daily returns of the *requested* tickers (or available ones)
-            # metrics['stats'] keys are the compiled valid tickers
-            valid_tickers = list(metrics['stats'].keys())
-            if len(valid_tickers) >= 2:
-                 # We need daily returns for the curve. calculate_metrics returns it?
-                 # No, I removed it from return dict in previous helper but it returns distinct 'daily_returns' key.
-                 # Let's use that.
-                 curve_returns = metrics['daily_returns'][[valid_tickers[0], valid_tickers[1]]]
-                 allocation_curve = analysis.calculate_allocation_curve(curve_returns)
-            
-        # Remove raw dataframe from response
-        if 'daily_returns' in metrics:
-            del metrics['daily_returns']
+        metrics, allocation_curve = _analyze_view(tr_panel, pr_panel, request.max_points, with_timeseries=not as_arrow)
+
+        if as_arrow:
+            return arrow_ipc.response(_analyze_table(tr_panel, pr_panel, metrics, allocation_curve, request.max_points))
         
-        return analysis.clean_nans({
-            "summary": metrics['stats'],
-            "charts": {
-                "trend_tr": metrics['timeseries_tr'],
-                "trend_pr": metrics['timeseries_pr'],
-                "correlation": metrics['correlation'],
-                "allocation_curve": allocation_curve
-            }
-        })
+        result = _analyze_json(metrics, allocation_curve)
+        if not resilience.served_stale():
+            cache.responses.set(_response_key("/api/analyze", request, request.tickers), result)
+        return result
         
     except HTTPException as http_ex:
         raise http_ex
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        log.exception("Analyze error: %s", e)
+        raise _server_error(e)
+
+@app.post("/api/compare")
+def compare_portfolios(request: CompareRequest):
+    """Several weighted portfolios side by side, from one download of the union of their tickers."""
+    try:
+        names = [p.name or f"Portfolio {i + 1}" for i, p in enumerate(request.portfolios)]
+        if len(set(names)) != len(names):
+            raise HTTPException(status_code=400, detail="Portfolio names must be unique")
+        tickers = batcher.normalize_tickers(t for p in request.portfolios for t in p.weights)
+        log.info("Comparing %d portfolios over %s", len(names), tickers)
+        warmup.record(tickers)
+        key = _response_key("/api/compare", request, tickers)
+        cached = cache.responses.get(key)
+        if cached is not None:
+            return cached
+        tr_panel, pr_panel = analysis.load_panels(tickers, request.start_date, request.end_date, request.align)
+        if tr_panel.empty:
+            raise _no_data(tickers, "No data found for the given tickers/dates.")
+        comparison = analysis.compare_portfolios(tr_panel, pr_panel, [p.weights for p in request.portfolios], names,
+                                                 request.rebalance, request.max_points)
+        if not comparison:
+            raise HTTPException(status_code=404, detail="The portfolios' tickers have no common trading days.")
+        result = analysis.clean_nans({
+            "portfolios": names,
+            "weights": comparison["weights"],
+            "period": comparison["period"],
+            "summary": comparison["stats"],
+            "risk": comparison["risk"],
+            "charts": {
+                "trend_tr": comparison["timeseries_tr"],
+                "trend_pr": comparison["timeseries_pr"],
+                "drawdown": comparison["drawdowns"],
+                "correlation": comparison["correlation"],
+            },
+        })
+        if not resilience.served_stale():
+            cache.responses.set(_response_key("/api/compare", request, tickers), result)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Compare error: %s", e)
+        raise _server_error(e)
+
+@app.post("/api/risk")
+def tail_risk(request: RiskRequest):
+    try:
+        if any(not 0.5 <= c < 1 for c in request.confidence):
+            raise HTTPException(status_code=400, detail="Confidence levels must be in [0.5, 1).")
+        if any(not 1 <= h <= 252 for h in request.horizons):
+            raise HTTPException(status_code=400, detail="Horizons must be between 1 and 252 trading days.")
+        log.info("Tail risk for %s", request.tickers)
+        warmup.record(request.tickers)
+        tr_panel, _ = analysis.load_panels(request.tickers, request.start_date, request.end_date, request.align)
+        if tr_panel.empty:
+            raise _no_data(request.tickers, "No data found for the given tickers/dates.")
+        cloud = analysis.monte_carlo_portfolios(request.tickers, strategy=request.sampling) if request.cloud else None
+        result = analysis.calculate_risk(tr_panel, request.portfolios, cloud,
+                                         confidence=request.confidence, horizons=request.horizons,
+                                         methods=request.methods, n_paths=request.n_paths)
+        return analysis.clean_nans(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Risk error: %s", e)
+        raise _server_error(e)
+
+@app.post("/api/factors")
+def factor_analysis(request: FactorRequest):
+    try:
+        log.info("Factor regression for %s on %s", request.tickers, request.factors)
+        warmup.record(request.tickers)
+        result = analysis.calculate_factors(request.tickers, request.start_date, request.end_date, request.align,
+                                            list(dict.fromkeys(request.factors)), request.window, request.step,
+                                            request.period)
+        if not result or not result["regression"]:
+            raise _no_data(request.tickers, "No data found for the given tickers/dates.")
+        return analysis.clean_nans(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Factor error: %s", e)
+        raise _server_error(e)
+
+@app.post("/api/fundamentals/compare")
+def compare_fundamentals(request: FundamentalsRequest):
+    try:
+        log.info("Comparing fundamentals for %s", request.tickers)
+        warmup.record(request.tickers)
+        return analysis.clean_nans(analysis.compare_fundamentals(request.tickers, request.freq))
+    except Exception as e:
+        log.exception("Fundamentals error: %s", e)
+        raise _server_error(e)
+
+@app.get("/api/search")
+def search_symbols(q: str = Query(..., min_length=1, max_length=64), limit: int = Query(10, ge=1, le=50)):
+    """Ticker autocomplete: symbol and name prefixes, fuzzy matches for typos."""
+    index = symbols.get_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Symbol index is not built yet", headers={"Retry-After": "60"})
+    return {"query": q, "results": index.search(q, limit)}
 
 @app.get("/api/stock_details/{ticker}")
-def get_stock_details_endpoint(ticker: str):
+def get_stock_details_endpoint(ticker: Ticker):
     try:
+        warmup.record([ticker])
         details = analysis.get_stock_details(ticker)
         if not details:
-            raise HTTPException(status_code=404, detail="Ticker not found or data unavailable")
+            raise _no_data([ticker], "Ticker not found or data unavailable.")
         return details
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Detail Endpoint Error: {e}")
-        error_msg = str(e)
-        if "Rate limited" in error_msg or "Too Many Requests" in error_msg:
-             raise HTTPException(status_code=503, detail="External API Rate Limit. Please try again later.")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("Detail endpoint error: %s", e)
+        raise _server_error(e)
 
 @app.get("/api/technical/{ticker}")
-def get_technical_analysis_endpoint(ticker: str):
+def get_technical_analysis_endpoint(ticker: Ticker):
     try:
+        warmup.record([ticker])
         data = analysis.get_technical_analysis(ticker)
         if not data:
              raise HTTPException(status_code=404, detail="Analysis failed or no data")
         return analysis.clean_nans(data)
     except Exception as e:
-        print(f"Technical Endpoint Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("Technical endpoint error: %s", e)
+        raise _server_error(e)
+
+INTRADAY_INTERVALS = ("1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h")
+
+def _intraday_frame(ticker: str, period: str, interval: str) -> Optional[pd.DataFrame]:
+    """Bars from the intraday store as a yfinance-like OHLCV frame (None if nothing stored)."""
+    ticker = ticker.upper()
+    intraday.store.refresh(ticker)
+    days = 1 if period == "1d" else 5
+    last = intraday.store.last_ts(ticker)
+    if last is None:
+        return None
+    # Last N stored trading days
+    stored = [d for d in intraday.store.days(ticker) if d <= last // intraday.DAY][-days:]
+    bars = intraday.store.query(ticker, start=stored[0] * intraday.DAY, interval=interval.replace("60m", "1h"))
+    index = pd.to_datetime(bars["ts"], unit="s", utc=True).tz_convert(intraday.MARKET_TZ)
+    return pd.DataFrame({"Open": bars["open"], "High": bars["high"], "Low": bars["low"],
+                         "Close": bars["close"], "Volume": bars["volume"]}, index=index)
+
+@app.get("/api/intraday/{ticker}")
+def get_intraday_bars(ticker: Ticker, interval: str = "5m", start: Optional[str] = None, end: Optional[str] = None,
+                      since: Optional[int] = None):
+    """
+    Intraday OHLCV bars for [start, end), resampled from stored 1-minute bars.
+    start / end: dates or datetimes (UTC unless an offset is given).
+    since: epoch seconds of the newest bar the client already has; only that bar
+    (it may have been updated) and newer ones are returned.
+    """
+    try:
+        seconds = intraday.interval_seconds(interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if seconds % 60:
+        raise HTTPException(status_code=400, detail="Interval must be a whole number of minutes")
+    try:
+        ticker = ticker.upper()
+        warmup.record([ticker])
+        intraday.store.refresh(ticker)
+        if intraday.store.last_ts(ticker) is None:
+            raise HTTPException(status_code=404, detail="No intraday data found")
+        bars = intraday.store.query(
+            ticker,
+            start=intraday.to_epoch(start) if start else None,
+            end=intraday.to_epoch(end) if end else None,
+            interval=interval,
+            since=since,
+        )
+        return analysis.clean_nans({
+            "ticker": ticker,
+            "interval": interval,
+            "last_ts": int(bars["ts"][-1]) if len(bars) else since,
+            "bars": intraday.bars_to_records(bars),
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.error("Intraday error %s: %s", ticker, e)
+        raise _server_error(e)
+
+@app.websocket("/ws/quotes")
+async def live_quotes(websocket: WebSocket):
+    """
+    Live prices and RSI / MFI / Bollinger signals. Send {"action": "subscribe", "tickers": [...]}
+    (or "unsubscribe"); quotes arrive as {"type": "quote", ...} whenever they change (see live.py).
+    """
+    await live.serve(websocket)
 
 @app.get("/api/history/{ticker}")
-def get_price_history(ticker: str, period: str = "1y", interval: str = "1d"):
+def get_price_history(http: Request, ticker: Ticker, period: str = "1y", interval: str = "1d",
+                      max_points: Optional[int] = Query(None, ge=10), bars: bool = False):
     """
     Fetches historical price data.
+    max_points: downsample on the server (LTTB for the price line, OHLC buckets for bars).
+    bars: return OHLC bars instead of the adjusted close line.
     """
     try:
         # yfinance download
@@ -245,48 +687,251 @@ def get_price_history(ticker: str, period: str = "1y", interval: str = "1d"):
         valid_periods = ["1d", "5d", "1mo", "3mo", "6mo", "1y", "5y", "10y", "max"]
         if period not in valid_periods: period = "1y"
         
-        df = yf.download(ticker, period=period, interval=interval, progress=False, auto_adjust=False)
+        ticker = ticker.upper()
+        warmup.record([ticker])
+        if interval in INTRADAY_INTERVALS and period in ("1d", "5d"):
+            # Short intraday windows come from the local bar store (incremental upstream fetches)
+            frame = _intraday_frame(ticker, period, interval)
+        else:
+            df = provider.get_provider().download(ticker, period=period, interval=interval)
+            frame = batcher.split_download(df, [ticker]).get(ticker)
         
-        if df.empty:
+        if frame is None:
             raise HTTPException(status_code=404, detail="No history found")
             
+        if arrow_ipc.wants_arrow(http):
+            return arrow_ipc.response(_history_table(frame, bars))
+
         # Format for Recharts: [{ date: '...', price: 100 }, ...]
-        result = []
-        
-        # Single ticker download -> Columns are flat or MultiIndex?
-        # If single ticker 'AAPL', columns are Open, High, Low, Close, Adj Close, Volume
-        
-        # Check columns
-        if 'Adj Close' in df.columns:
-            col = 'Adj Close'
-        elif 'Close' in df.columns:
-            col = 'Close'
-        else:
-            col = None
-            
-        if col:
-            # Reindex to UTC to avoid timezone issues with serialization
-            # df.index = df.index.tz_convert(None) # Sometimes required
-            
-            for date, row in df.iterrows():
-                # Handling timezone
-                try:
-                    ts = date.strftime("%Y-%m-%d %H:%M") # Include time for intraday
-                except:
-                    ts = str(date)
-                    
-                val = row[col]
-                # Handle Scalar (if single value, yfinance can be weird)
-                if isinstance(val, pd.Series): val = val.iloc[0]
-                
-                if not pd.isna(val):
-                    result.append({"date": ts, "price": round(float(val), 2)})
-                    
-        return result
+        # Include time for intraday
+        labels = frame.index.strftime("%Y-%m-%d %H:%M").tolist()
+
+        if bars:
+            if not {'Open', 'High', 'Low', 'Close'}.issubset(frame.columns):
+                raise HTTPException(status_code=404, detail="No OHLC data found")
+            volume = frame['Volume'].to_numpy(dtype=float) if 'Volume' in frame.columns else None
+            return analysis.clean_nans(downsample.ohlc_buckets(
+                labels, frame['Open'].to_numpy(dtype=float), frame['High'].to_numpy(dtype=float),
+                frame['Low'].to_numpy(dtype=float), frame['Close'].to_numpy(dtype=float), volume, max_points))
+
+        col = 'Adj Close' if 'Adj Close' in frame.columns else 'Close'
+        prices = frame[col].to_numpy(dtype=float)
+        valid = ~np.isnan(prices)
+        labels = [l for l, ok in zip(labels, valid) if ok]
+        labels, prices = downsample.downsample_rows(labels, prices[valid], max_points)
+        return [{"date": d, "price": p} for d, p in zip(labels, np.round(prices, 2).tolist())]
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"History Error {ticker}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        log.error("History error %s: %s", ticker, e)
+        raise _server_error(e)
+
+# --- Saved portfolios ---
+# Stored in SQLite (see portfolios.py); their analytics are recomputed after the
+# nightly warm-up refresh when a constituent's data changed, and read back as is.
+
+class SavedPortfolioRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    holdings: List[PortfolioItem] = Field(..., min_length=1, max_length=100)
+    start_date: str = "2020-01-01"
+    # None = up to the latest close
+    end_date: Optional[str] = None
+    align: AlignMode = "outer_ffill"
+
+    def definition(self) -> Dict[str, Any]:
+        return {"holdings": [h.model_dump() for h in self.holdings], "start_date": self.start_date,
+                "end_date": self.end_date, "align": self.align}
+
+def _portfolio_analytics(portfolio: Dict[str, Any]) -> Dict[str, Any]:
+    """Dividend dashboard and analyze view of a saved portfolio, from the (just refreshed) price cache."""
+    tickers = portfolios.tickers_of(portfolio)
+    # Straight from the price cache: the panel / response caches may predate the refresh
+    df_tr, df_pr = analysis.fetch_data(tickers, portfolio["start_date"], portfolio["end_date"], portfolio["align"])
+    view = None
+    if not df_tr.empty:
+        view = _analyze_json(*_analyze_view(PricePanel.from_frame(df_tr), PricePanel.from_frame(df_pr)))
+    return analysis.clean_nans(jsonable_encoder({
+        "income": analysis.project_income(portfolio["holdings"]),
+        "dividend_stats": analysis.get_dividend_stats(tickers),
+        "analysis": view,
+    }))
+
+def _materialize_saved(refreshed: List[str]):
+    portfolios.get_store().materialize(_portfolio_analytics, refreshed)
+
+warmup.scheduler.pinned.append(lambda: portfolios.get_store().tickers())
+warmup.scheduler.on_refresh.append(_materialize_saved)
+
+@app.post("/api/portfolios", status_code=201)
+def create_portfolio(req: SavedPortfolioRequest):
+    warmup.record(h.ticker for h in req.holdings)
+    return portfolios.get_store().save(req.name, req.definition())
+
+@app.get("/api/portfolios")
+def list_portfolios():
+    return portfolios.get_store().list()
+
+@app.get("/api/portfolios/{portfolio_id}")
+def get_portfolio(portfolio_id: str):
+    portfolio = portfolios.get_store().get(portfolio_id)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return portfolio
+
+@app.put("/api/portfolios/{portfolio_id}")
+def update_portfolio(portfolio_id: str, req: SavedPortfolioRequest):
+    warmup.record(h.ticker for h in req.holdings)
+    portfolio = portfolios.get_store().save(req.name, req.definition(), portfolio_id)
+    if portfolio is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return portfolio
+
+@app.delete("/api/portfolios/{portfolio_id}", status_code=204)
+def delete_portfolio(portfolio_id: str):
+    if not portfolios.get_store().delete(portfolio_id):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+
+@app.get("/api/portfolios/{portfolio_id}/analytics")
+def portfolio_analytics(portfolio_id: str):
+    """Materialized analytics (one lookup); computed on the spot the first time after saving."""
+    store = portfolios.get_store()
+    body = store.analytics(portfolio_id)
+    if body is None:
+        portfolio = store.get(portfolio_id)
+        if portfolio is None:
+            raise HTTPException(status_code=404, detail="Portfolio not found")
+        try:
+            body = store.compute(portfolio, _portfolio_analytics)
+        except Exception as e:
+            log.error("Portfolio analytics error %s: %s", portfolio_id, e)
+            raise _server_error(e)
+    return Response(content=body, media_type="application/json")
+
+# --- Background Jobs ---
+# Heavy runs (multi-asset Monte Carlo, long backtests) can be submitted here
+# and polled instead of holding the HTTP request open.
+
+class JobRequest(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+
+def _run_simulate_multi(params: Dict[str, Any], job: jobs.Job):
+    req = SimulationRequest(**params)
+    result = analysis.simulate_multi_asset_monte_carlo(req.tickers, progress=job.report, strategy=req.sampling)
+    return analysis.clean_nans({"simulation": result})
+
+def _run_analyze(params: Dict[str, Any], job: jobs.Job):
+    job.report(0.0)
+    return analyze_portfolio(AnalyzeRequest(**params), None)
+
+def _run_simulate(params: Dict[str, Any], job: jobs.Job):
+    job.report(0.0)
+    return simulate_allocation(SimulationRequest(**params))
+
+JOB_RUNNERS = {
+    "simulate_multi": _run_simulate_multi,
+    "analyze": _run_analyze,
+    "simulate": _run_simulate,
+}
+
+def _get_job_or_404(job_id: str) -> jobs.Job:
+    job = jobs.queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.post("/api/jobs", status_code=202)
+def submit_job(req: JobRequest):
+    runner = JOB_RUNNERS.get(req.kind)
+    if runner is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind. Use one of {list(JOB_RUNNERS)}")
+    try:
+        job = jobs.queue.submit(req.kind, runner, req.params)
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue is full: {e}")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}")
+def get_job_status(job_id: str):
+    return _get_job_or_404(job_id).to_dict()
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = _get_job_or_404(job_id)
+    if job.status == jobs.FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != jobs.DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = jobs.queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+def stream_job_events(job_id: str):
+    """Server-Sent Events stream of job status until the job finishes."""
+    job = _get_job_or_404(job_id)
+
+    def event_stream():
+        nonlocal job
+        last = None
+        while True:
+            # Re-read: a job run by another worker is a stored snapshot
+            job = jobs.queue.get(job_id) or job
+            state = job.to_dict()
+            if state != last:
+                yield f"data: {json.dumps(state)}\n\n"
+                last = state
+            if job.status in jobs.FINISHED_STATES:
+                break
+            time.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+# --- Metrics ---
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint (request / stage / upstream histograms, cache counters)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# --- Admin: request profiles ---
+
+def _require_admin(token: Optional[str]):
+    if not profiling.is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/api/admin/profiles", include_in_schema=False)
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    if not os.path.isdir(profiling.PROFILE_DIR):
+        return []
+    names = sorted(os.listdir(profiling.PROFILE_DIR), key=lambda n: os.path.getmtime(os.path.join(profiling.PROFILE_DIR, n)), reverse=True)
+    return [{"id": n.split(".")[0], "file": n} for n in names]
+
+@app.get("/api/admin/profiles/{profile_id}", include_in_schema=False)
+def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    path = profiling.find(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "application/json" if path.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+@app.get("/health", include_in_schema=False)
+def health():
+    """
+    Liveness / readiness probe; `preloaded` turns true once the background preload is done,
+    `upstream` is the circuit breaker state (closed / open / half_open).
+    """
+    return {"status": "ok", "preloaded": _preloaded.is_set(), "upstream": provider.breaker.state}
 
 if __name__ == "__main__":
+    # Development server with auto-reload; production runs serve.py
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
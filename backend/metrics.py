@@ -0,0 +1,255 @@
+"""
+Lightweight timing / counting instrumentation.
+
+- span(name): times one stage of a request (load_panels, calculate_metrics,
+  clean_nans, ...) into the app_stage_seconds histogram.
+- timed(name): the same as a function decorator.
+- upstream(call): times and counts one upstream (yfinance) call.
+- render(): all of it, plus the TTLCache hit / miss counters, in the
+  Prometheus text format (served at /metrics).
+
+With SERVER_TIMING=1 the spans of each request are also returned in a
+Server-Timing header, so browser dev tools show where the time went.
+With METRICS_ENABLED=0, span() returns a shared no-op context manager and
+timed() leaves the function undecorated.
+"""
+import bisect
+import contextlib
+import functools
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.responses import JSONResponse
+
+import cache
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {v:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics), one series per label set."""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, n) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += c
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {n}")
+        return lines
+
+
+REGISTRY: list = []
+
+requests = Histogram("http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status"))
+stages = Histogram("app_stage_seconds", "Time spent in each stage of a request.", ("stage",))
+upstream_calls = Counter("upstream_calls_total", "Upstream (yfinance) calls by outcome.", ("call", "outcome"))
+upstream_latency = Histogram("upstream_call_seconds", "Upstream (yfinance) call latency.", ("call",))
+
+# Spans of the current request, for the Server-Timing header (None outside a request)
+_request_spans: ContextVar[Optional[list]] = ContextVar("request_spans", default=None)
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stages.observe(elapsed, self.name)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.name, elapsed))
+        if log.isEnabledFor(logging.DEBUG):
+            ms = round(elapsed * 1000, 2)
+            log.debug("stage %s %.2f ms", self.name, ms, extra={"stage": self.name, "duration_ms": ms})
+        return False
+
+
+class _UpstreamCall(_Span):
+    __slots__ = ()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        upstream_latency.observe(elapsed, self.name)
+        upstream_calls.inc(self.name, "error" if exc_type else "ok")
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((f"upstream.{self.name}", elapsed))
+        return False
+
+
+_NOOP = contextlib.nullcontext()
+
+
+def span(name: str):
+    """`with metrics.span("calculate_metrics"): ...`"""
+    return _Span(name) if ENABLED else _NOOP
+
+
+def upstream(call: str):
+    """`with metrics.upstream("download"): ...` around a yfinance call."""
+    return _UpstreamCall(call) if ENABLED else _NOOP
+
+
+def timed(name: str):
+    """Decorator version of span()."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse whose encoding shows up as the 'render' stage."""
+
+    def render(self, content) -> bytes:
+        with span("render"):
+            return super().render(content)
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """'load_panels;dur=12.1, calculate_metrics;dur=30.4, total;dur=45.0' (repeated stages summed)."""
+    durations: Dict[str, float] = {}
+    for name, elapsed in spans:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    durations["total"] = total
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations.items())
+
+
+def _cache_lines() -> List[str]:
+    lines = []
+    for metric, help, attr in (("cache_hits_total", "Cache hits.", "hits"),
+                               ("cache_misses_total", "Cache misses.", "misses"),
+                               ("cache_entries", "Entries currently cached.", None)):
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {'gauge' if attr is None else 'counter'}"]
+        for c in cache.ALL_CACHES:
+            value = len(c) if attr is None else getattr(c, attr)
+            lines.append(f"{metric}{_labels(('cache',), (c.name,))} {value}")
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.expose()
+    lines += _cache_lines()
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency, and the Server-Timing header when SERVER_TIMING=1."""
+
+    def __init__(self, app, server_timing_header: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        spans: list = []
+        token = _request_spans.set(spans)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_header:
+                    header = server_timing(spans, time.perf_counter() - start)
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_spans.reset(token)
+            route = scope.get("route")
+            # Route templates (/api/history/{ticker}), not raw paths, to keep label cardinality bounded
+            requests.observe(time.perf_counter() - start, scope["method"], getattr(route, "path", "unmatched"), str(status))
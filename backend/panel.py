@@ -0,0 +1,180 @@
+"""
+Compact price panel shared by the analytics functions.
+
+One aligned date axis stored as int32 day numbers (days since 1970-01-01) and
+one T x N price matrix in Fortran order, so every ticker column is a
+contiguous, zero-copy view. Derived matrices (returns, running max, drawdown)
+are computed lazily once per panel and reused by every endpoint that shares it.
+
+Panels may contain NaNs (see align_frame): a ticker listed later than the
+others, or a holiday on one exchange only. Derived matrices and statistics are
+NaN-aware so each series / pair uses its maximal valid history.
+"""
+import os
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DTYPE = np.dtype(os.getenv("PANEL_DTYPE", "float64"))
+
+# inner:       only dates where every ticker traded (the old global dropna)
+# outer_ffill: union of dates, gaps forward-filled (leading NaN before inception kept)
+# pairwise:    union of dates, no filling; statistics use each series' / pair's valid rows
+ALIGN_MODES = ("inner", "outer_ffill", "pairwise")
+
+
+def align_frame(df: pd.DataFrame, mode: str = "inner") -> pd.DataFrame:
+    """Aligns an outer-joined price frame (one column per ticker) according to `mode`."""
+    if mode == "inner":
+        return df.dropna()
+    if mode == "outer_ffill":
+        return df.ffill().dropna(how="all")
+    if mode == "pairwise":
+        return df.dropna(how="all")
+    raise ValueError(f"Unknown alignment mode: {mode}. Use one of {ALIGN_MODES}")
+
+
+def first_valid(values: np.ndarray) -> np.ndarray:
+    """Row index of each column's first non-NaN value (0 for all-NaN columns)."""
+    return np.argmax(~np.isnan(values), axis=0)
+
+
+def last_valid(values: np.ndarray) -> np.ndarray:
+    """Row index of each column's last non-NaN value."""
+    return values.shape[0] - 1 - np.argmax(~np.isnan(values[::-1]), axis=0)
+
+
+def ffill(values: np.ndarray) -> np.ndarray:
+    """Column-wise forward fill of a 2-D array (vectorized, no pandas round trip)."""
+    valid = ~np.isnan(values)
+    if valid.all():
+        return values
+    rows = np.where(valid, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = values[rows, np.arange(values.shape[1])]
+    # Before the first valid value there is nothing to carry forward
+    filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+    return filled
+
+
+def nan_corr(returns: np.ndarray) -> np.ndarray:
+    """
+    Pairwise-complete correlation matrix (same as DataFrame.corr()), computed with
+    masked matrix products: every pair uses all rows where both series are valid.
+    """
+    mask = (~np.isnan(returns)).astype(returns.dtype)
+    x = np.where(mask > 0, returns, 0)
+    n = mask.T @ mask
+    sum_x = x.T @ mask                # sum of x_i over rows where j is valid too
+    sum_xx = (x * x).T @ mask
+    sum_xy = x.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var_i = sum_xx - sum_x ** 2 / n
+        corr = cov / np.sqrt(var_i * var_i.T)
+    corr[n < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+class PricePanel:
+    def __init__(self, days: np.ndarray, values: np.ndarray, tickers: Sequence[str]):
+        self.days = np.ascontiguousarray(days, dtype=np.int32)
+        self.values = np.asfortranarray(values)
+        self.tickers: List[str] = list(tickers)
+        self._index = {t: i for i, t in enumerate(self.tickers)}
+        self._lazy: Dict[str, np.ndarray] = {}
+        self._labels = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, dtype=None) -> "PricePanel":
+        index = df.index
+        if getattr(index, "tz", None) is not None:
+            index = index.tz_localize(None)
+        days = index.values.astype("datetime64[D]").astype(np.int32)
+        values = np.asfortranarray(df.to_numpy(dtype=dtype or DEFAULT_DTYPE))
+        return cls(days, values, [str(c) for c in df.columns])
+
+    @property
+    def empty(self) -> bool:
+        return self.values.size == 0
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.days.nbytes + self.values.nbytes + sum(a.nbytes for a in self._lazy.values())
+
+    def column(self, ticker: str) -> np.ndarray:
+        """Zero-copy view of one ticker's prices."""
+        return self.values[:, self._index[ticker]]
+
+    def _cached(self, name: str, compute) -> np.ndarray:
+        arr = self._lazy.get(name)
+        if arr is None:
+            arr = compute()
+            if arr is not self.values:
+                arr.flags.writeable = False
+            self._lazy[name] = arr
+        return arr
+
+    @property
+    def has_gaps(self) -> bool:
+        return bool(np.isnan(self.values).any())
+
+    @property
+    def filled(self) -> np.ndarray:
+        """Prices forward-filled over gaps (same object as values when there are none)."""
+        return self._cached("filled", lambda: ffill(self.values))
+
+    @property
+    def returns(self) -> np.ndarray:
+        """
+        (T-1) x N simple daily returns. Across a gap the return is taken against the
+        last valid price; rows where the ticker has no price are NaN.
+        """
+        return self._cached("returns", lambda: np.asfortranarray(self.values[1:] / self.filled[:-1] - 1))
+
+    @property
+    def running_max(self) -> np.ndarray:
+        return self._cached("running_max", lambda: np.fmax.accumulate(self.values, axis=0))
+
+    @property
+    def base(self) -> np.ndarray:
+        """Each ticker's first valid price (start of its own history)."""
+        return self.values[first_valid(self.values), np.arange(self.values.shape[1])]
+
+    @property
+    def drawdown(self) -> np.ndarray:
+        """Fraction below the running peak (<= 0)."""
+        return self._cached("drawdown", lambda: self.values / self.running_max - 1)
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.days.astype("datetime64[D]").astype("datetime64[ns]"))
+
+    @property
+    def date_labels(self) -> List[str]:
+        """'YYYY-MM-DD' strings for the date axis, built once per panel."""
+        if self._labels is None:
+            self._labels = self.days.astype("datetime64[D]").astype(str).tolist()
+        return self._labels
+
+    def returns_frame(self) -> pd.DataFrame:
+        """Daily returns as a DataFrame wrapping the cached matrix (no copy)."""
+        return pd.DataFrame(self.returns, index=self.dates[1:], columns=self.tickers, copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.values, index=self.dates, columns=self.tickers, copy=False)
+
+
+def to_records(labels: Sequence[str], tickers: Sequence[str], matrix: np.ndarray, decimals: int = 2) -> List[Dict]:
+    """
+    Formats a T x N matrix as Recharts rows: [{date, <ticker>: value, ...}, ...].
+    Rounds the whole matrix once instead of per cell.
+    """
+    rows = np.round(matrix, decimals).tolist()
+    keys = ["date", *tickers]
+    return [dict(zip(keys, (label, *row))) for label, row in zip(labels, rows)]
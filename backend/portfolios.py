@@ -0,0 +1,228 @@
+"""
+Saved portfolios and their materialized analytics.
+
+Portfolios (name, holdings, analysis window) live in a local SQLite file next
+to the other stores, with the holdings' tickers in a (ticker, portfolio) table
+so the portfolios touched by a data refresh are found with one indexed query.
+
+Their analytics (income projection, dividend stats, the analyze view) are
+computed by a callback supplied by the API and stored as finished JSON,
+together with a hash of the definition and the data version of every
+constituent (analysis.data_versions) they were computed from. materialize()
+runs after each warm-up refresh and recomputes only the portfolios whose
+definition or constituent data changed; a read is one primary-key lookup
+that returns the stored JSON as is.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import analysis
+import batcher
+import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "portfolios.sqlite")
+
+# Bump when the shape of the stored analytics changes, so everything is recomputed once
+ANALYTICS_VERSION = 1
+
+materialized = metrics.Counter("portfolio_analytics_total", "Saved portfolio analytics by outcome.", ("outcome",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS portfolios (
+    id         TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    definition TEXT NOT NULL,
+    created    REAL NOT NULL,
+    updated    REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS holdings (
+    ticker       TEXT NOT NULL,
+    portfolio_id TEXT NOT NULL,
+    PRIMARY KEY (ticker, portfolio_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS analytics (
+    portfolio_id TEXT PRIMARY KEY,
+    definition   TEXT NOT NULL,
+    versions     TEXT NOT NULL,
+    computed     REAL NOT NULL,
+    body         TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+Compute = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def tickers_of(portfolio: Dict[str, Any]) -> List[str]:
+    return batcher.normalize_tickers(h["ticker"] for h in portfolio["holdings"])
+
+
+def _definition_hash(portfolio: Dict[str, Any]) -> str:
+    fields = {k: portfolio[k] for k in ("holdings", "start_date", "end_date", "align")}
+    text = json.dumps({"v": ANALYTICS_VERSION, **fields}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class PortfolioStore:
+    def __init__(self, path: str = DEFAULT_PATH, timer=time.time):
+        self.path = path
+        self._timer = timer
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread and process; the file and schema are created on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _record(row) -> Dict[str, Any]:
+        id_, name, definition, created, updated = row
+        return {"id": id_, "name": name, **json.loads(definition), "created": created, "updated": updated}
+
+    def save(self, name: str, definition: Dict[str, Any], portfolio_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Creates a portfolio (or replaces the one with portfolio_id; None if there is none).
+        definition: {holdings: [{ticker, shares, ...}], start_date, end_date, align}.
+        """
+        conn = self._conn()
+        now = self._timer()
+        text = json.dumps(definition)
+        with conn:
+            conn.execute("BEGIN")
+            if portfolio_id is None:
+                portfolio_id = uuid.uuid4().hex
+                conn.execute("INSERT INTO portfolios (id, name, definition, created, updated) VALUES (?, ?, ?, ?, ?)",
+                             (portfolio_id, name, text, now, now))
+            elif conn.execute("UPDATE portfolios SET name = ?, definition = ?, updated = ? WHERE id = ?",
+                              (name, text, now, portfolio_id)).rowcount == 0:
+                return None
+            conn.execute("DELETE FROM holdings WHERE portfolio_id = ?", (portfolio_id,))
+            conn.execute("DELETE FROM analytics WHERE portfolio_id = ?", (portfolio_id,))
+            conn.executemany("INSERT INTO holdings (ticker, portfolio_id) VALUES (?, ?)",
+                             [(t, portfolio_id) for t in tickers_of(definition)])
+        return self.get(portfolio_id)
+
+    def get(self, portfolio_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT id, name, definition, created, updated FROM portfolios WHERE id = ?",
+                                   (portfolio_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT id, name, definition, created, updated FROM portfolios ORDER BY created")
+        return [self._record(row) for row in rows]
+
+    def delete(self, portfolio_id: str) -> bool:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            deleted = conn.execute("DELETE FROM portfolios WHERE id = ?", (portfolio_id,)).rowcount
+            conn.execute("DELETE FROM holdings WHERE portfolio_id = ?", (portfolio_id,))
+            conn.execute("DELETE FROM analytics WHERE portfolio_id = ?", (portfolio_id,))
+        return deleted > 0
+
+    def holding_any(self, tickers: Sequence[str]) -> List[str]:
+        """Ids of the portfolios holding any of the tickers."""
+        tickers = batcher.normalize_tickers(tickers)
+        if not tickers:
+            return []
+        rows = self._conn().execute(
+            f"SELECT DISTINCT portfolio_id FROM holdings WHERE ticker IN ({','.join('?' * len(tickers))})", tickers)
+        return [row[0] for row in rows]
+
+    def tickers(self) -> List[str]:
+        """Every ticker held by a saved portfolio."""
+        return [row[0] for row in self._conn().execute("SELECT DISTINCT ticker FROM holdings")]
+
+    def analytics(self, portfolio_id: str) -> Optional[str]:
+        """The stored analytics JSON of a portfolio, or None if not materialized yet."""
+        row = self._conn().execute("SELECT body FROM analytics WHERE portfolio_id = ?", (portfolio_id,)).fetchone()
+        return row[0] if row else None
+
+    def outdated(self, portfolio: Dict[str, Any]) -> bool:
+        """
+        True if the portfolio was never materialized, its definition changed, or a constituent's
+        cached data differs from what it was computed from. Tickers with nothing cached count as
+        unchanged: a refresh always leaves its tickers in the cache.
+        """
+        row = self._conn().execute("SELECT definition, versions FROM analytics WHERE portfolio_id = ?",
+                                   (portfolio["id"],)).fetchone()
+        if row is None or row[0] != _definition_hash(portfolio):
+            return True
+        stored = json.loads(row[1])
+        return any(v is not None and v != stored.get(t) for t, v in analysis.data_versions(tickers_of(portfolio)).items())
+
+    def compute(self, portfolio: Dict[str, Any], compute: Compute) -> str:
+        """
+        Computes and stores a portfolio's analytics; returns the JSON. Nothing is stored if the
+        portfolio was saved again or deleted meanwhile, so a slow run cannot overwrite newer results.
+        """
+        result = compute(portfolio)
+        now = self._timer()
+        # Versions after computing: the computation itself loads whatever was not cached
+        versions = analysis.data_versions(tickers_of(portfolio))
+        body = json.dumps({"id": portfolio["id"], "name": portfolio["name"], "computed": now, **result})
+        stored = self._conn().execute(
+            "INSERT OR REPLACE INTO analytics (portfolio_id, definition, versions, computed, body) "
+            "SELECT ?, ?, ?, ?, ? FROM portfolios WHERE id = ? AND updated = ?",
+            (portfolio["id"], _definition_hash(portfolio), json.dumps(versions), now, body,
+             portfolio["id"], portfolio["updated"])).rowcount
+        if not stored:
+            log.info("Portfolio %s changed while its analytics were computed; result not stored", portfolio["id"])
+        return body
+
+    @metrics.timed("portfolio_materialize")
+    def materialize(self, compute: Compute, tickers: Optional[Sequence[str]] = None) -> Dict[str, List[str]]:
+        """
+        Recomputes the outdated analytics of the portfolios holding any of `tickers` (all
+        portfolios if None). Returns {"computed": ids, "unchanged": ids, "failed": ids}.
+        """
+        ids = self.holding_any(tickers) if tickers is not None else [p["id"] for p in self.list()]
+        done: Dict[str, List[str]] = {"computed": [], "unchanged": [], "failed": []}
+        for portfolio_id in ids:
+            portfolio = self.get(portfolio_id)
+            if portfolio is None:
+                continue
+            if not self.outdated(portfolio):
+                done["unchanged"].append(portfolio_id)
+                continue
+            try:
+                self.compute(portfolio, compute)
+                done["computed"].append(portfolio_id)
+            except Exception as e:
+                log.warning("Materializing portfolio %s failed: %s", portfolio_id, e)
+                done["failed"].append(portfolio_id)
+        for outcome, done_ids in done.items():
+            materialized.inc(outcome, amount=len(done_ids))
+        if ids:
+            log.info("Saved portfolios materialized: %d computed, %d unchanged, %d failed",
+                     len(done["computed"]), len(done["unchanged"]), len(done["failed"]))
+        return done
+
+
+_store: Optional[PortfolioStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PortfolioStore:
+    """The process-wide store (PORTFOLIOS_PATH), created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PortfolioStore(os.getenv("PORTFOLIOS_PATH", DEFAULT_PATH))
+    return _store
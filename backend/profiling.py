@@ -0,0 +1,255 @@
+"""
+On-demand request profiling.
+
+A request carrying `X-Admin-Token: <ADMIN_TOKEN>` and `X-Profile: collapsed`
+(or `speedscope`) runs under a wall-clock sampling profiler. The response is
+returned as usual with an `X-Profile-Id` header; the profile is saved under
+PROFILE_DIR and served by GET /api/admin/profiles/{id}. Nothing can be
+profiled while ADMIN_TOKEN is unset.
+
+The sampler reads the handler thread's stack (sys._current_frames) every
+PROFILE_INTERVAL seconds and weights each sample by the wall time since the
+previous one, so time blocked on yfinance sockets shows up under the
+socket / ssl frames next to analysis.py and pandas frames. Two kinds of
+stacks are kept, each trimmed to start at its anchor:
+- the routed endpoint, on the threadpool worker that runs it for this request
+  only (ProfiledRoute records that thread; other requests running the same
+  endpoint concurrently are not sampled);
+- the profiled request's middleware coroutine on the event loop thread, which
+  covers body parsing, response serialization and rendering.
+
+Output formats:
+- collapsed: Brendan Gregg's folded stacks ("a;b;c <microseconds>"), for
+  flamegraph.pl / speedscope / inferno.
+- speedscope: https://www.speedscope.app/file-format-schema.json ("sampled").
+"""
+import contextvars
+import functools
+import hmac
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "profiles"))
+INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+FORMATS = {"collapsed": ".txt", "speedscope": ".speedscope.json"}
+
+log = logging.getLogger(__name__)
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def _short_path(path: str) -> str:
+    """'/.../site-packages/pandas/core/frame.py' -> 'pandas/core/frame.py'; backend files by name."""
+    for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    if path.startswith(os.path.dirname(os.path.abspath(__file__))):
+        return os.path.basename(path)
+    return path
+
+
+class Target:
+    """The thread running the profiled request's endpoint and the endpoint's code, once it started."""
+
+    def __init__(self):
+        self.ident: Optional[int] = None
+        self.code = None
+
+
+# Set by the middleware for the profiled request; contextvars follow it into the threadpool
+_target: contextvars.ContextVar[Optional[Target]] = contextvars.ContextVar("profile_target", default=None)
+
+
+class ProfiledRoute(APIRoute):
+    """Route whose sync endpoint records its worker thread in the profiled request's Target."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            endpoint = self._recording(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _recording(endpoint):
+        @functools.wraps(endpoint)
+        def call(*args, **kwargs):
+            target = _target.get()
+            if target is not None:
+                target.code, target.ident = endpoint.__code__, threading.get_ident()
+            return endpoint(*args, **kwargs)
+        return call
+
+
+class Sampler:
+    """
+    Samples stacks that pass through one of the anchor code objects until stop(). Once the
+    target's endpoint started, its thread is also sampled from the endpoint down.
+    """
+
+    def __init__(self, anchors, target: Optional[Target] = None, interval: float = INTERVAL):
+        self._anchors = set(anchors)
+        self._target = target or Target()
+        self.interval = interval
+        self.samples: Dict[Tuple[Frame, ...], float] = {}
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._paths: Dict[str, str] = {}
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _frames(self, frame, anchors) -> Optional[Tuple[Frame, ...]]:
+        """Root-first stack up to the outermost anchor, or None if no anchor is on it."""
+        stack, depth = [], 0
+        while frame is not None:
+            c = frame.f_code
+            path = self._paths.get(c.co_filename)
+            if path is None:
+                path = self._paths[c.co_filename] = _short_path(c.co_filename)
+            stack.append((c.co_name, path, c.co_firstlineno))
+            if c in anchors:
+                depth = len(stack)
+            frame = frame.f_back
+        return tuple(reversed(stack[:depth])) if depth else None
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            worker, code = self._target.ident, self._target.code
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = self._frames(frame, self._anchors | {code} if ident == worker else self._anchors)
+                if stack:
+                    self.samples[stack] = self.samples.get(stack, 0.0) + weight
+
+
+def _label(frame: Frame) -> str:
+    name, path, line = frame
+    return f"{name} ({path}:{line})"
+
+
+def collapsed(samples: Dict[Tuple[Frame, ...], float]) -> str:
+    lines = [f"{';'.join(_label(f) for f in stack)} {int(round(weight * 1e6))}"
+             for stack, weight in sorted(samples.items(), key=lambda kv: -kv[1])]
+    return "\n".join(lines) + "\n"
+
+
+def speedscope(samples: Dict[Tuple[Frame, ...], float], name: str, duration: float) -> dict:
+    index: Dict[Frame, int] = {}
+    frames: List[dict] = []
+    stacks, weights = [], []
+    for stack, weight in samples.items():
+        ids = []
+        for f in stack:
+            if f not in index:
+                index[f] = len(frames)
+                frames.append({"name": f[0], "file": f[1], "line": f[2]})
+            ids.append(index[f])
+        stacks.append(ids)
+        weights.append(round(weight * 1e6))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "microseconds",
+            "startValue": 0,
+            "endValue": round(duration * 1e6),
+            "samples": stacks,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "investment-analyzer",
+    }
+
+
+def save(sampler: Sampler, fmt: str, name: str, profile_id: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, profile_id + FORMATS[fmt])
+    if fmt == "collapsed":
+        content = collapsed(sampler.samples)
+    else:
+        content = json.dumps(speedscope(sampler.samples, name, sampler.duration))
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def find(profile_id: str) -> Optional[str]:
+    """Path of a saved profile (ids are uuid hex, so nothing outside PROFILE_DIR matches)."""
+    if not profile_id.isalnum():
+        return None
+    for ext in FORMATS.values():
+        path = os.path.join(PROFILE_DIR, profile_id + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; profiles admin requests that ask for it (one at a time)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMIN_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        headers = {k: v.decode("latin-1") for k, v in scope.get("headers", []) if k in (b"x-profile", b"x-admin-token")}
+        fmt = headers.get(b"x-profile")
+        if fmt not in FORMATS or not is_admin(headers.get(b"x-admin-token")) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self._profiled(scope, receive, send, fmt)
+        finally:
+            self._busy.release()
+
+    async def _profiled(self, scope, receive, send, fmt: str):
+        profile_id = uuid.uuid4().hex
+        # This coroutine anchors the event-loop side of the request (only one is profiled at a time)
+        target = Target()
+        sampler = Sampler([ProfilingMiddleware._profiled.__code__], target)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        token = _target.set(target)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _target.reset(token)
+            path = save(sampler, fmt, f"{scope['method']} {scope['path']}", profile_id)
+            log.info("Profiled %s %s -> %s", scope["method"], scope["path"], path,
+                     extra={"profile_id": profile_id, "duration_ms": round(sampler.duration * 1000, 1)})
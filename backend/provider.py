@@ -0,0 +1,130 @@
+"""
+Upstream market data provider.
+All yfinance access for cached data goes through here so the source can be swapped
+(e.g. an offline provider when testing the warm-up scheduler).
+
+yfinance (which pulls in bs4, curl_cffi, ...) and requests are imported on first
+use, not at startup; preload() does that in the background once the app is up.
+
+get_provider() returns the provider behind the circuit breaker and token bucket
+(resilience.GuardedProvider); rate-limit answers surface as RateLimited.
+"""
+import contextlib
+import os
+import threading
+
+import pandas as pd
+
+import metrics
+import resilience
+
+
+def yfinance():
+    """The yfinance module, imported on first use."""
+    import yfinance
+    return yfinance
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Shared requests.Session for scraping (keeps connections alive); created on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                _session = requests.Session()
+                _session.headers["User-Agent"] = (
+                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                    "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+    return _session
+
+
+def preload():
+    """Imports the lazily loaded upstream modules and opens the HTTP session ahead of the first request."""
+    yfinance()
+    import bs4  # noqa: F401  (etfrc scraping)
+    http_session()
+
+
+def _is_rate_limit(error) -> bool:
+    text = str(error)
+    return "Too Many Requests" in text or "Rate limited" in text
+
+
+@contextlib.contextmanager
+def _rate_limits():
+    """Re-raises yfinance rate-limit errors as resilience.RateLimited."""
+    try:
+        yield
+    except Exception as e:
+        if type(e).__name__ == "YFRateLimitError" or _is_rate_limit(e):
+            raise resilience.RateLimited(str(e)) from e
+        raise
+
+
+class YFinanceProvider:
+    def download(self, tickers, **kwargs) -> pd.DataFrame:
+        """yf.download grouped by ticker; kwargs are passed through (start/end/period/interval/actions)."""
+        yf = yfinance()
+        with metrics.upstream("download"):
+            data = yf.download(tickers, progress=False, auto_adjust=False, group_by="ticker", **kwargs)
+        # yf.download reports per-ticker failures in shared._ERRORS instead of raising
+        errors = [e for e in yf.shared._ERRORS.values() if _is_rate_limit(e)]
+        if errors and (data is None or data.empty):
+            raise resilience.RateLimited(errors[0])
+        return data
+
+    def info(self, ticker: str) -> dict:
+        with metrics.upstream("info"), _rate_limits():
+            return yfinance().Ticker(ticker).info
+
+    def dividends(self, ticker: str) -> pd.Series:
+        with metrics.upstream("dividends"), _rate_limits():
+            return yfinance().Ticker(ticker).dividends
+
+    def statements(self, ticker: str, freq: str = "yearly") -> pd.DataFrame:
+        """Income statement, balance sheet and cash flow stacked (line items x period ends); freq 'yearly' / 'quarterly'."""
+        t = yfinance().Ticker(ticker)
+        frames = []
+        with metrics.upstream("statements"), _rate_limits():
+            for get in (t.get_income_stmt, t.get_balance_sheet, t.get_cash_flow):
+                frame = get(pretty=True, freq=freq)
+                if frame is not None and not frame.empty:
+                    frames.append(frame)
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames)
+        # A few items (e.g. Net Income) appear in several statements; keep the first
+        return data[~data.index.duplicated()]
+
+
+breaker = resilience.CircuitBreaker()
+breaker.on_close(resilience.revalidate_pending)
+bucket = resilience.TokenBucket(resilience.RATE, resilience.BURST)
+
+if os.getenv("UPSTREAM", "yfinance") == "fake":
+    import fake_provider
+    _provider = fake_provider.FakeProvider.from_env()
+else:
+    _provider = YFinanceProvider()
+_guarded = resilience.GuardedProvider(_provider, breaker, bucket)
+
+
+def get_provider():
+    return _guarded
+
+
+def set_provider(provider, guarded: bool = True):
+    """
+    Replaces the global provider (e.g. with a fake that injects failures). Returns the previous one.
+    guarded=False bypasses the breaker and rate limit (offline benchmarks).
+    """
+    global _provider, _guarded
+    previous = _provider
+    _provider = provider
+    _guarded = resilience.GuardedProvider(provider, breaker, bucket) if guarded else provider
+    return previous
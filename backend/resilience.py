@@ -0,0 +1,344 @@
+"""
+Upstream protection and stale-while-revalidate serving.
+
+Every provider call (provider.get_provider()) passes through a GuardedProvider:
+- a token bucket caps the call rate (UPSTREAM_RATE per second, bursts of
+  UPSTREAM_BURST); a call waits up to UPSTREAM_QUEUE_TIMEOUT for a token;
+- a circuit breaker opens after UPSTREAM_FAILURES consecutive failures (calls
+  slower than UPSTREAM_SLOW_CALL seconds count as failures) or at once when the
+  upstream reports rate limiting. While open, calls fail fast with
+  UpstreamUnavailable; after UPSTREAM_COOLDOWN seconds one probe call is let
+  through (half-open) and its outcome closes or re-opens the breaker.
+
+Caches keep expired entries for up to STALE_TTL (see TTLCache.get_stale). When
+an expired entry exists, load() / fetch_or_stale() give the upstream
+UPSTREAM_STALE_TIMEOUT seconds; if it fails or is slower than that, the stale
+value is served, the request is flagged (StaleMiddleware adds `Age` and
+`X-Data-Stale` headers) and the refresh completes in the background. Refreshes
+that failed are queued and re-run when the breaker closes again.
+"""
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import metrics
+
+RATE = float(os.getenv("UPSTREAM_RATE", "5"))
+BURST = int(os.getenv("UPSTREAM_BURST", "20"))
+QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "2"))
+FAILURES = int(os.getenv("UPSTREAM_FAILURES", "5"))
+COOLDOWN = float(os.getenv("UPSTREAM_COOLDOWN", "30"))
+SLOW_CALL = float(os.getenv("UPSTREAM_SLOW_CALL", "10"))
+STALE_TIMEOUT = float(os.getenv("UPSTREAM_STALE_TIMEOUT", "3"))
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+
+breaker_state = metrics.Counter("upstream_breaker_transitions_total", "Circuit breaker state changes.", ("state",))
+stale_served = metrics.Counter("stale_served_total", "Expired cache entries served while the upstream was unavailable.", ("cache",))
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream is not being called right now (breaker open or rate limit); retry after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimited(Exception):
+    """Raised by a provider when the upstream answered with a rate-limit error."""
+
+
+class TokenBucket:
+    """`rate` tokens per second, at most `burst` banked. rate <= 0 disables limiting."""
+
+    def __init__(self, rate: float, burst: int, timer: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._timer = timer
+        self._tokens = float(burst)
+        self._updated = timer()
+        self._lock = threading.Lock()
+
+    def _wait_time(self) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        with self._lock:
+            now = self._timer()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        if self.rate <= 0:
+            return True
+        deadline = self._timer() + timeout
+        while True:
+            wait = self._wait_time()
+            if wait == 0:
+                return True
+            if self._timer() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures: int = FAILURES, cooldown: float = COOLDOWN, slow_call: float = SLOW_CALL,
+                 timer: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.slow_call = slow_call
+        self._timer = timer
+        self._state = self.CLOSED
+        self._failed = 0
+        self._opened_at = 0.0
+        self._open_for = cooldown
+        self._probing = False
+        self._lock = threading.Lock()
+        self._on_close = []
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self._timer() - self._opened_at >= self._open_for:
+                self._transition(self.HALF_OPEN)
+            return self._state
+
+    def on_close(self, callback: Callable[[], None]):
+        """Registers a callback run (outside the lock) whenever the breaker closes after being open."""
+        self._on_close.append(callback)
+
+    def retry_after(self) -> float:
+        return max(0.0, self._open_for - (self._timer() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one probe at a time."""
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """Gives back a probe slot from allow() when the call was not made."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool, elapsed: float = 0.0):
+        ok = ok and elapsed < self.slow_call
+        closed = False
+        with self._lock:
+            self._probing = False
+            if ok:
+                self._failed = 0
+                if self._state != self.CLOSED:
+                    self._transition(self.CLOSED)
+                    closed = True
+            else:
+                self._failed += 1
+                if self._state == self.HALF_OPEN or self._failed >= self.failures:
+                    self._open(self.cooldown)
+        if closed:
+            for callback in self._on_close:
+                callback()
+
+    def trip(self, cooldown: Optional[float] = None):
+        """Opens the breaker at once (e.g. the upstream said 'Too Many Requests')."""
+        with self._lock:
+            self._probing = False
+            self._open(cooldown or self.cooldown)
+
+    def _open(self, cooldown: float):
+        self._opened_at = self._timer()
+        self._open_for = cooldown
+        if self._state != self.OPEN:
+            self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        log.warning("Upstream circuit breaker %s -> %s", self._state, state)
+        self._state = state
+        breaker_state.inc(state)
+
+
+class GuardedProvider:
+    """Wraps a provider (download / info / dividends / statements) with the breaker and the token bucket."""
+
+    def __init__(self, inner, breaker: CircuitBreaker, bucket: TokenBucket, queue_timeout: float = QUEUE_TIMEOUT):
+        self.inner = inner
+        self.breaker = breaker
+        self.bucket = bucket
+        self.queue_timeout = queue_timeout
+
+    def _call(self, fn: Callable, *args, **kwargs):
+        if not self.breaker.allow():
+            raise UpstreamUnavailable("Upstream unavailable (circuit open)", self.breaker.retry_after())
+        if not self.bucket.acquire(self.queue_timeout):
+            self.breaker.release()
+            raise UpstreamUnavailable("Upstream rate limit reached", 1 / self.bucket.rate)
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except RateLimited as e:
+            self.breaker.trip(2 * self.breaker.cooldown)
+            raise UpstreamUnavailable(f"Upstream rate limited: {e}", self.breaker.retry_after()) from e
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True, time.monotonic() - start)
+        return result
+
+    def download(self, tickers, **kwargs):
+        return self._call(self.inner.download, tickers, **kwargs)
+
+    def info(self, ticker: str):
+        return self._call(self.inner.info, ticker)
+
+    def dividends(self, ticker: str):
+        return self._call(self.inner.dividends, ticker)
+
+    def statements(self, ticker: str, freq: str = "yearly"):
+        return self._call(self.inner.statements, ticker, freq)
+
+
+# --- stale-while-revalidate ---
+
+# Ages (seconds) of the stale entries used by the current request (None outside a request)
+_stale_ages: ContextVar[Optional[list]] = ContextVar("stale_ages", default=None)
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="revalidate")
+_inflight: Dict[Hashable, concurrent.futures.Future] = {}
+_pending: Dict[Hashable, Callable[[], Any]] = {}
+_lock = threading.Lock()
+
+
+class Stale(Exception):
+    """fetch_or_stale(): the upstream failed or was too slow; the caller should serve its stale data."""
+
+
+def note_stale(cache_name: str, age: float):
+    stale_served.inc(cache_name)
+    ages = _stale_ages.get()
+    if ages is not None:
+        ages.append(age)
+
+
+def served_stale() -> bool:
+    """True if the current request used stale data (its results should not be cached)."""
+    return bool(_stale_ages.get())
+
+
+def _refresh(key: Hashable, fetch: Callable[[], Any]):
+    try:
+        return fetch()
+    except Exception:
+        with _lock:
+            _pending[key] = fetch
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+
+def fetch_or_stale(key: Hashable, fetch: Callable[[], Any], timeout: float = STALE_TIMEOUT):
+    """
+    Runs fetch() (which stores its own result) in the background, waiting up to `timeout`.
+    Raises Stale if it fails or takes longer; a failed fetch is retried when the breaker closes.
+    Concurrent callers for the same key share one fetch.
+    """
+    with _lock:
+        future = _inflight.get(key)
+        if future is None:
+            _pending.pop(key, None)
+            future = _inflight[key] = _executor.submit(_refresh, key, fetch)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        raise Stale()
+    except Exception as e:
+        log.info("Serving stale data for %s: %s", key, e)
+        raise Stale() from e
+
+
+def load(c, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None):
+    """
+    TTLCache.get_or_load with stale-while-revalidate: an expired entry is served
+    (and flagged) when the upstream fails or is slow to refresh it.
+    """
+    value = c.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    stale = c.get_stale(key)
+    if stale is None:
+        value = loader()
+        if value is not None:
+            c.set(key, value, ttl)
+        return value
+
+    def refresh():
+        fresh = loader()
+        if fresh is not None:
+            c.set(key, fresh, ttl)
+        return fresh
+
+    try:
+        value = fetch_or_stale((c.name, key), refresh)
+    except Stale:
+        value = None
+    if value is None:
+        value, age = stale
+        note_stale(c.name, age)
+    return value
+
+
+def revalidate_pending():
+    """Re-runs the refreshes that failed while the upstream was down (called when the breaker closes)."""
+    with _lock:
+        pending = list(_pending.items())
+        _pending.clear()
+    if pending:
+        log.info("Upstream recovered; revalidating %d stale entries", len(pending))
+    for key, fetch in pending:
+        with _lock:
+            if key in _inflight:
+                continue
+            _inflight[key] = _executor.submit(_refresh, key, fetch)
+
+
+class StaleMiddleware:
+    """ASGI middleware: flags responses built from stale data with `Age` and `X-Data-Stale: 1`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        ages: list = []
+        token = _stale_ages.set(ages)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and ages:
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"age", str(int(max(ages))).encode()),
+                    (b"x-data-stale", b"1"),
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stale_ages.reset(token)
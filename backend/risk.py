@@ -0,0 +1,208 @@
+"""
+Tail risk: Value at Risk and Conditional VaR (expected shortfall).
+
+Three estimators, each for several confidence levels and horizons (trading
+days), evaluated column-wise on a whole T x N return matrix at once - one
+column per ticker, or per portfolio (see portfolio_returns):
+
+- historical: empirical quantile of overlapping h-day returns;
+- cornish_fisher: normal quantile corrected for skew and excess kurtosis,
+  moments scaled to the horizon as for i.i.d. daily returns;
+- monte_carlo: h-day paths bootstrapped from the daily returns (keeps fat
+  tails; the same draws are used for every column, so portfolios are
+  compared on common random numbers).
+
+VaR and CVaR are reported as positive loss fractions (0.05 = a 5% loss).
+Quantiles use np.partition (a partial sort around the few tail ranks)
+instead of sorting every column. NaN rows (a ticker before its listing) are
+skipped per column.
+"""
+import os
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+CONFIDENCE = (0.95, 0.99)
+HORIZONS = (1, 10, 21)
+METHODS = ("historical", "cornish_fisher", "monte_carlo")
+N_PATHS = int(os.getenv("RISK_PATHS", "5000"))
+SEED = int(os.getenv("RISK_SEED", "0"))
+
+# Cells (paths x columns) gathered per Monte Carlo step; bounds memory for wide batches
+_MC_CELLS = 2_000_000
+
+
+def _pack(returns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Moves each column's valid values to the top (order kept); returns (packed, valid counts)."""
+    valid = ~np.isnan(returns)
+    counts = valid.sum(axis=0)
+    if counts.min(initial=len(returns)) == len(returns):
+        return returns, counts
+    order = np.argsort(~valid, axis=0, kind="stable")
+    return np.take_along_axis(returns, order, axis=0), counts
+
+
+def _tail(returns: np.ndarray, counts: np.ndarray, confidence: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (VaR, CVaR), each C x N, of the columns of `returns` whose first `counts` rows are
+    valid (NaNs below). One partition at the deepest tail rank, then only that
+    head (a few % of the rows) is sorted.
+    """
+    if len(returns) == 0:
+        nan = np.full((len(confidence), returns.shape[1]), np.nan)
+        return nan, nan.copy()
+    alpha = np.round(1 - np.asarray(confidence, dtype=float), 12)  # 1 - 0.95 is 0.0500...04
+    ranks = np.maximum(np.ceil(alpha[:, None] * counts[None, :]).astype(np.intp) - 1, 0)
+    deepest = int(ranks.max())
+    head = returns if deepest + 1 >= len(returns) else np.partition(returns, deepest, axis=0)[:deepest + 1]
+    head = np.sort(head, axis=0)
+    var = -np.take_along_axis(head, ranks, axis=0)
+    cvar = -np.take_along_axis(np.cumsum(head, axis=0), ranks, axis=0) / (ranks + 1)
+    empty = counts == 0
+    var[:, empty] = cvar[:, empty] = np.nan
+    return var, cvar
+
+
+def historical(returns: np.ndarray, confidence: Sequence[float] = CONFIDENCE,
+               horizons: Sequence[int] = HORIZONS) -> Tuple[np.ndarray, np.ndarray]:
+    """(VaR, CVaR), each C x H x N, from overlapping h-day compounded returns."""
+    packed, counts = _pack(returns)
+    cum = np.vstack([np.zeros((1, packed.shape[1])), np.cumsum(np.log1p(packed), axis=0)])
+    var = np.empty((len(confidence), len(horizons), packed.shape[1]))
+    cvar = np.empty_like(var)
+    for j, h in enumerate(horizons):
+        # A horizon longer than the history has no window: NaN (per column via the counts)
+        if h > packed.shape[0]:
+            var[:, j] = cvar[:, j] = np.nan
+            continue
+        windows = np.expm1(cum[h:] - cum[:-h])
+        var[:, j], cvar[:, j] = _tail(windows, np.maximum(counts - h + 1, 0), confidence)
+    return var, cvar
+
+
+def _cornish_fisher_z(z: np.ndarray, skew: np.ndarray, kurt: np.ndarray) -> np.ndarray:
+    return (z + (z ** 2 - 1) * skew / 6 + (z ** 3 - 3 * z) * kurt / 24
+            - (2 * z ** 3 - 5 * z) * skew ** 2 / 36)
+
+
+def cornish_fisher(returns: np.ndarray, confidence: Sequence[float] = CONFIDENCE,
+                   horizons: Sequence[int] = HORIZONS, grid: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (VaR, CVaR), each C x H x N, from the Cornish-Fisher expansion. CVaR averages the
+    adjusted quantile over `grid` points of the tail.
+    """
+    n = (~np.isnan(returns)).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(returns, axis=0) / n
+        dev = returns - mean
+        dev2 = dev * dev
+        m2 = np.nansum(dev2, axis=0) / n
+        skew = np.nansum(dev2 * dev, axis=0) / n / m2 ** 1.5
+        kurt = np.nansum(dev2 * dev2, axis=0) / n / (m2 * m2) - 3
+        std = np.sqrt(m2 * n / (n - 1))
+    normal = NormalDist()
+    var = np.empty((len(confidence), len(horizons), returns.shape[1]))
+    cvar = np.empty_like(var)
+    for i, c in enumerate(confidence):
+        alpha = 1 - c
+        q = normal.inv_cdf(alpha)
+        tail = np.array([normal.inv_cdf(alpha * (k + 0.5) / grid) for k in range(grid)])[:, None]
+        for j, h in enumerate(horizons):
+            s, k = skew / np.sqrt(h), kurt / h
+            var[i, j] = -(mean * h + std * np.sqrt(h) * _cornish_fisher_z(q, s, k))
+            cvar[i, j] = -(mean * h + std * np.sqrt(h) * _cornish_fisher_z(tail, s, k).mean(axis=0))
+    return var, cvar
+
+
+def monte_carlo(returns: np.ndarray, confidence: Sequence[float] = CONFIDENCE,
+                horizons: Sequence[int] = HORIZONS, n_paths: int = N_PATHS,
+                seed: int = SEED) -> Tuple[np.ndarray, np.ndarray]:
+    """(VaR, CVaR), each C x H x N, over n_paths bootstrapped paths per column."""
+    packed, counts = _pack(returns)
+    log_returns = np.log1p(packed)
+    steps = max(horizons)
+    draws = np.random.default_rng(seed).random((steps, n_paths))
+    n = packed.shape[1]
+    var = np.empty((len(confidence), len(horizons), n))
+    cvar = np.empty_like(var)
+    if packed.shape[0] == 0:
+        var[:] = cvar[:] = np.nan
+        return var, cvar
+    width = max(1, _MC_CELLS // n_paths)
+    for lo in range(0, n, width):
+        cols = slice(lo, min(lo + width, n))
+        block, block_counts = log_returns[:, cols], counts[cols]
+        total = np.zeros((n_paths, block.shape[1]))
+        path_counts = np.where(block_counts > 0, n_paths, 0)
+        same = bool((block_counts == block_counts[0]).all())
+        # Ragged histories: gather from the column-major block by flat index (row + column offset)
+        flat = None if same else np.asfortranarray(block).ravel(order="F")
+        offsets = np.arange(block.shape[1]) * block.shape[0]
+        for step in range(steps):
+            if same:
+                # Equal histories (portfolios, inner-aligned tickers): one row gather
+                total += block[(draws[step] * block_counts[0]).astype(np.intp)]
+            else:
+                rows = (draws[step][:, None] * block_counts).astype(np.intp)
+                rows += offsets
+                total += flat.take(rows)
+            if step + 1 in horizons:
+                j = horizons.index(step + 1)
+                var[:, j, cols], cvar[:, j, cols] = _tail(np.expm1(total), path_counts, confidence)
+    return var, cvar
+
+
+ESTIMATORS = {"historical": historical, "cornish_fisher": cornish_fisher, "monte_carlo": monte_carlo}
+
+
+@metrics.timed("tail_risk")
+def tail_risk(returns: np.ndarray, confidence: Sequence[float] = CONFIDENCE, horizons: Sequence[int] = HORIZONS,
+              methods: Sequence[str] = METHODS, n_paths: int = N_PATHS,
+              seed: int = SEED) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """{method: (VaR, CVaR)} for the columns of a T x N daily return matrix; arrays are C x H x N."""
+    horizons = sorted(set(int(h) for h in horizons))
+    result = {}
+    for method in methods:
+        if method == "monte_carlo":
+            result[method] = monte_carlo(returns, confidence, horizons, n_paths, seed)
+        else:
+            result[method] = ESTIMATORS[method](returns, confidence, horizons)
+    return result
+
+
+def portfolio_returns(returns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    T x K daily returns of K constant-weight (daily rebalanced) portfolios, weights K x N.
+    A portfolio's return is NaN on the rows where one of its own held assets has none, so
+    each portfolio keeps its full history (the estimators skip NaN rows per column).
+    """
+    weights = np.atleast_2d(weights)
+    missing = np.isnan(returns)
+    port = np.where(missing, 0.0, returns) @ weights.T
+    if missing.any():
+        port[(missing.astype(float) @ (weights != 0).T) > 0] = np.nan
+    return port
+
+
+def report(result: Dict[str, Tuple[np.ndarray, np.ndarray]], confidence: Sequence[float] = CONFIDENCE,
+           horizons: Sequence[int] = HORIZONS, decimals: int = 4) -> List[Dict[str, List[Dict]]]:
+    """One dict per column (ticker / portfolio): {method: [{confidence, horizon, var, cvar}, ...]}."""
+    horizons = sorted(set(int(h) for h in horizons))
+    n = next(iter(result.values()))[0].shape[2] if result else 0
+    out = [{} for _ in range(n)]
+    for method, (var, cvar) in result.items():
+        var, cvar = np.round(var, decimals), np.round(cvar, decimals)
+        for col in range(n):
+            out[col][method] = [
+                {"confidence": c, "horizon": h, "var": _num(var[i, j, col]), "cvar": _num(cvar[i, j, col])}
+                for i, c in enumerate(confidence) for j, h in enumerate(horizons)
+            ]
+    return out
+
+
+def _num(x) -> Optional[float]:
+    x = float(x)
+    return None if np.isnan(x) or np.isinf(x) else x
@@ -0,0 +1,163 @@
+"""
+Portfolio weight sampling for the Monte Carlo cloud (/api/simulate_multi).
+
+Normalizing uniform draws (the original approach, kept as "normalized") is
+not uniform on the simplex: the weights cluster around equal weight, so the
+edges of the frontier - concentrated portfolios - need many more samples.
+Strategies (STRATEGIES), each returning an n x k matrix of long-only weights
+summing to 1:
+
+- normalized: uniform(0, 1) draws divided by their sum;
+- dirichlet:  uniform on the simplex (Dirichlet(1, ..., 1));
+- sobol:      scrambled Sobol points mapped to the simplex by the same
+              exponential transform as the Dirichlet, so the cloud is spread
+              evenly with low discrepancy;
+- frontier:   adaptive sampling focused on the efficient frontier: a uniform
+              pilot (plus the single-asset corners), then rounds of Dirichlet
+              draws centred on points along the current non-dominated edge.
+              Needs the mean returns and covariance.
+
+frontier_error() measures how far a cloud's upper-left edge is from the
+exact long-only frontier (efficient_frontier); benchmarks/bench_sampling.py
+uses it to compare how many samples each strategy needs.
+"""
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+STRATEGIES = ("normalized", "dirichlet", "sobol", "frontier")
+DEFAULT = os.getenv("SAMPLING", "dirichlet")
+
+# frontier: share of the budget spent on the uniform pilot, refinement rounds and the
+# Dirichlet concentration around frontier points (higher = tighter)
+PILOT_SHARE = 0.25
+ROUNDS = 3
+CONCENTRATION = 50.0
+
+
+def _simplex(u: np.ndarray) -> np.ndarray:
+    """Maps points of the unit cube to the simplex (-log u are exponential, normalized -> Dirichlet(1))."""
+    e = -np.log(np.clip(u, 1e-12, 1.0))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def normalized(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    w = rng.random((n, k))
+    return w / w.sum(axis=1, keepdims=True)
+
+
+def dirichlet(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    return _simplex(rng.random((n, k)))
+
+
+def sobol(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    from scipy.stats import qmc
+    # Draw the next power of two (where the Sobol balance properties hold) and keep n
+    points = qmc.Sobol(d=k, scramble=True, rng=rng).random_base2(max(math.ceil(math.log2(max(n, 1))), 0))
+    return _simplex(points[:n])
+
+
+def risk_return(weights: np.ndarray, mean: np.ndarray, cov: np.ndarray):
+    """(return, risk) per weight row, in the units of mean / cov."""
+    returns = weights @ mean
+    risks = np.sqrt(np.maximum(np.einsum("ij,jk,ik->i", weights, cov, weights), 0.0))
+    return returns, risks
+
+
+def _edge(weights: np.ndarray, mean: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    """Rows on the cloud's upper-left edge (no other row has lower risk and higher return), by risk."""
+    returns, risks = risk_return(weights, mean, cov)
+    order = np.argsort(risks, kind="stable")
+    best = np.maximum.accumulate(returns[order])
+    keep = np.r_[True, returns[order][1:] > best[:-1]]
+    return weights[order[keep]]
+
+
+def _simplex_gamma(alpha: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """One Dirichlet draw per row of concentration parameters."""
+    g = rng.gamma(alpha)
+    return g / g.sum(axis=1, keepdims=True)
+
+
+def frontier(n: int, k: int, rng: np.random.Generator, mean: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    pilot = max(int(n * PILOT_SHARE), 1)
+    parts = [dirichlet(pilot, k, rng)]
+    if n >= 4 * k:
+        parts.insert(0, np.eye(k))
+    drawn = sum(len(p) for p in parts)
+    for r in range(ROUNDS):
+        size = (n - drawn) // (ROUNDS - r)
+        if size <= 0:
+            continue
+        edge = _edge(np.vstack(parts), mean, cov)
+        # Parents anywhere on the segments between neighbouring edge points
+        j = rng.integers(0, max(len(edge) - 1, 1), size)
+        t = rng.random((size, 1))
+        nxt = edge[np.minimum(j + 1, len(edge) - 1)]
+        parents = (1 - t) * edge[j] + t * nxt
+        parts.append(_simplex_gamma(CONCENTRATION * parents + 1.0 / k, rng))
+        drawn += size
+    return np.vstack(parts)[:n]
+
+
+def sample(strategy: str, n: int, k: int, mean: Optional[np.ndarray] = None, cov: Optional[np.ndarray] = None,
+           seed: Optional[int] = None) -> np.ndarray:
+    """n x k long-only weights (rows sum to 1) drawn with `strategy` (see STRATEGIES)."""
+    rng = np.random.default_rng(seed)
+    if strategy == "normalized":
+        return normalized(n, k, rng)
+    if strategy == "dirichlet":
+        return dirichlet(n, k, rng)
+    if strategy == "sobol":
+        return sobol(n, k, rng)
+    if strategy == "frontier":
+        if mean is None or cov is None:
+            raise ValueError("frontier sampling needs mean returns and covariance")
+        return frontier(n, k, rng, np.asarray(mean, dtype=float), np.asarray(cov, dtype=float))
+    raise ValueError(f"Unknown sampling strategy: {strategy}")
+
+
+def efficient_frontier(mean: np.ndarray, cov: np.ndarray, points: int = 25):
+    """
+    Exact long-only frontier: (target returns, minimum risk) from the minimum-variance
+    portfolio to 99% of the way to the best single asset (only that asset alone reaches
+    the very end), one SLSQP solve per target.
+    """
+    from scipy.optimize import minimize
+    k = len(mean)
+    bounds = [(0.0, 1.0)] * k
+    budget = {"type": "eq", "fun": lambda w: w.sum() - 1}
+
+    def min_risk(constraints, start):
+        res = minimize(lambda w: w @ cov @ w, start, jac=lambda w: 2 * cov @ w, method="SLSQP",
+                       bounds=bounds, constraints=constraints, options={"ftol": 1e-12, "maxiter": 500})
+        return res.x
+
+    w = min_risk([budget], np.full(k, 1.0 / k))
+    low, high = float(w @ mean), float(mean.max())
+    targets = np.linspace(low, low + 0.99 * (high - low), points)
+    risks = np.empty(points)
+    for i, target in enumerate(targets):
+        w = min_risk([budget, {"type": "ineq", "fun": lambda w, r=target: w @ mean - r}], w)
+        risks[i] = math.sqrt(max(float(w @ cov @ w), 0.0))
+    return targets, risks
+
+
+def frontier_error(weights: np.ndarray, mean: np.ndarray, cov: np.ndarray, targets: np.ndarray,
+                   risks: np.ndarray) -> float:
+    """
+    Mean relative risk gap between the cloud and the exact frontier: at each target return,
+    the lowest risk of any sampled portfolio returning at least that, vs the frontier's.
+    Targets no sample reaches count as a 100% gap.
+    """
+    returns, sampled = risk_return(weights, mean, cov)
+    order = np.argsort(returns)
+    # Lowest risk among portfolios with return >= target: suffix minimum over sorted returns
+    suffix = np.minimum.accumulate(sampled[order][::-1])[::-1]
+    pos = np.searchsorted(returns[order], targets)
+    gap = np.ones(len(targets))
+    ok = pos < len(order)
+    gap[ok] = np.minimum(suffix[pos[ok]] / risks[ok] - 1, 1.0)
+    return float(gap.mean())
@@ -0,0 +1,50 @@
+"""
+Production entry point: `python serve.py` (no auto-reload).
+
+Settings (environment):
+    HOST / PORT             bind address (0.0.0.0:8000)
+    WEB_CONCURRENCY         worker processes (1)
+    KEEP_ALIVE              idle keep-alive timeout in seconds (5)
+    GRACEFUL_TIMEOUT        seconds to finish in-flight requests on shutdown (30)
+    LIMIT_CONCURRENCY       max concurrent connections per worker before 503s (unlimited)
+    FORWARDED_ALLOW_IPS     proxies trusted for X-Forwarded-* (127.0.0.1)
+
+    SHARED_CACHE            1/0; cross-process cache (default: on when WEB_CONCURRENCY > 1)
+    SHARED_CACHE_PATH       its SQLite file (data/shared_cache.sqlite)
+    SHARED_CACHE_MAX_MB     size bound before least recently read entries go (512)
+    JOBS_PATH               SQLite file with background job states and results (data/jobs.sqlite)
+
+Each worker is a separate process. Prices, ticker info, dividends, panels,
+indicators and finished /api/analyze, /api/advanced and /api/simulate
+responses are shared between workers through shared_cache.py, so one
+worker's upstream fetch serves all of them. A background job runs on the
+worker that accepted it, but its status, progress and result are stored in
+JOBS_PATH (data/jobs.sqlite), so any worker answers /api/jobs requests for it.
+The warm-up scheduler is still per worker: every worker runs its own
+after-close refresh.
+"""
+import os
+
+import uvicorn
+
+
+def main():
+    limit = os.getenv("LIMIT_CONCURRENCY")
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        reload=False,
+        # One structured access line per request comes from logs.RequestIdMiddleware
+        access_log=False,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE", "5")),
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        limit_concurrency=int(limit) if limit else None,
+    )
+
+
+if __name__ == "__main__":
+    main()
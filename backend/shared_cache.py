@@ -0,0 +1,156 @@
+"""
+Cross-process cache store (second level behind the in-process TTLCaches).
+
+With several uvicorn workers on one host every worker would otherwise fetch
+and compute its own copy of everything. SharedStore keeps pickled entries in
+one SQLite file (WAL mode, so readers never block the writer) that all
+workers open:
+
+- writes are single transactions (INSERT OR REPLACE), so readers see either
+  the old or the new value, never a partial one;
+- entries carry an absolute (wall clock) expiry, shared by all processes;
+- the file is kept under max_bytes by evicting expired, then least recently
+  read entries (read times are only bumped once a minute per entry to keep
+  reads from turning into writes).
+
+Values are pickled: the file must only be writable by the service itself.
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key      TEXT PRIMARY KEY,
+    value    BLOB NOT NULL,
+    expires  REAL NOT NULL,
+    size     INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+class SharedStore:
+    def __init__(self, path: str, max_bytes: int = 512 * 2**20, evict_every: int = 50,
+                 timer=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._timer = timer
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (and per process: a forked child reconnects)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value and remaining ttl, as (value, ttl); default if missing or expired."""
+        now = self._timer()
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            log.warning("Shared cache read failed (%s): %s", key, e)
+            return default
+        if row is None or row[1] <= now:
+            return default
+        value, expires, accessed = row
+        if now - accessed > 60:
+            try:
+                self._conn().execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            except sqlite3.Error:
+                pass  # only the LRU order suffers
+        try:
+            return pickle.loads(value), expires - now
+        except Exception as e:
+            log.warning("Shared cache entry %s unreadable: %s", key, e)
+            return default
+
+    def set(self, key: str, value: Any, ttl: float):
+        now = self._timer()
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            log.debug("Shared cache skips unpicklable %s: %s", key, e)
+            return
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, now + ttl, len(blob), now))
+        except sqlite3.Error as e:
+            log.warning("Shared cache write failed (%s): %s", key, e)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def delete(self, key: str):
+        try:
+            self._conn().execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            log.warning("Shared cache delete failed (%s): %s", key, e)
+
+    def clear(self, prefix: str = ""):
+        """Removes all entries whose key starts with prefix (everything by default)."""
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        self._conn().execute("DELETE FROM entries WHERE key LIKE ? ESCAPE '\\'", (pattern,))
+
+    def evict(self):
+        """Drops expired entries, then least recently read ones until the store fits max_bytes."""
+        conn = self._conn()
+        try:
+            conn.execute("DELETE FROM entries WHERE expires <= ?", (self._timer(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            victims, freed = [], 0
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+            log.info("Shared cache evicted %d entries (%d bytes)", len(victims), freed)
+        except sqlite3.Error as e:
+            log.warning("Shared cache eviction failed: %s", e)
+
+    def stats(self):
+        entries, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": entries, "bytes": size}
+
+
+def _enabled() -> bool:
+    """SHARED_CACHE=1/0 forces it; by default it is on when running several workers."""
+    setting = os.getenv("SHARED_CACHE", "auto")
+    if setting == "auto":
+        return int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+    return setting == "1"
+
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "shared_cache.sqlite")
+
+store: Optional[SharedStore] = None
+if _enabled():
+    store = SharedStore(os.getenv("SHARED_CACHE_PATH", DEFAULT_PATH),
+                        max_bytes=int(float(os.getenv("SHARED_CACHE_MAX_MB", "512")) * 2**20))
@@ -0,0 +1,316 @@
+"""
+Local symbol index for ticker search and request validation.
+
+Built from the NASDAQ Trader symbol directory (every NASDAQ, NYSE, NYSE
+American, NYSE Arca and Cboe listing, stocks and ETFs) and stored as plain
+.npy arrays under SYMBOLS_DIR, opened memory-mapped - loading is instant and
+the pages are shared between worker processes:
+
+- symbols.npy: (symbol, name, exchange, kind) records sorted by symbol. A
+  prefix query is a range in this array found with two binary searches, the
+  flat equivalent of walking a prefix trie;
+- words.npy: (word, symbol index) for every word of every name, sorted by
+  word, for name prefixes ("berks" -> BRK-A, BRK-B);
+- grams.npy / offsets.npy / postings.npy: a trigram inverted index over
+  symbol and name (CSR layout) for fuzzy matches ("APPL" -> AAPL).
+
+Each build goes to a new version directory and CURRENT is switched
+atomically, so readers never see a half-written index. The index is rebuilt
+in the background when older than SYMBOLS_MAX_AGE_DAYS; run this file to
+build it by hand.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+import provider
+
+log = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("SYMBOLS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "symbols"))
+MAX_AGE = float(os.getenv("SYMBOLS_MAX_AGE_DAYS", "7")) * 86400
+# What requests with listed-looking tickers the index does not know get (see validate):
+# "suggest" lets them through (the index lags new listings and has no delisted or OTC
+# ones) and names them with suggestions if nothing is found, "reject" answers 422 with
+# the suggestions up front, "off" skips the check
+VALIDATE = os.getenv("SYMBOLS_VALIDATE", "suggest")
+VALIDATE = {"1": "reject", "0": "off"}.get(VALIDATE, VALIDATE)  # the former on/off values
+
+LISTINGS = {
+    "nasdaq": "https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt",
+    "other": "https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt",
+}
+EXCHANGES = {"A": "NYSE American", "N": "NYSE", "P": "NYSE Arca", "Z": "Cboe BZX", "V": "IEX"}
+
+RECORD = np.dtype([("symbol", "S12"), ("name", "S96"), ("exchange", "S16"), ("kind", "S5")])
+WORD = np.dtype([("word", "S24"), ("index", "<i4")])
+
+# Plain US listings (AAPL, BRK-B). Anything else - indices (^GSPC), foreign listings
+# (VOD.L), crypto (BTC-USD), mutual funds (VTSAX), OTC ADRs (TCEHY, NSRGF) - is not in
+# the directory and passes. Five-letter symbols pass too: the directory has NASDAQ ones
+# (GOOGL) but not the OTC ones, so a miss there proves nothing.
+_CHECKABLE = re.compile(r"[A-Z]{1,4}|[A-Z]{1,4}-[A-Z]")
+# Anything usable as a symbol at all; tickers also become path components (intraday store)
+_SYMBOL = re.compile(r"[A-Z0-9.^=-]{1,15}")
+
+
+def is_symbol(ticker: str) -> bool:
+    """Strict shape check of an uppercase ticker ('BRK-B', '^GSPC', 'VOD.L', 'EURUSD=X'; not '..')."""
+    return bool(_SYMBOL.fullmatch(ticker)) and ticker not in (".", "..")
+
+
+def _clean_name(name: str) -> str:
+    """'Apple Inc. - Common Stock' -> 'Apple Inc.'"""
+    return name.split(" - ")[0].strip()
+
+
+def _text(value: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", value.lower()).split())
+
+
+def trigrams(text: str) -> np.ndarray:
+    """Distinct trigram codes of the normalized text, padded so short words have grams too."""
+    data = f"  {_text(text)} ".encode()
+    if len(data) < 3:
+        return np.empty(0, dtype=np.int32)
+    b = np.frombuffer(data, dtype=np.uint8).astype(np.int32)
+    return np.unique((b[:-2] << 16) | (b[1:-1] << 8) | b[2:])
+
+
+def parse_listing(text: str, source: str) -> List[Tuple[str, str, str, str]]:
+    """Rows of a NASDAQ Trader directory file -> [(symbol, name, exchange, kind)], test issues skipped."""
+    lines = [line.split("|") for line in text.splitlines() if line and not line.startswith("File Creation Time")]
+    if not lines:
+        return []
+    header, rows = lines[0], lines[1:]
+    col = {name: i for i, name in enumerate(header)}
+    symbol_col = "Symbol" if source == "nasdaq" else "ACT Symbol"
+    out = []
+    for row in rows:
+        if len(row) != len(header) or row[col["Test Issue"]] == "Y":
+            continue
+        symbol = row[col[symbol_col]].strip()
+        if not symbol or "$" in symbol:  # preferred shares use $ (no yfinance equivalent here)
+            continue
+        exchange = "NASDAQ" if source == "nasdaq" else EXCHANGES.get(row[col["Exchange"]], row[col["Exchange"]])
+        kind = "ETF" if row[col["ETF"]] == "Y" else "Stock"
+        # Share classes: BRK.B in the directory, BRK-B at yfinance
+        out.append((symbol.replace(".", "-"), _clean_name(row[col["Security Name"]]), exchange, kind))
+    return out
+
+
+def download_listings() -> List[Tuple[str, str, str, str]]:
+    rows = []
+    for source, url in LISTINGS.items():
+        with metrics.upstream("symbol_directory"):
+            response = provider.http_session().get(url, timeout=30)
+        response.raise_for_status()
+        rows += parse_listing(response.text, source)
+    return rows
+
+
+def build(rows: Iterable[Tuple[str, str, str, str]], directory: str = DATA_DIR) -> str:
+    """Writes an index version for (symbol, name, exchange, kind) rows and makes it current; returns its path."""
+    unique = {}
+    for symbol, name, exchange, kind in rows:
+        unique.setdefault(symbol.upper(), (name, exchange, kind))
+    symbols = sorted(unique)
+    records = np.array([(s, *(v.encode("utf-8", "ignore") for v in unique[s])) for s in symbols], dtype=RECORD)
+
+    words, gram_lists = [], []
+    for i, s in enumerate(symbols):
+        name = unique[s][0]
+        words += [(w.encode(), i) for w in dict.fromkeys(_text(name).split()) if len(w) > 1]
+        gram_lists.append(np.union1d(trigrams(s), trigrams(name)))
+    words = np.array(sorted(words), dtype=WORD)
+
+    counts = np.array([len(g) for g in gram_lists], dtype=np.int64)
+    all_grams = np.concatenate(gram_lists) if gram_lists else np.empty(0, dtype=np.int32)
+    owners = np.repeat(np.arange(len(symbols), dtype=np.int32), counts)
+    order = np.argsort(all_grams, kind="stable")
+    grams, starts = np.unique(all_grams[order], return_index=True)
+    offsets = np.append(starts, len(order)).astype(np.int32)
+
+    version = os.path.join(directory, f"v{time.time_ns()}")
+    os.makedirs(version)
+    for name, array in (("symbols", records), ("words", words), ("grams", grams.astype(np.int32)),
+                        ("offsets", offsets), ("postings", owners[order]), ("gram_counts", counts.astype(np.int32))):
+        np.save(os.path.join(version, f"{name}.npy"), array)
+    tmp = os.path.join(directory, f"CURRENT.tmp{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(os.path.basename(version))
+    os.replace(tmp, os.path.join(directory, "CURRENT"))
+    # Older versions may still be mapped by other workers; keep the previous one
+    for old in sorted(d for d in os.listdir(directory) if d.startswith("v"))[:-2]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    log.info("Symbol index built: %d symbols, %d trigrams", len(records), len(grams))
+    return version
+
+
+class SymbolIndex:
+    def __init__(self, path: str):
+        self.path = path
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        self.records = load("symbols")
+        self.words = load("words")
+        self.grams = load("grams")
+        self.offsets = load("offsets")
+        self.postings = load("postings")
+        self.gram_counts = load("gram_counts")
+        self.built = os.path.getmtime(os.path.join(path, "symbols.npy"))
+
+    @classmethod
+    def load(cls, directory: str = DATA_DIR) -> Optional["SymbolIndex"]:
+        """The current version under directory, or None if no index was built yet."""
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                return cls(os.path.join(directory, f.read().strip()))
+        except FileNotFoundError:
+            return None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, symbol: str) -> bool:
+        key = symbol.upper().encode()
+        i = int(np.searchsorted(self.records["symbol"], key))
+        return i < len(self.records) and self.records["symbol"][i] == key
+
+    def _prefix(self, array: np.ndarray, key: bytes) -> Tuple[int, int]:
+        return int(np.searchsorted(array, key)), int(np.searchsorted(array, key + b"\xff"))
+
+    def fuzzy(self, query: str, limit: int = 10, min_score: float = 0.4) -> List[Tuple[int, float]]:
+        """(symbol index, score) by shared trigrams: the share of the query's grams found, ties to shorter entries."""
+        q = trigrams(query)
+        if len(q) == 0 or len(self.grams) == 0:
+            return []
+        pos = np.minimum(np.searchsorted(self.grams, q), len(self.grams) - 1)
+        pos = pos[self.grams[pos] == q]
+        if len(pos) == 0:
+            return []
+        hits = np.concatenate([self.postings[self.offsets[p]:self.offsets[p + 1]] for p in pos])
+        shared = np.bincount(hits, minlength=len(self.records))
+        candidates = np.flatnonzero(shared >= min_score * len(q))
+        if len(candidates) == 0:
+            return []
+        score = shared[candidates] / len(q)
+        order = np.lexsort((self.gram_counts[candidates], -score))[:limit]
+        return [(int(candidates[i]), float(score[i])) for i in order]
+
+    def _result(self, i: int, match: str) -> Dict:
+        r = self.records[i]
+        return {"symbol": r["symbol"].decode(), "name": r["name"].decode("utf-8", "ignore"),
+                "exchange": r["exchange"].decode(), "type": r["kind"].decode(), "match": match}
+
+    @metrics.timed("symbol_search")
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        """Exact symbol, then symbol prefix (shortest first), then name prefix; fuzzy matches if none of those hit."""
+        query = query.strip()
+        symbol = query.upper().replace(".", "-").encode("ascii", "ignore")[:12]
+        found: Dict[int, str] = {}
+        if symbol:
+            lo, hi = self._prefix(self.records["symbol"], symbol)
+            lengths = np.char.str_len(self.records["symbol"][lo:hi])
+            for i in lo + np.argsort(lengths, kind="stable")[:limit]:
+                found[int(i)] = "symbol" if self.records["symbol"][i] == symbol else "prefix"
+        # Name prefix: the last word may be partial, the ones before it must be whole words of the name
+        words = [w for w in _text(query).split() if len(w) > 1]
+        if len(found) < limit and words:
+            lo, hi = self._prefix(self.words["word"], words[-1].encode()[:24])
+            for i in self.words["index"][lo:hi]:
+                i = int(i)
+                if i in found or not set(words[:-1]) <= set(_text(self.records["name"][i].decode("utf-8", "ignore")).split()):
+                    continue
+                found[i] = "name"
+                if len(found) >= limit:
+                    break
+        # Typos: only when nothing matched directly
+        if not found:
+            for i, _ in self.fuzzy(query, limit):
+                found[i] = "fuzzy"
+        return [self._result(i, match) for i, match in list(found.items())[:limit]]
+
+    def unknown(self, tickers: Sequence[str]) -> List[str]:
+        """The plain US-style tickers that are not listed (other symbol forms are not checked)."""
+        return [t for t in tickers if _CHECKABLE.fullmatch(t) and t not in self]
+
+
+_index: Optional[SymbolIndex] = None
+_index_version = 0.0  # mtime of CURRENT when _index was opened
+_index_lock = threading.Lock()
+
+
+def get_index() -> Optional[SymbolIndex]:
+    """The loaded index (re-opened when a newer version was built), or None if none exists yet."""
+    global _index, _index_version
+    current = os.path.join(DATA_DIR, "CURRENT")
+    try:
+        mtime = os.path.getmtime(current)
+    except OSError:
+        return None
+    with _index_lock:
+        if _index is None or mtime != _index_version:
+            _index, _index_version = SymbolIndex.load(DATA_DIR), mtime
+    return _index
+
+
+def refresh(max_age: float = MAX_AGE) -> bool:
+    """Rebuilds the index from the symbol directory if it is missing or older than max_age; True if rebuilt."""
+    index = get_index()
+    if index is not None and time.time() - index.built < max_age:
+        return False
+    try:
+        build(download_listings(), DATA_DIR)
+    except Exception as e:
+        log.warning("Symbol index refresh failed: %s", e)
+        return False
+    return get_index() is not None
+
+
+def unknown_hints(tickers: Iterable[str]) -> List[str]:
+    """'APPL (did you mean AAPL, APP?)' for each listed-looking ticker the index does not know; [] without an index."""
+    index = get_index() if VALIDATE != "off" else None
+    if index is None:
+        return []
+    hints = []
+    for t in index.unknown(list(dict.fromkeys((t or "").strip().upper() for t in tickers))):
+        close = [index._result(i, "fuzzy")["symbol"] for i, _ in index.fuzzy(t, 3)]
+        hints.append(f"{t} (did you mean {', '.join(close)}?)" if close else t)
+    return hints
+
+
+def validate(tickers: List[str]) -> List[str]:
+    """
+    Pydantic validator for request tickers: rejects malformed symbols before anything is
+    fetched, and with SYMBOLS_VALIDATE=reject listed-looking ones the index does not know
+    (with suggestions). Passes every well-formed symbol while no index is built.
+    """
+    malformed = [t for t in tickers if (t or "").strip() and not is_symbol(t.strip().upper())]
+    if malformed:
+        raise ValueError(f"Invalid symbol(s): {', '.join(map(repr, malformed))}")
+    if VALIDATE == "reject":
+        hints = unknown_hints(tickers)
+        if hints:
+            raise ValueError(f"Unknown symbol(s): {'; '.join(hints)}")
+    return tickers
+
+
+def validate_symbol(ticker: str) -> str:
+    return validate([ticker])[0]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    build(download_listings(), DATA_DIR)
+    index = get_index()
+    for q in ("AAPL", "appl", "berkshire", "vangu"):
+        start = time.perf_counter()
+        hits = index.search(q, 5)
+        print(f"{q!r}: {[h['symbol'] for h in hits]} in {(time.perf_counter() - start) * 1e6:.0f} us")
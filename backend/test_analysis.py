@@ -0,0 +1,26 @@
+import analysis
+import cache
+
+
+def _refresh(ticker: str, factor: float):
+    """What a warm-up refresh does to the cache: a new price entry, here with one earlier close revised."""
+    entry = cache.prices.get(ticker)
+    frame = entry["frame"].copy()
+    frame.iloc[len(frame) // 2, frame.columns.get_loc("Close")] *= factor
+    cache.prices.set(ticker, dict(entry, frame=frame, version=analysis._checksum(frame)))
+
+
+def test_refreshed_prices_are_not_served_from_older_results(fake):
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    body = {"tickers": ["SPY", "QQQ"], "start_date": "2023-01-01", "end_date": "2023-12-31"}
+    first = client.post("/api/analyze", json=body).json()
+    assert client.post("/api/analyze", json=body).json() == first
+    assert len(cache.responses) == 1 and len(cache.panels) == 1
+
+    _refresh("SPY", 1.1)
+    second = client.post("/api/analyze", json=body).json()
+    assert second != first
+    assert len(cache.responses) == 2 and len(cache.panels) == 2
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from cache import TTLCache
+from shared_cache import SharedStore
+
+
+def test_maxbytes_evicts_least_recently_used(clock):
+    c = TTLCache("t", ttl=60, maxbytes=10, timer=clock)
+    c.set("a", "x" * 4)
+    c.set("b", "x" * 4)
+    assert c.get("a") == "x" * 4  # b is now the least recently used
+    c.set("c", "x" * 4)
+    assert c.get("b") is None and c.get("a") is not None and c._bytes == 8
+    c.set("a", "x" * 2)  # replacing an entry releases its old size
+    assert c._bytes == 6 and len(c) == 2
+    c.set("big", "x" * 11)  # larger than maxbytes on its own: not kept
+    assert c.get("big") is None and c._bytes == 6
+
+
+@pytest.fixture
+def shared(tmp_path, clock):
+    return SharedStore(str(tmp_path / "shared.sqlite"), timer=clock)
+
+
+def test_shared_entries_serve_other_workers_fresh_then_stale(shared, clock):
+    a, b = (TTLCache("prices", ttl=10, shared=shared, stale_ttl=100, timer=clock) for _ in range(2))
+    a.set("SPY", {"close": 1.0})
+    assert b.get("SPY") == {"close": 1.0} and b.hits == 1
+
+    clock.advance(15)
+    # A restarted worker: nothing fresh, but the stale entry is still served from the shared store
+    restarted = TTLCache("prices", ttl=10, shared=shared, stale_ttl=100, timer=clock)
+    assert restarted.get("SPY") is None and restarted.misses == 1
+    value, age = restarted.get_stale("SPY")
+    assert value == {"close": 1.0} and age == pytest.approx(15)
+
+    clock.advance(100)
+    assert restarted.get_stale("SPY") is None and a.get_stale("SPY") is None
+
+
+def test_older_shared_entries_are_ignored(shared, clock):
+    c = TTLCache("info", ttl=10, shared=shared, timer=clock)
+    shared.set("info:'SPY'", {"name": "raw value"}, 10)
+    assert c.get("SPY") is None and c.get_stale("SPY") is None
+
+
+def test_counters_are_exact_under_threads(shared, clock):
+    writer = TTLCache("t", ttl=60, shared=shared, timer=clock)
+    writer.set("k", 1)
+    c = TTLCache("t", ttl=60, shared=shared, timer=clock, maxsize=1)
+
+    def reader():
+        for i in range(200):
+            c.get("k" if i % 2 else f"missing-{i}")
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (c.hits, c.misses) == (400, 400)
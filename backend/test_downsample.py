@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from downsample import downsample_rows, lttb_indices
+
+
+def _walks(n_rows: int, n_cols: int) -> np.ndarray:
+    rng = np.random.default_rng(n_cols)
+    matrix = np.cumsum(rng.normal(size=(n_rows, n_cols)), axis=0)
+    matrix[: n_rows // 3, ::2] = np.nan  # tickers listed later
+    return matrix
+
+
+@pytest.mark.parametrize("n_cols", [1, 2, 5, 40])
+@pytest.mark.parametrize("max_points", [10, 100, 500])
+def test_union_stays_within_max_points(n_cols, max_points):
+    matrix = _walks(2000, n_cols)
+    rows = lttb_indices(matrix, max_points)
+    assert len(rows) <= max_points
+    assert np.all(np.diff(rows) > 0) and rows[0] == 0 and rows[-1] == 1999
+    if 4 * n_cols <= max_points:
+        # Every column's peak and trough survive
+        assert set(np.nanargmax(matrix, axis=0)) | set(np.nanargmin(matrix, axis=0)) <= set(rows)
+
+
+def test_short_series_are_kept_whole():
+    labels = [f"d{i}" for i in range(50)]
+    matrix = _walks(50, 3)
+    assert downsample_rows(labels, matrix, 50) == (labels, matrix)
+    assert lttb_indices(matrix, None).tolist() == list(range(50))
+    out_labels, out = downsample_rows(labels, matrix, 10)
+    assert len(out_labels) == len(out) <= 10
@@ -0,0 +1,25 @@
+import numpy as np
+
+import factors
+
+
+def test_exact_fit_has_no_standard_errors():
+    # SPY regressed on factors built from SPY itself: R^2 is 1 and the t-stats are undefined, not 1e8
+    returns = np.random.default_rng(0).normal(0, 0.01, (500, 5))
+    tickers = ["SPY", "IWM", "IWD", "IWF", "MTUM"]
+    names = ["market", "size", "value", "momentum"]
+    res = factors.ols(returns, factors.factor_returns(returns, tickers, names))
+    assert np.allclose(res["coef"][0], [0, 1, 0, 0, 0], atol=1e-12)
+    assert res["r2"][0] == 1.0
+    assert np.isnan(res["se"][0]).all()
+
+
+def test_ols_matches_lstsq():
+    rng = np.random.default_rng(1)
+    f = rng.normal(0, 0.01, (300, 3))
+    y = f @ [1.2, 0.3, -0.5] + 0.0002 + rng.normal(0, 0.005, 300)
+    res = factors.ols(y[:, None], f)
+    x = np.column_stack([np.ones(300), f])
+    coef, ssr, *_ = np.linalg.lstsq(x, y, rcond=None)
+    se = np.sqrt(np.diag(np.linalg.inv(x.T @ x)) * ssr[0] / (300 - 4))
+    assert np.allclose(res["coef"][0], coef) and np.allclose(res["se"][0], se)
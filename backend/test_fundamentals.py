@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fundamentals
+
+ITEMS = fundamentals.ITEMS
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    # Everything written here is fresh for an hour: compare() never reaches the upstream
+    store = fundamentals.FundamentalsStore(str(tmp_path / "fundamentals.sqlite"), ttl=3600, workers=1, timer=clock)
+    yield store
+    store._executor.shutdown()
+
+
+def _statement(store, ticker: str, freq: str, periods: dict):
+    """periods: {period_end: {compare() name: value}} written as the upstream's line items."""
+    frame = pd.DataFrame({pd.Timestamp(end): {ITEMS[k]: v for k, v in values.items()} for end, values in periods.items()})
+    return store.write(ticker, freq, fundamentals.normalize(frame))
+
+
+def _quarter(revenue: float) -> dict:
+    return {"revenue": revenue, "net_income": revenue / 10, "shares": 10.0}
+
+
+def test_write_counts_new_and_changed_rows(store):
+    periods = {"2023-12-31": {"revenue": 100.0, "net_income": 10.0}, "2022-12-31": {"revenue": 90.0}}
+    assert _statement(store, "AAA", "A", periods) == 3
+    assert _statement(store, "AAA", "A", periods) == 0
+    periods["2022-12-31"]["revenue"] = 95.0
+    periods["2021-12-31"] = {"revenue": 80.0}
+    assert _statement(store, "AAA", "A", periods) == 2
+    # Periods the upstream no longer reports are kept
+    assert _statement(store, "AAA", "A", {"2024-12-31": {"revenue": 110.0}}) == 1
+    assert store.statement("AAA", "A")[ITEMS["revenue"]].tolist() == [80.0, 95.0, 100.0, 110.0]
+
+
+def test_quarterly_compare_aligns_fiscal_periods(store):
+    # AAA: calendar quarters, revenue 100, 110, ... 170
+    ends = pd.date_range("2022-03-31", periods=8, freq="QE").strftime("%Y-%m-%d")
+    _statement(store, "AAA", "Q", {end: _quarter(100.0 + 10 * k) for k, end in enumerate(ends)})
+    # BBB: quarters ending Jan/Apr/Jul/Oct, the one ending 2023-07-31 missing upstream
+    revenue = {"2022-04-30": 250.0, "2022-07-31": 250.0, "2022-10-31": 250.0, "2023-01-31": 200.0,
+               "2023-04-30": 250.0, "2023-10-31": 250.0, "2024-01-31": 300.0}
+    _statement(store, "BBB", "Q", {end: _quarter(value) for end, value in revenue.items()})
+
+    out = fundamentals.compare(store, ["AAA", "BBB"], {"AAA": 50.0, "BBB": 20.0}, freq="Q")
+    assert out["latest"].tolist() == ["2023-12-31", "2024-01-31"]
+    # The missing quarter keeps its slot: the older ones are not shifted into it
+    assert out["ends"][1, :4].tolist() == ["2024-01-31", "2023-10-31", None, "2023-04-30"]
+    m = out["metrics"]
+    # Latest quarter against the same quarter a year earlier
+    assert m["revenue_growth"][:2] == pytest.approx([170 / 130 - 1, 300 / 200 - 1])
+    # TTM: the last four quarters; not computed across a missing quarter
+    assert m["net_margin"][0] == pytest.approx(0.1)
+    assert m["pe"][0] == pytest.approx(50.0 * 10 / ((170 + 160 + 150 + 140) / 10))
+    assert np.isnan(m["net_margin"][1]) and np.isnan(m["pe"][1])
+    assert np.isnan(out["history"]["net_margin"][1, :3]).all()
+    assert out["history"]["net_margin"][1, 3] == pytest.approx(0.1)
+
+
+def test_yearly_compare_with_different_fiscal_year_ends(store):
+    _statement(store, "AAA", "A", {f"{y}-12-31": _quarter(100.0 * 1.1 ** (y - 2020)) for y in range(2020, 2024)})
+    # 52/53-week fiscal years: the period ends drift by a few days
+    ends = ["2021-01-30", "2022-01-29", "2023-01-28", "2024-02-03"]
+    _statement(store, "BBB", "A", {end: _quarter(200.0 + 50 * k) for k, end in enumerate(ends)})
+
+    out = fundamentals.compare(store, ["AAA", "BBB"], {}, freq="A")
+    assert out["ends"][:, :4].tolist() == [["2023-12-31", "2022-12-31", "2021-12-31", "2020-12-31"], ends[::-1]]
+    m = out["metrics"]
+    assert m["revenue_growth"] == pytest.approx([0.1, 350 / 300 - 1])
+    assert m["revenue_cagr_3y"] == pytest.approx([0.1, (350 / 200) ** (1 / 3) - 1])
+    assert np.isnan(m["market_cap"]).all()
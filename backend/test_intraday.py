@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import intraday
+import symbols
+
+
+def _bars(start: str, end: str) -> np.ndarray:
+    index = pd.date_range(start, end, freq="1min", tz=intraday.MARKET_TZ, inclusive="left")
+    bars = np.zeros(len(index), dtype=intraday.BAR_DTYPE)
+    bars["ts"] = (index.tz_convert("UTC") - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+    bars["close"], bars["volume"] = 1.0, 1.0
+    return bars
+
+
+def test_hourly_buckets_start_at_the_open():
+    bars = np.concatenate([_bars("2024-03-08 09:30", "2024-03-08 16:00"), _bars("2024-03-11 09:30", "2024-03-11 11:00")])
+    out = intraday.resample(bars, 3600)
+    labels = pd.to_datetime(out["ts"], unit="s", utc=True).tz_convert(intraday.MARKET_TZ).strftime("%m-%d %H:%M")
+    # Across the DST change (2024-03-10) too
+    assert list(labels) == ["03-08 09:30", "03-08 10:30", "03-08 11:30", "03-08 12:30", "03-08 13:30",
+                            "03-08 14:30", "03-08 15:30", "03-11 09:30", "03-11 10:30"]
+    assert out["volume"].tolist() == [60] * 6 + [30, 60, 30]
+
+
+@pytest.mark.parametrize("ticker", ["..", ".", "../x", "a/b", "SPY\x00", "X" * 16])
+def test_path_like_tickers_are_rejected(tmp_path, ticker):
+    with pytest.raises(ValueError):
+        intraday.IntradayStore(str(tmp_path)).days(ticker)
+    with pytest.raises(ValueError):
+        symbols.validate([ticker])
+
+
+def test_symbol_shapes():
+    for ticker in ("SPY", "BRK-B", "^GSPC", "VOD.L", "EURUSD=X", "BTC-USD"):
+        assert symbols.is_symbol(ticker), ticker
+
+
+def test_intraday_api_rejects_dot_dot(fake):
+    from fastapi.testclient import TestClient
+    import main
+
+    assert TestClient(main.app).get("/api/intraday/%2E%2E").status_code == 422
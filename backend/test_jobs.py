@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+import jobs
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Two queues sharing one job store, as two worker processes would."""
+    monkeypatch.setattr(jobs, "SYNC_INTERVAL", 0.0)
+    path = str(tmp_path / "jobs.sqlite")
+    queues = [jobs.JobQueue(max_workers=1, store=jobs.JobStore(path)) for _ in range(2)]
+    yield queues
+    for q in queues:
+        q.shutdown()
+
+
+def test_result_visible_from_another_worker(workers):
+    a, b = workers
+    job = a.submit("square", lambda params, job: {"value": params["x"] ** 2}, {"x": 7})
+    assert _wait_for(lambda: b.get(job.id).status == jobs.DONE)
+    seen = b.get(job.id)
+    assert seen.result == {"value": 49} and seen.progress == 1.0
+    assert seen.to_dict()["job_id"] == job.id
+    assert b.get("missing") is None
+
+
+def test_cancel_from_another_worker(workers):
+    a, b = workers
+
+    def spin(params, job):
+        while True:
+            job.report(0.5)
+            time.sleep(0.01)
+
+    job = a.submit("spin", spin, {})
+    assert _wait_for(lambda: b.get(job.id).progress == 0.5)
+    assert b.get(job.id).status == jobs.RUNNING
+    b.cancel(job.id)
+    assert _wait_for(lambda: job.status == jobs.CANCELLED)
+    assert b.get(job.id).status == jobs.CANCELLED
+
+
+def test_failed_and_expired_jobs(workers):
+    a, b = workers
+    job = a.submit("boom", lambda params, job: 1 / 0, {})
+    assert _wait_for(lambda: b.get(job.id).status == jobs.FAILED)
+    assert "division by zero" in b.get(job.id).error
+    b.ttl = 0
+    time.sleep(0.01)
+    assert b.get(job.id) is None
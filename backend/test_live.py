@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import intraday
+import live
+
+
+@pytest.fixture
+def client(fake):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+def test_subscribe_rejects_malformed_symbols(client):
+    with client.websocket_connect("/ws/quotes") as ws:
+        ws.send_json({"action": "subscribe", "tickers": ["../x", "a/b", "spy", 3]})
+        messages = [ws.receive_json() for _ in range(2)]
+        assert messages[0] == {"type": "error", "message": "Unknown symbol(s): ../X, A/B"}
+        assert messages[1] == {"type": "subscribed", "tickers": ["SPY"]}
+    assert set(live.hub.pollers) <= {"SPY"}
+
+
+def test_binary_frame_closes_the_socket(client):
+    with client.websocket_connect("/ws/quotes") as ws:
+        ws.send_bytes(b"\x00\x01")
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+        assert e.value.code == 1003
+
+
+def test_poll_without_daily_history_seeds_again(monkeypatch, tmp_path):
+    monkeypatch.setattr(intraday.store, "root", str(tmp_path))
+    monkeypatch.setattr(intraday.store, "refresh", lambda *args, **kwargs: 0)
+    index = pd.bdate_range("2024-01-01", periods=40)
+    daily = pd.DataFrame({"Open": 100.0, "High": 101.0, "Low": 99.0, "Close": np.linspace(100, 110, 40),
+                          "Volume": 1e6}, index=index)
+    daily.iloc[-1, daily.columns.get_loc("Volume")] = np.nan
+
+    poller = live.Poller(None, "SPY", 1)
+    frames = [daily.iloc[:0], daily]
+    monkeypatch.setattr(poller, "_daily", lambda: frames.pop(0))
+    assert poller.poll() is None and poller.indicators is None
+    # The fallback quote (last daily bar) has no volume: reported as 0, not an error
+    quote = poller.poll()
+    assert quote["day"]["volume"] == 0 and quote["indicators"]["rsi"] == 100.0
+    assert poller.indicators is not None
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+import analysis
+import cache
+import portfolios
+
+DEFINITION = {"holdings": [{"ticker": "SPY", "shares": 10}, {"ticker": "QQQ", "shares": 5}],
+              "start_date": "2023-01-01", "end_date": "2024-01-01", "align": "inner"}
+
+
+@pytest.fixture
+def store(fake, tmp_path, clock):
+    analysis.load_price_frames(["SPY", "QQQ"], "2023-01-01", "2024-01-01")
+    return portfolios.PortfolioStore(str(tmp_path / "portfolios.sqlite"), timer=clock)
+
+
+def _revise(ticker: str, row: int):
+    """A refresh that revised one earlier close (a split or dividend adjustment), the last one unchanged."""
+    entry = cache.prices.get(ticker)
+    frame = entry["frame"].copy()
+    frame.iloc[row, frame.columns.get_loc("Close")] *= 0.5
+    analysis.store_price_frames(frame.rename(columns=lambda c: (ticker, c)), [ticker], entry["start"], entry["end"])
+
+
+def test_outdated_after_definition_or_data_changes(store, clock):
+    portfolio = store.save("Core", DEFINITION)
+    assert store.outdated(portfolio)
+    body = store.compute(portfolio, lambda p: {"total": 1})
+    assert json.loads(store.analytics(portfolio["id"]))["total"] == 1 and store.analytics(portfolio["id"]) == body
+    assert not store.outdated(portfolio)
+
+    _revise("SPY", 10)
+    assert store.outdated(portfolio)
+    store.compute(portfolio, lambda p: {"total": 2})
+    assert not store.outdated(portfolio)
+    # Nothing cached for a ticker (evicted) is not a change
+    cache.prices.clear()
+    assert not store.outdated(portfolio)
+
+    clock.advance(1)
+    portfolio = store.save("Core", dict(DEFINITION, align="outer_ffill"), portfolio["id"])
+    assert store.outdated(portfolio) and store.analytics(portfolio["id"]) is None
+
+
+def test_slow_compute_does_not_overwrite_newer_results(store, clock):
+    portfolio = store.save("Core", DEFINITION)
+
+    def saved_meanwhile(p):
+        clock.advance(1)
+        store.save("Core", dict(DEFINITION, start_date="2023-06-01"), p["id"])
+        return {"total": 1}
+
+    store.compute(portfolio, saved_meanwhile)
+    # Stored rows are guarded by `updated`: the result of the old definition is dropped
+    assert store.analytics(portfolio["id"]) is None
+    fresh = store.get(portfolio["id"])
+    store.compute(fresh, lambda p: {"total": 2})
+    assert json.loads(store.analytics(fresh["id"]))["total"] == 2
+
+    store.compute(fresh, lambda p: store.delete(p["id"]) and {"total": 3})
+    assert store.analytics(fresh["id"]) is None
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+import cache
+import provider
+import resilience
+from fake_provider import FakeProvider, UpstreamError
+
+
+def test_breaker_transitions(clock):
+    closed = []
+    breaker = resilience.CircuitBreaker(failures=3, cooldown=10, timer=clock)
+    breaker.on_close(lambda: closed.append(True))
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.state == "closed"
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(10)
+
+    clock.advance(10)
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()  # one probe at a time
+    breaker.record(False)  # failed probe: open again
+    assert breaker.state == "open"
+
+    clock.advance(10)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and closed == [True]
+
+
+def test_guarded_provider_fails_fast(clock):
+    upstream = FakeProvider(fail_rate=1.0)
+    guarded = resilience.GuardedProvider(upstream, resilience.CircuitBreaker(failures=2, cooldown=5, timer=clock),
+                                         resilience.TokenBucket(100, 100))
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            guarded.info("SPY")
+    with pytest.raises(resilience.UpstreamUnavailable) as e:
+        guarded.info("SPY")
+    assert upstream.calls == 2 and e.value.retry_after == pytest.approx(5)
+
+
+def test_rate_limited_upstream_trips_breaker(clock):
+    breaker = resilience.CircuitBreaker(failures=5, cooldown=5, timer=clock)
+    guarded = resilience.GuardedProvider(FakeProvider(rate_limited=True), breaker, resilience.TokenBucket(100, 100))
+    with pytest.raises(resilience.UpstreamUnavailable) as e:
+        guarded.info("SPY")
+    assert breaker.state == "open" and e.value.retry_after == pytest.approx(10)
+
+
+def test_token_bucket(clock):
+    bucket = resilience.TokenBucket(rate=2, burst=3, timer=clock)
+    assert all(bucket.acquire() for _ in range(3))
+    assert not bucket.acquire()
+    clock.advance(0.5)
+    assert bucket.acquire() and not bucket.acquire()
+    clock.advance(10)  # banks at most `burst` tokens
+    assert sum(bucket.acquire() for _ in range(5)) == 3
+
+
+def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_stale_while_revalidate(fake, clock):
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    assert client.get("/api/technical/SPY").status_code == 200
+    assert "x-data-stale" not in client.get("/api/technical/SPY").headers
+
+    # Expire the cached prices (kept as stale data) and take the upstream down
+    cache.prices.set("SPY", cache.prices.get("SPY"), ttl=0)
+    cache.technical.clear()
+    fake.fail_rate = 1.0
+    r = client.get("/api/technical/SPY")
+    assert r.status_code == 200
+    assert r.headers["x-data-stale"] == "1" and int(r.headers["age"]) >= 0
+
+    # More failures open the breaker; with nothing stale cached the answer is 503 + Retry-After
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            provider.get_provider().info("SPY")
+    assert provider.breaker.state == "open"
+    r = client.get("/api/technical/QQQ")
+    assert r.status_code == 503 and int(r.headers["retry-after"]) == 10
+
+    # Recovery: the half-open probe closes the breaker and the failed refresh is re-run
+    fake.fail_rate = 0.0
+    clock.advance(10)
+    provider.get_provider().info("SPY")
+    assert provider.breaker.state == "closed"
+    assert _wait_for(lambda: cache.prices.get("SPY") is not None)
+    cache.technical.clear()
+    assert "x-data-stale" not in client.get("/api/technical/SPY").headers
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+import analysis
+import risk
+
+
+def test_horizon_longer_than_history():
+    # 5 rows of returns: the 10- and 21-day historical windows do not exist and come back NaN
+    returns = np.random.default_rng(0).normal(0, 0.01, (5, 2))
+    result = risk.tail_risk(returns, horizons=(1, 10, 21))
+    for method, (var, cvar) in result.items():
+        assert var.shape == cvar.shape == (2, 3, 2), method
+        assert np.isfinite(var[:, 0]).all(), method
+    assert np.isnan(result["historical"][0][:, 1:]).all()
+    for method, (var, cvar) in risk.tail_risk(np.empty((0, 2))).items():
+        assert np.isnan(var).all() and np.isnan(cvar).all(), method
+
+
+def test_metrics_on_short_range():
+    # Two weeks of prices used to raise IndexError in /api/analyze
+    index = pd.bdate_range("2023-01-03", periods=12)
+    prices = pd.DataFrame({"A": np.linspace(100, 105, 12), "B": np.linspace(50, 48, 12)}, index=index)
+    result = analysis.calculate_metrics(prices, prices)
+    assert set(result["risk"]) == {"A", "B"}
+
+
+def test_portfolio_history_is_per_portfolio():
+    # The second asset lists after 95 rows; a portfolio without it keeps all 100 rows
+    returns = np.random.default_rng(1).normal(0, 0.01, (100, 2))
+    returns[:95, 1] = np.nan
+    port = risk.portfolio_returns(returns, np.array([[1.0, 0.0], [0.5, 0.5]]))
+    assert (~np.isnan(port)).sum(axis=0).tolist() == [100, 5]
+    np.testing.assert_allclose(port[:, 0], returns[:, 0])
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import sampling
+
+MEAN = np.array([0.05, 0.08, 0.12, 0.03, 0.10])
+COV = np.diag([0.02, 0.04, 0.09, 0.01, 0.06])
+
+
+@pytest.mark.parametrize("strategy", sampling.STRATEGIES)
+@pytest.mark.parametrize("n", [1, 3, 5, 7, 100, 129])
+def test_every_strategy_draws_long_only_weights(strategy, n):
+    w = sampling.sample(strategy, n, len(MEAN), MEAN, COV, seed=1)
+    assert w.shape == (n, len(MEAN))
+    assert np.isfinite(w).all() and (w >= 0).all()
+    assert w.sum(axis=1) == pytest.approx(np.ones(n))
+
+
+def test_draws_are_reproducible_with_a_seed():
+    for strategy in sampling.STRATEGIES:
+        a, b = (sampling.sample(strategy, 20, 3, MEAN[:3], COV[:3, :3], seed=7) for _ in range(2))
+        assert np.array_equal(a, b), strategy
+
+
+def test_frontier_includes_the_corners():
+    w = sampling.sample("frontier", 40, len(MEAN), MEAN, COV, seed=1)
+    assert (w[: len(MEAN)] == np.eye(len(MEAN))).all()
+
+
+def test_frontier_needs_mean_and_covariance():
+    with pytest.raises(ValueError, match="mean returns and covariance"):
+        sampling.sample("frontier", 10, 3)
+    with pytest.raises(ValueError, match="mean returns and covariance"):
+        sampling.sample("frontier", 10, 3, mean=MEAN[:3])
+    with pytest.raises(ValueError, match="Unknown sampling strategy"):
+        sampling.sample("grid", 10, 3)
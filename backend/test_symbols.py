@@ -0,0 +1,48 @@
+import pytest
+
+import symbols
+
+LISTINGS = [("AAPL", "Apple Inc.", "NASDAQ", "stock"), ("APP", "AppLovin Corporation", "NASDAQ", "stock"),
+            ("SPY", "SPDR S&P 500 ETF Trust", "NYSE Arca", "etf")]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(symbols, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(symbols, "_index", None)
+    symbols.build(LISTINGS, str(tmp_path))
+    return symbols.get_index()
+
+
+@pytest.fixture
+def client(fake, index):
+    from fastapi.testclient import TestClient
+    import main
+
+    return TestClient(main.app)
+
+
+def test_unlisted_symbols_pass_with_suggestions(client, monkeypatch):
+    # New listings, OTC and delisted tickers are not in the index
+    assert symbols.validate(["AAPL", "NEWC", "^GSPC"]) == ["AAPL", "NEWC", "^GSPC"]
+    assert symbols.unknown_hints(["aapl", "appl", "VOD.L"]) == ["APPL (did you mean AAPL, APP?)"]
+    assert client.get("/api/stock_details/NEWC").status_code == 200
+
+    import analysis
+    monkeypatch.setattr(analysis, "get_stock_details", lambda ticker: None)
+    r = client.get("/api/stock_details/APPL")
+    assert r.status_code == 404 and "Unknown symbol(s): APPL (did you mean AAPL" in r.json()["detail"]
+    assert client.get("/api/stock_details/SPY").json()["detail"] == "Ticker not found or data unavailable."
+
+
+def test_reject_mode(client, monkeypatch):
+    monkeypatch.setattr(symbols, "VALIDATE", "reject")
+    with pytest.raises(ValueError, match=r"Unknown symbol\(s\): APPL \(did you mean AAPL"):
+        symbols.validate(["SPY", "APPL"])
+    assert client.get("/api/stock_details/NEWC").status_code == 422
+    assert client.get("/api/stock_details/SPY").status_code == 200
+
+
+def test_off_mode(index, monkeypatch):
+    monkeypatch.setattr(symbols, "VALIDATE", "off")
+    assert symbols.unknown_hints(["APPL"]) == []
@@ -0,0 +1,87 @@
+import time
+from datetime import datetime
+
+import cache
+import warmup
+
+
+def _at(text: str) -> datetime:
+    return datetime.fromisoformat(text).replace(tzinfo=warmup.MARKET_TZ)
+
+
+def _scheduler(clock, **kwargs) -> warmup.WarmupScheduler:
+    kwargs.setdefault("seed", ["SPY"])
+    return warmup.WarmupScheduler(warmup.TickerTracker(), clock, refresh_info=False, **kwargs)
+
+
+def test_runs_after_the_close_on_weekdays_only(fake):
+    clock = warmup.ManualClock(_at("2024-03-08T12:00"))  # a Friday
+    scheduler = _scheduler(clock)
+    assert scheduler.next_run == _at("2024-03-08T16:30")
+    assert not scheduler.tick()
+
+    clock.advance((_at("2024-03-08T16:31") - clock.now()).total_seconds())
+    assert scheduler.tick()
+    assert scheduler.last_refreshed == ["SPY"] and cache.prices.get("SPY") is not None
+    assert not scheduler.tick()
+    # Saturday and Sunday are skipped
+    assert scheduler.next_run == _at("2024-03-11T16:30")
+    for day in ("2024-03-09T17:00", "2024-03-10T17:00", "2024-03-11T16:29"):
+        clock.advance((_at(day) - clock.now()).total_seconds())
+        assert not scheduler.tick(), day
+    clock.advance(120)
+    assert scheduler.tick()
+
+
+def test_hot_set_decays():
+    tracker = warmup.TickerTracker()
+    tracker.record(["aapl", "MSFT", " aapl ", "AAPL"] + ["TSLA"] * 2)
+    assert tracker.hot_set(2) == ["AAPL", "TSLA"]
+    tracker.decay()  # 1.5, 0.5, 1 left
+    assert tracker.hot_set(5) == ["AAPL", "TSLA", "MSFT"]
+    tracker.decay()  # MSFT drops below 0.5
+    assert tracker.hot_set(5) == ["AAPL", "TSLA"]
+    tracker.record(["MSFT"] * 3)
+    assert tracker.hot_set(1) == ["MSFT"]
+
+
+def test_pinned_and_on_refresh_hooks(fake):
+    clock = warmup.ManualClock(_at("2024-03-08T12:00"))
+    scheduler = _scheduler(clock, hot_size=3)
+    scheduler.tracker.record(["IWM", "DIA", "DIA"])
+
+    def broken():
+        raise RuntimeError("store unavailable")
+
+    scheduler.pinned += [broken, lambda: ["QQQ", "SPY"]]
+    seen = []
+    scheduler.on_refresh += [lambda tickers: 1 / 0, seen.append]
+    # Seed and pinned tickers always stay; traffic fills up to hot_size
+    assert scheduler.hot_set() == ["SPY", "QQQ", "DIA"]
+    refreshed = scheduler.run_once()
+    assert refreshed == ["SPY", "QQQ", "DIA"] and seen == [refreshed]
+    assert scheduler.tracker._counts == {"DIA": 1.0, "IWM": 0.5}  # halved after the run
+
+
+def test_loop_survives_a_failing_refresh(fake):
+    clock = warmup.ManualClock(_at("2024-03-08T16:31"))
+    scheduler = _scheduler(clock)
+    scheduler._next_run = clock.now()
+    runs = []
+
+    def run_once():
+        runs.append(clock.now())
+        if len(runs) == 1:
+            raise RuntimeError("refresh failed")
+        return []
+
+    scheduler.run_once = run_once
+    scheduler.start()
+    deadline = time.monotonic() + 5
+    while len(runs) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.stop()
+    scheduler._thread.join(5)
+    # The failed run is not retried at once: the next one is Monday's
+    assert len(runs) >= 2 and runs[1] >= _at("2024-03-11T16:30")
+    assert not scheduler._thread.is_alive()
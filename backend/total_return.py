@@ -0,0 +1,142 @@
+"""
+Total-return series rebuilt locally from close prices and corporate actions.
+
+Instead of trusting upstream 'Adj Close' (which is back-adjusted, so every new
+dividend rewrites the whole history, and is occasionally just wrong), the TR
+level is tracked as a position: `shares` of the stock plus uninvested `cash`,
+
+    level_t = shares_t * close_t + cash_t
+
+starting from one share at the first close. Dividends and splits only change
+the share count (or the cash), so all tickers are handled at once with a
+cumulative product over a T x N matrix, and the returned State continues a
+series from its last row without touching earlier ones.
+
+Reinvestment conventions (CONVENTIONS):
+    close:    dividends are reinvested at the ex-date close (CRSP style)
+    adjusted: reinvested at the previous close, i.e. the same daily returns as
+              the upstream 'Adj Close' factor (1 - D / close_{t-1})
+    cash:     dividends are kept as cash (no reinvestment, no interest)
+
+`withholding` is the tax share withheld from every dividend. yfinance closes
+and dividends are already split-adjusted; pass split_adjusted=False for raw
+closes so split ratios are applied to the share count.
+"""
+import os
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from panel import ffill
+
+CONVENTIONS = ("close", "adjusted", "cash")
+
+# local: TR from Close + Dividends (downloads carry actions, 'Adj Close' is not stored)
+# upstream: TR is the upstream 'Adj Close' as before
+SOURCE = os.getenv("TOTAL_RETURN", "local")
+CONVENTION = os.getenv("TOTAL_RETURN_CONVENTION", "close")
+WITHHOLDING = float(os.getenv("DIVIDEND_WITHHOLDING", "0"))
+
+EVENT_COLUMNS = ("Dividends", "Stock Splits")
+
+
+class State(NamedTuple):
+    """Per-column position after the last row: shares held, cash and the last valid close."""
+    shares: np.ndarray
+    cash: np.ndarray
+    close: np.ndarray
+
+
+@metrics.timed("total_return")
+def build(close: np.ndarray, dividends: np.ndarray, splits: Optional[np.ndarray] = None,
+          convention: str = CONVENTION, withholding: float = WITHHOLDING, split_adjusted: bool = True,
+          state: Optional[State] = None):
+    """
+    TR levels (T x N, NaN where close is NaN) from closes, dividends per share on their
+    ex-dates (0 elsewhere) and split ratios (0 or 1 on days without a split).
+    Returns (levels, State); pass the state back with the next rows to extend the series.
+    """
+    if convention not in CONVENTIONS:
+        raise ValueError(f"Unknown reinvestment convention: {convention}")
+    close = np.asarray(close, dtype=float)
+    n = close.shape[1]
+    if state is None:
+        state = State(np.ones(n), np.zeros(n), np.full(n, np.nan))
+
+    filled = ffill(np.vstack([state.close, close]))
+    price, prev = filled[1:], filled[:-1]
+    net = np.nan_to_num(np.asarray(dividends, dtype=float)) * (1 - withholding)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if convention == "close":
+            growth = 1 + net / price
+        elif convention == "adjusted":
+            growth = prev / (prev - net)
+        else:
+            growth = np.ones_like(price)
+    growth[~np.isfinite(growth) | (net == 0)] = 1.0
+    if not split_adjusted and splits is not None:
+        ratio = np.nan_to_num(np.asarray(splits, dtype=float))
+        growth *= np.where(ratio > 0, ratio, 1.0)
+
+    shares = state.shares * np.cumprod(growth, axis=0)
+    cash = np.broadcast_to(state.cash, price.shape)
+    if convention == "cash":
+        cash = state.cash + np.cumsum(shares * net, axis=0)
+    levels = shares * close + cash
+
+    if len(close):
+        state = State(shares[-1], np.array(cash[-1]), filled[-1])
+    return levels, state
+
+
+def has_events(frame: pd.DataFrame) -> bool:
+    """True if a price frame was downloaded with actions (so TR can be built locally)."""
+    return "Close" in frame.columns and "Dividends" in frame.columns
+
+
+def compact(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Storage form of a downloaded frame: with local TR, 'Adj Close' is dropped and the
+    (mostly zero) event columns are kept sparse. Other frames are returned unchanged.
+    """
+    if SOURCE != "local" or not has_events(frame):
+        return frame
+    frame = frame.drop(columns=["Adj Close"], errors="ignore")
+    return frame.astype({c: pd.SparseDtype(float, 0.0) for c in EVENT_COLUMNS if c in frame.columns})
+
+
+def events(frame: pd.DataFrame) -> pd.DataFrame:
+    """Rows of a frame with a dividend or split (dense columns)."""
+    cols = [c for c in EVENT_COLUMNS if c in frame.columns]
+    if not cols:
+        return pd.DataFrame(columns=list(EVENT_COLUMNS), index=frame.index[:0])
+    data = frame[cols].astype(float).fillna(0.0)
+    return data[(data != 0).any(axis=1)]
+
+
+def _column(frames: Dict[str, pd.DataFrame], name: str) -> pd.DataFrame:
+    return pd.DataFrame({t: f[name].astype(float) if name in f.columns else 0.0 for t, f in frames.items()})
+
+
+def from_frames(frames: Dict[str, pd.DataFrame], convention: str = CONVENTION,
+                withholding: float = WITHHOLDING) -> pd.DataFrame:
+    """
+    TR frame (one column per ticker, outer-joined dates). Frames with events get local TR;
+    the rest (or all, with TOTAL_RETURN=upstream) use 'Adj Close', falling back to 'Close'.
+    """
+    local = {t: f for t, f in frames.items() if SOURCE == "local" and has_events(f)}
+    series = {}
+    if local:
+        close = _column(local, "Close")
+        dividends = _column(local, "Dividends").reindex(close.index).fillna(0.0)
+        levels, _ = build(close.to_numpy(), dividends.to_numpy(), convention=convention, withholding=withholding)
+        series.update({t: pd.Series(levels[:, i], index=close.index) for i, t in enumerate(close.columns)})
+    for t, f in frames.items():
+        if t not in local:
+            col = "Adj Close" if "Adj Close" in f.columns else "Close"
+            if col in f.columns:
+                series[t] = f[col]
+    return pd.DataFrame({t: series[t] for t in frames if t in series})
@@ -0,0 +1,219 @@
+"""
+Pre-warming of popular tickers into the price / metadata caches.
+
+Request handlers record which tickers they serve; once per trading day, after
+the US market close, the scheduler refreshes the hot set with bulk batched
+downloads so the first request of the next day hits warm data.
+Time comes from a Clock so the schedule can be driven offline (ManualClock).
+"""
+import logging
+import os
+import threading
+from datetime import datetime, time as dtime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+import analysis
+import cache
+import provider
+import total_return
+
+log = logging.getLogger(__name__)
+
+MARKET_TZ = ZoneInfo("America/New_York")
+
+# Always kept warm, regardless of traffic
+DEFAULT_TICKERS = ["SPY", "QQQ", "SCHD", "TLT", "VOO", "VTI", "JEPI", "DIA", "IWM", "GLD"]
+
+
+class Clock:
+    """Wall clock. Subclass to control time in tests."""
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def sleep(self, seconds: float, stop: threading.Event) -> bool:
+        """Waits up to `seconds`; returns True if `stop` was set meanwhile."""
+        return stop.wait(seconds)
+
+
+class ManualClock(Clock):
+    """Clock that only moves when told to. sleep() advances it instantly."""
+
+    def __init__(self, start: datetime):
+        self._now = start
+
+    def now(self) -> datetime:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+
+    def sleep(self, seconds: float, stop: threading.Event) -> bool:
+        self.advance(seconds)
+        return stop.is_set()
+
+
+class TickerTracker:
+    """
+    Counts ticker requests. Counts are halved after every refresh
+    so the hot set follows recent traffic rather than all-time totals.
+    """
+
+    def __init__(self, max_tracked: int = 5000):
+        self.max_tracked = max_tracked
+        self._counts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, tickers: Iterable[str]):
+        with self._lock:
+            for t in tickers:
+                t = t.strip().upper()
+                if t:
+                    self._counts[t] = self._counts.get(t, 0) + 1
+            if len(self._counts) > self.max_tracked:
+                keep = sorted(self._counts.items(), key=lambda kv: kv[1], reverse=True)[:self.max_tracked]
+                self._counts = dict(keep)
+
+    def hot_set(self, size: int) -> List[str]:
+        with self._lock:
+            ranked = sorted(self._counts.items(), key=lambda kv: kv[1], reverse=True)
+        return [t for t, _ in ranked[:size]]
+
+    def decay(self, factor: float = 0.5):
+        with self._lock:
+            self._counts = {t: c * factor for t, c in self._counts.items() if c * factor >= 0.5}
+
+
+class WarmupScheduler:
+    def __init__(self, tracker: TickerTracker, clock: Optional[Clock] = None,
+                 refresh_at: dtime = dtime(16, 30), hot_size: int = 300, batch_size: int = 50,
+                 seed: Optional[List[str]] = None, refresh_info: bool = True):
+        self.tracker = tracker
+        self.clock = clock or Clock()
+        self.refresh_at = refresh_at
+        self.hot_size = hot_size
+        self.batch_size = batch_size
+        self.seed = list(DEFAULT_TICKERS if seed is None else seed)
+        self.refresh_info = refresh_info
+        self.last_run: Optional[datetime] = None
+        self.last_refreshed: List[str] = []
+        # Called with the refreshed tickers after every run (e.g. to recompute derived data)
+        self.on_refresh: List[Callable[[List[str]], None]] = []
+        # Return tickers refreshed on every run regardless of traffic (e.g. saved portfolios' holdings)
+        self.pinned: List[Callable[[], Iterable[str]]] = []
+        self._next_run = self.next_run_after(self.clock.now())
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def next_run_after(self, moment: datetime) -> datetime:
+        """Next weekday at `refresh_at` (market time) strictly after `moment`."""
+        local = moment.astimezone(MARKET_TZ)
+        candidate = datetime.combine(local.date(), self.refresh_at, tzinfo=MARKET_TZ)
+        while candidate <= local or candidate.weekday() >= 5:
+            candidate = datetime.combine(candidate.date() + timedelta(days=1), self.refresh_at, tzinfo=MARKET_TZ)
+        return candidate.astimezone(timezone.utc)
+
+    @property
+    def next_run(self) -> datetime:
+        return self._next_run
+
+    def hot_set(self) -> List[str]:
+        tickers = list(self.seed)
+        for source in self.pinned:
+            try:
+                tickers.extend(t for t in source() if t not in tickers)
+            except Exception as e:
+                log.warning("Warm-up pinned tickers unavailable: %s", e)
+        always = len(tickers)
+        for t in self.tracker.hot_set(self.hot_size):
+            if t not in tickers:
+                tickers.append(t)
+        return tickers[:max(self.hot_size, always)]
+
+    def tick(self) -> bool:
+        """Runs a refresh if one is due. Returns True if it ran."""
+        now = self.clock.now()
+        if now < self._next_run:
+            return False
+        self.run_once()
+        self._next_run = self.next_run_after(now)
+        return True
+
+    def run_once(self) -> List[str]:
+        """Refreshes prices, dividends, indicators (and info) for the hot set."""
+        tickers = self.hot_set()
+        now = self.clock.now()
+        # Keep warmed entries until shortly after the next scheduled refresh
+        ttl = (self.next_run_after(now) - now).total_seconds() + 3600
+        upstream = provider.get_provider()
+        refreshed = []
+
+        for i in range(0, len(tickers), self.batch_size):
+            batch = tickers[i:i + self.batch_size]
+            try:
+                data = upstream.download(batch, period="max", actions=True)
+            except Exception as e:
+                log.warning("Warm-up download failed for batch %s...: %s", batch[:3], e)
+                continue
+            frames = analysis.store_price_frames(data, batch, None, None, ttl=ttl)
+            for t, frame in frames.items():
+                if "Dividends" in frame.columns:
+                    divs = total_return.events(frame)["Dividends"]
+                    cache.dividends.set(t, divs[divs > 0].rename("Dividends"), ttl)
+                cache.technical.delete((t, "2y"))
+                analysis.get_technical_analysis(t)
+                refreshed.append(t)
+
+        if self.refresh_info:
+            for t in refreshed:
+                try:
+                    cache.info.set(t, upstream.info(t), ttl)
+                except Exception as e:
+                    log.warning("Warm-up info refresh failed for %s: %s", t, e)
+
+        self.tracker.decay()
+        self.last_run = now
+        self.last_refreshed = refreshed
+        log.info("Warm-up refreshed %d/%d tickers", len(refreshed), len(tickers),
+                 extra={"duration_ms": round((self.clock.now() - now).total_seconds() * 1000, 1)})
+        for callback in self.on_refresh:
+            try:
+                callback(refreshed)
+            except Exception as e:
+                log.exception("Warm-up on_refresh callback failed: %s", e)
+        return refreshed
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                # Skip to the next scheduled run instead of retrying (or dying) right away
+                log.exception("Warm-up refresh failed: %s", e)
+                self._next_run = self.next_run_after(self.clock.now())
+            wait = (self._next_run - self.clock.now()).total_seconds()
+            if self.clock.sleep(min(max(wait, 1), 300), self._stop):
+                break
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="warmup", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+tracker = TickerTracker()
+scheduler = WarmupScheduler(
+    tracker,
+    hot_size=int(os.getenv("WARMUP_HOT_SIZE", "300")),
+    batch_size=int(os.getenv("WARMUP_BATCH_SIZE", "50")),
+)
+
+
+def record(tickers: Iterable[str]):
+    """Called by request handlers to feed the hot set."""
+    tracker.record(tickers)
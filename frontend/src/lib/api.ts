@@ -9,8 +9,8 @@ const api = axios.create({
     },
 });
 
-export const analyzeAdvanced = async (tickers: string[], startDate: string, endDate: string) => {
-    const response = await api.post('/advanced', { tickers, start_date: startDate, end_date: endDate });
+export const analyzeAdvanced = async (tickers: string[], startDate: string, endDate: string, maxPoints?: number) => {
+    const response = await api.post('/advanced', { tickers, start_date: startDate, end_date: endDate, max_points: maxPoints });
     return response.data;
 };
 
@@ -44,12 +44,14 @@ export const simulateMultiAsset = async (tickers: string[], startDate: string =
 export const analyzePortfolio = async (
     tickers: string[],
     startDate: string,
-    endDate: string
+    endDate: string,
+    maxPoints?: number
 ) => {
     const response = await api.post('/analyze', {
         tickers,
         start_date: startDate,
         end_date: endDate,
+        max_points: maxPoints,
     });
     return response.data;
 };
@@ -78,8 +80,8 @@ export const getStockDetails = async (ticker: string) => {
     return response.data;
 };
 
-export const getPriceHistory = async (ticker: string, period: string, interval: string) => {
-    const response = await api.get(`/history/${ticker}?period=${period}&interval=${interval}`);
+export const getPriceHistory = async (ticker: string, period: string, interval: string, maxPoints?: number) => {
+    const response = await api.get(`/history/${ticker}`, { params: { period, interval, max_points: maxPoints } });
     return response.data;
 };
 
@@ -88,4 +90,35 @@ export const getTechnicalAnalysis = async (ticker: string) => {
     return response.data;
 };
 
+// Background jobs: submit a heavy run, then poll status and fetch the result.
+export type JobKind = 'simulate_multi' | 'analyze' | 'simulate';
+
+export interface JobStatus {
+    job_id: string;
+    kind: JobKind;
+    status: 'pending' | 'running' | 'done' | 'failed' | 'cancelled';
+    progress: number;
+    error: string | null;
+}
+
+export const submitJob = async (kind: JobKind, params: Record<string, unknown>): Promise<JobStatus> => {
+    const response = await api.post('/jobs', { kind, params });
+    return response.data;
+};
+
+export const getJobStatus = async (jobId: string): Promise<JobStatus> => {
+    const response = await api.get(`/jobs/${jobId}`);
+    return response.data;
+};
+
+export const getJobResult = async (jobId: string) => {
+    const response = await api.get(`/jobs/${jobId}/result`);
+    return response.data;
+};
+
+export const cancelJob = async (jobId: string): Promise<JobStatus> => {
+    const response = await api.delete(`/jobs/${jobId}`);
+    return response.data;
+};
+
 export default api;